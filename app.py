@@ -2,42 +2,22 @@
 
 import os
 import logging
-import pandas as pd
 import streamlit as st
-import tempfile 
 
-from vertexai.generative_models import (
-    GenerationConfig,
-    GenerativeModel,
-    Part,
-    Tool,
-)
-from typing import Any
-# Import all FunctionDeclarations
-from functions import (
-    get_daily_detail_data,
-    generate_brand_health_overview,
-    generate_top_post_details,
-    generate_channel_details,
-    generate_brand_sentiment_details,
-    generate_label_details,
-    # Add other FunctionDeclarations here
-)
-from functions import format_social_listening_data
-# Define Tools and Handlers based on interaction_found
-from functions.functiondeclarations import (
-    brand_health_overview,
-    get_top_post_details,
-    get_channel_detail,
-    get_brand_sentiment_detail,
-    get_label_details,
-    get_daily_detail,
-    # Import other FunctionDeclarations as needed
-)
+from functions.apiclient import InsightAPIClient
+from functions.chat import PROJECT_ID, init_vertexai, preload_chat_sdk
+from functions.comparison import comparison_instruction
+from functions.dataset import STORE_DIR, list_stored_datasets, load_dataset, open_stored_dataset
+from functions.digest import digest_instruction
+from functions.limiter import LLM_LIMITER
+from functions.pagination import ResultCache
+from functions.precompute import start_precompute
+from functions.router import create_chat_router
+from functions.tools import available_tools, build_function_handler, function_declarations
 # ============================
 # Configure Logging
 # ============================
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("INSIGHT_LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 # ============================
@@ -50,11 +30,22 @@ base_dir = os.path.dirname(__file__)
 default_file_1 = os.path.join(base_dir, "Central Retail and Competitors.xlsx")
 default_file_2 = os.path.join(base_dir, "PNJ Campaign.xlsx")
 
-# Function to load data from an Excel file
-def loaddata(df_path):
-    df = pd.read_excel(df_path, sheet_name="Data")
-    df['PublishedDate'] = pd.to_datetime(df['PublishedDate']).dt.date
-    return df
+# When INSIGHT_API_URL is set, the app is a thin client of server.py:
+# datasets are registered there and chat turns run on the API's workers.
+API_URL = os.environ.get("INSIGHT_API_URL")
+api_client = InsightAPIClient(API_URL) if API_URL else None
+
+
+@st.cache_resource
+def start_chat_sdk_preload():
+    """Import the Vertex AI SDK in the background once per server process."""
+    return preload_chat_sdk()
+
+
+# The SDK is only needed when the first question is sent (locally); the
+# page renders while it loads
+if not api_client:
+    start_chat_sdk_preload()
 
 # Sidebar for file upload and instructions
 with st.sidebar:
@@ -67,6 +58,31 @@ with st.sidebar:
     
     # File uploader for custom Excel files
     uploaded_file = st.file_uploader("Or upload your own Excel file", type=["xlsx"])
+
+    # Datasets loaded before are kept in the local store and reopen without
+    # parsing the Excel file again (not available in API mode)
+    stored_datasets = {} if api_client else {info["dataset_id"]: info for info in list_stored_datasets()}
+    stored_dataset_id = st.selectbox(
+        "Or reopen a previous dataset:",
+        options=[None] + list(stored_datasets),
+        format_func=lambda dataset_id: "—" if dataset_id is None else (
+            f"{stored_datasets[dataset_id]['name']} "
+            f"({stored_datasets[dataset_id]['rows']:,} rows, {stored_datasets[dataset_id].get('saved_at', '')})"
+        ),
+    ) if stored_datasets else None
+
+    # Saved datasets compared with the loaded one (e.g. the last campaign);
+    # they are memory-mapped from the store rather than read into memory
+    compare_dataset_ids = st.multiselect(
+        "Compare with saved datasets:",
+        options=list(stored_datasets),
+        format_func=lambda dataset_id: f"{stored_datasets[dataset_id]['name']} ({stored_datasets[dataset_id]['rows']:,} rows)",
+        # Keeps the selection when the store gains the loaded dataset
+        key="compare_dataset_ids",
+    ) if stored_datasets else []
+
+    # Daily export appended to the loaded dataset (only new rows are processed)
+    append_file = st.file_uploader("Append a daily export", type=["xlsx"])
     
     st.markdown("### Instructions")  # Use a header to group content
     st.markdown("""
@@ -98,26 +114,130 @@ with st.expander("Watch the demo video"):
     st.video(video_file)
 
 
-# Try to read the file
+def file_key(file):
+    return getattr(file, "file_id", None) or (file.name, file.size)
+
+
+# Try to read the file. The loaded dataset is kept in the session so daily
+# exports can be appended to it instead of re-reading the whole workbook.
+if uploaded_file:
+    source_key = file_key(uploaded_file)
+elif stored_dataset_id:
+    source_key = ("stored", stored_dataset_id)
+else:
+    source_key = selected_default_file
 try:
     if uploaded_file:
         # If the user uploaded a file, read it
-        df = loaddata(uploaded_file) 
         file_name = uploaded_file.name  # Get the name of the uploaded file
-        st.success(f"Your file '{file_name}' has been uploaded successfully!")
+    elif stored_dataset_id:
+        file_name = stored_datasets[stored_dataset_id]["name"]
     else:
         # Use the selected default file if no file is uploaded
-        df = loaddata(selected_default_file)
         file_name = os.path.basename(selected_default_file)  # Get the name of the selected file
-        st.info(f"Using the default file: '{file_name}'.")
 
-    # Format the data
-    df, interaction_found, labels1_found = format_social_listening_data(df)
+    if st.session_state.get("dataset_source") != source_key:
+        with st.spinner(f"Loading '{file_name}'..."):
+            if api_client and uploaded_file:
+                st.session_state.dataset_info = api_client.upload_dataset(file_name, uploaded_file.getvalue())
+            elif api_client:
+                # The sample files are on this machine, not necessarily on the API server
+                with open(selected_default_file, "rb") as fh:
+                    st.session_state.dataset_info = api_client.upload_dataset(file_name, fh.read())
+            elif stored_dataset_id:
+                st.session_state.dataset = open_stored_dataset(stored_dataset_id, warm=False)
+            else:
+                st.session_state.dataset = load_dataset(
+                    uploaded_file or selected_default_file, name=file_name, arrow_dir=STORE_DIR, warm=False
+                )
+        if not api_client:
+            # Indexes and the common tool results are prepared in the background
+            st.session_state.precompute = start_precompute(st.session_state.dataset)
+        st.session_state.dataset_source = source_key
+        st.session_state.appended_files = set()
+
+    if uploaded_file:
+        st.success(f"Your file '{file_name}' has been uploaded successfully!")
+    elif stored_dataset_id:
+        st.info(f"Using the saved dataset: '{file_name}'.")
+    else:
+        st.info(f"Using the default file: '{file_name}'.")
 
 except Exception as e:
     st.error(f"Failed to read the Excel file. Please check the file and try again.")
     st.stop()
 
+if append_file and file_key(append_file) not in st.session_state.appended_files:
+    try:
+        if api_client:
+            st.session_state.dataset_info = api_client.append_dataset(
+                st.session_state.dataset_info["dataset_id"], append_file.name, append_file.getvalue()
+            )
+            rows_added = st.session_state.dataset_info["rows_added"]
+        else:
+            rows_added = st.session_state.dataset.append(append_file)
+            st.session_state.precompute = start_precompute(st.session_state.dataset)
+        st.session_state.appended_files.add(file_key(append_file))
+        st.success(f"Appended {rows_added} new rows from '{append_file.name}'.")
+    except Exception as e:
+        logger.error(f"Error appending {append_file.name}: {e}")
+        st.error(f"Failed to append '{append_file.name}'. Please check the file and try again.")
+
+if api_client:
+    dataset_info = st.session_state.dataset_info
+else:
+    dataset = st.session_state.dataset
+
+    # Datasets opened for comparison are kept across reruns
+    opened = st.session_state.setdefault("compare_datasets", {})
+    compare_with = []
+    for compare_id in compare_dataset_ids:
+        if compare_id == dataset.dataset_id:
+            continue
+        try:
+            if compare_id not in opened:
+                opened[compare_id] = open_stored_dataset(compare_id, warm=False)
+            compare_with.append(opened[compare_id])
+        except Exception as e:
+            logger.error(f"Error opening dataset {compare_id} for comparison: {e}")
+            st.sidebar.error(f"Failed to open '{stored_datasets[compare_id]['name']}' for comparison.")
+    for compare_id in set(opened) - set(compare_dataset_ids):
+        del opened[compare_id]
+
+
+def show_readiness(status):
+    if status["Ready"]:
+        failed = f" ({', '.join(status['Failed'])} unavailable)" if status["Failed"] else ""
+        st.caption(f"✅ Data ready in {status['Seconds']:.1f}s{failed}")
+    else:
+        st.caption(f"⏳ Preparing data ({status['Done']}/{status['Total']}: {status['Current'] or 'starting'})")
+
+
+@st.fragment(run_every=1.0)
+def readiness_indicator(job):
+    """Refreshes itself every second until the background preparation is done."""
+    status = job.status()
+    if status["Ready"]:
+        st.rerun()
+    show_readiness(status)
+
+
+if not api_client and "precompute" in st.session_state:
+    with st.sidebar:
+        job = st.session_state.precompute
+        if job.status()["Ready"]:
+            show_readiness(job.status())
+        else:
+            readiness_indicator(job)
+
+        # Shared model request queue of this server process
+        queue = LLM_LIMITER.stats()
+        if queue["requests"]:
+            st.caption(
+                f"Model queue: {queue['active']}/{queue['limit']} busy, {queue['waiting']} waiting; "
+                f"wait p50 {queue['wait_p50']:.1f}s, p95 {queue['wait_p95']:.1f}s"
+            )
+
     
 # @st.cache_data
 # def send_chat_message(prompt):
@@ -162,175 +282,91 @@ except Exception as e:
 
 
 
-def send_chat_message(prompt):
+def send_chat_message(prompt, on_queue=None):
     """
     Send the user's prompt to the LLM, handle function calls in a loop,
     then return the final textual response. All outputs are shown in Streamlit.
+    on_queue(position) is called while a model request waits for a free
+    slot (local mode only; the API server queues on its side).
     """
-    prompt += """
-    You are a social media listening insight writer. Based on the information provided by the function's responses, generate actionable and well-articulated insights
-    """
-
-    # Ensure there's a chat session in st.session_state
-    if "chat_session" not in st.session_state:
-        # Initialize or re-initialize your model and chat
-        # (You can do this outside or keep it here if you'd like it flexible)
-        st.error("Chat session not found in session_state. Please initialize first.")
-        return ""
-
-    chat_session = st.session_state.chat_session
-
-    # Optional: You can append instructions to the prompt if desired
-    # e.g. a system/role message, etc.
-    # prompt += """
-    # You are a social listening insight...
-    # """
-
-    # 1. Send the user's message to the LLM
-    response = chat_session.send_message(prompt)
-
-    # 2. Handle multiple function calls, if any
-    while True:
-        # Safely check if there's a function call
-        function_call = None
-        # Make sure we have a candidate with parts
-        if (response.candidates 
-            and response.candidates[0].content
-            and response.candidates[0].content.parts):
-            function_call = response.candidates[0].content.parts[0].function_call
-
-        # If no function call is present, break
-        if not function_call:
-            break
-
-        # If the model wants to call a known function, handle it
-        if function_call.name in function_handler:
-            function_name = function_call.name
-            # Convert the function call arguments into a Python dict
-            params = {key: value for key, value in function_call.args.items()}
-
-            # Execute the local Python function
-            function_result = function_handler[function_name](params)
-
-            # Send that result back to the LLM as a function response
-            response = chat_session.send_message(
-                Part.from_function_response(
-                    name=function_name,
-                    response={"content": function_result},
-                )
-            )
-        else:
-            # The LLM requested an unknown function or something else
-            st.warning(f"Unknown function call requested: {function_call.name}")
-            break
-
-    # 3. Attempt to get final text. If the model only produced function calls, 
-    #    .text might raise a ValueError.
-    try:
-        final_text = response.text
-    except ValueError:
-        final_text = "No final text was provided. The model returned only a function call."
-
-    # 5. Return the text if you'd like to use it elsewhere
-    return final_text
+    if api_client:
+        return api_client.send_message(st.session_state.api_session_id, prompt, dataset_info["dataset_id"])
+
+    # The chat session is created with the first question, and again when
+    # the dataset changes (new file or append) so the models get its current
+    # digest, or the compared datasets change so they get the tools; the
+    # conversation carries over
+    datasets_key = (dataset.dataset_id, tuple(other.dataset_id for other in compare_with))
+    if st.session_state.get("chat_router_dataset") != datasets_key:
+        history = st.session_state.chat_router.history if "chat_router" in st.session_state else []
+        st.session_state.chat_router = start_chat_session()
+        st.session_state.chat_router.history = history
+        st.session_state.chat_router_dataset = datasets_key
+
+    # Lookups are sent with the precomputed result they need, once it is ready
+    return st.session_state.chat_router.send(
+        prompt,
+        function_handler,
+        is_cached=lambda name: dataset.has_result(name, {}),
+        on_unknown_function=lambda name: st.warning(f"Unknown function call requested: {name}"),
+        on_queue=on_queue,
+    )
 
 # Display the file name if needed
 st.write(f"Currently loaded file: **{file_name}**")
+if not api_client and compare_with:
+    st.write("Compared with: " + ", ".join(f"**{other.name}**" for other in compare_with))
 
 
 
-# Create a list of FunctionDeclarations based on interaction_found
-if interaction_found:
-
-    company_insights_tool = Tool(
-        function_declarations=[
-            get_daily_detail,
-            brand_health_overview,
-            get_top_post_details,
-            get_channel_detail,
-            get_brand_sentiment_detail,
-            get_label_details
-        ],
-    )
-    function_handler = {
-    "get_daily_detail": lambda p: get_daily_detail_data(df, p),
-    "brand_health_overview": lambda p: generate_brand_health_overview(df, p),
-    "get_top_post_details": lambda p: generate_top_post_details(df, p),
-    "get_channel_detail": lambda p: generate_channel_details(df, p),
-    "get_brand_sentiment_detail": lambda p: generate_brand_sentiment_details(df, p),
-    "get_label_details": lambda p: generate_label_details(df, p),
-    }
+if api_client:
+    # One API chat session per loaded file; appended versions reuse it
+    if st.session_state.get("api_session_source") != source_key:
+        try:
+            st.session_state.api_session_id = api_client.create_session(dataset_info["dataset_id"])
+            st.session_state.api_session_source = source_key
+        except Exception as e:
+            logger.error(f"Error creating API chat session: {e}")
+            st.error("Failed to start chat session.")
+            st.stop()
 else:
-    company_insights_tool = Tool(
-        function_declarations=[
-            get_daily_detail,
-            brand_health_overview,
-            get_top_post_details,
-            get_channel_detail,
-            get_brand_sentiment_detail
-        ],
+    # Tools and handlers depend on the columns found in the dataset and on
+    # the datasets it is compared with
+    tool_names = available_tools(dataset, compare_with)
+    # Cursors into large results stay valid for the whole chat session
+    function_handler = build_function_handler(
+        dataset, st.session_state.setdefault("result_cache", ResultCache()), compare_with
     )
-    function_handler = {
-    "get_daily_detail": lambda p: get_daily_detail_data(df, p),
-    "brand_health_overview": lambda p: generate_brand_health_overview(df, p),
-    "get_top_post_details": lambda p: generate_top_post_details(df, p),
-    "get_channel_detail": lambda p: generate_channel_details(df, p),
-    "get_brand_sentiment_detail": lambda p: generate_brand_sentiment_details(df, p),
-    }
 
-# Map function names to their handlers
 
-# ============================
-# Initialize Vertex AI
-# ============================
-
-PROJECT_ID = "hybrid-autonomy-445719-q2"
-import tempfile
-import json
-
-# Example: Retrieve credentials from Streamlit secrets
-credentials_str = st.secrets["google"]["credentials"]
-credentials_dict = json.loads(credentials_str)
-
-# Create a temporary file
-with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
-    json.dump(credentials_dict, temp_file)  # Write JSON to the file
-    temp_file_name = temp_file.name
-
-
-# Set the environment variable to the file path
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file_name
-
-# Initialize Vertex AI
-try:
-    import vertexai
-    vertexai.init(project=PROJECT_ID)
-    # Access the credentials from Streamlit secrets
-
-except Exception as e:
-    logger.error(f"Error initializing Vertex AI: {e}")
-    st.error("Failed to initialize Vertex AI. Please check your configuration.")
-    st.stop()
-
-# Initialize Generative Model
-try:
-    gemini_model = GenerativeModel(
-        "gemini-1.5-pro-002",
-        generation_config=GenerationConfig(temperature=0),
-        tools=[company_insights_tool],
-    )
-except Exception as e:
-    logger.error(f"Error initializing Generative Model: {e}")
-    st.error("Failed to initialize the generative model.")
-    st.stop()
-try:
-    chat = gemini_model.start_chat()
-except Exception as e:
-    logger.error(f"Error starting chat session: {e}")
-    st.error("Failed to start chat session.")
-    st.stop()
-if "chat_session" not in st.session_state:
-    st.session_state.chat_session = gemini_model.start_chat()
+def start_chat_session():
+    """
+    Initialize Vertex AI and start a chat with the dataset's tools and
+    digest, routed between the pro and the fast model (see router.py). Called with the
+    first question rather than on every page render, since the
+    SDK and the model take seconds to set up.
+    """
+    # ============================
+    # Initialize Vertex AI
+    # ============================
+    try:
+        # Access the credentials from Streamlit secrets
+        init_vertexai(PROJECT_ID, credentials_json=st.secrets["google"]["credentials"])
+    except Exception as e:
+        logger.error(f"Error initializing Vertex AI: {e}")
+        st.error("Failed to initialize Vertex AI. Please check your configuration.")
+        st.stop()
+
+    # Initialize the Generative Models
+    instruction = digest_instruction(dataset.index("digest"))
+    if compare_with:
+        instruction += comparison_instruction([other.name for other in compare_with])
+    try:
+        return create_chat_router(function_declarations(tool_names), tool_names, instruction)
+    except Exception as e:
+        logger.error(f"Error initializing Generative Model: {e}")
+        st.error("Failed to initialize the generative model.")
+        st.stop()
 # ============================
 # Streamlit App Layout
 # ============================
@@ -358,8 +394,16 @@ if prompt := st.chat_input("How's performances of brands on social media?"):
         message_placeholder = st.empty()
         full_response = ""
 
+        def show_queue_position(position):
+            message_placeholder.markdown(f"⏳ Many people are asking right now; you are number {position} in the queue.")
+
         # Ensure send_chat_message returns a string
-        response_text = send_chat_message(prompt)
+        try:
+            response_text = send_chat_message(prompt, on_queue=show_queue_position)
+        except Exception as e:
+            # The model call policy already retried; don't lose the chat over it
+            logger.error(f"Error getting a response from the model: {e}")
+            response_text = "Sorry, the model is not responding right now. Please try again in a moment."
         full_response += response_text
         message_placeholder.markdown(full_response + "▌")
         message_placeholder.markdown(full_response)
@@ -0,0 +1,440 @@
+# bench.py
+#
+# Micro-benchmarks on synthetic CMS-like data:
+#
+#   python bench.py topk [--rows N] [--posts N]
+#   python bench.py periods [--rows N]
+#   python bench.py spikes [--rows N] [--days N]
+#   python bench.py neardup [--rows N]
+#   python bench.py backends [--rows N] [--null-fraction P]
+#   python bench.py startup [--runs N]
+#   python bench.py policy [--turns N] [--failure-rate P] [--slow-rate P]
+#   python bench.py counts [--cells N]
+#   python bench.py diskcache [--rows N] [--entries N]
+#   python bench.py compare [--rows N] [--datasets N]
+#
+# The synthetic data comes from tests/conftest.py and the offline chat model
+# from tests/fakemodel.py (run from the repository root).
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import statistics
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from functions import format_social_listening_data
+from functions.functions import _top_k_per_group
+from functions.anomaly import rolling_zscores
+from functions.backends import BACKENDS
+from functions.callpolicy import CallPolicy
+from functions.chat import run_chat_turn
+from functions.comparison import build_dataset_summary, dataset_summaries
+from functions.counts import parse_counts
+from functions.dataset import Dataset
+from functions.diskcache import DiskCache, cached_tool_result, result_key
+from functions.limiter import ConcurrencyLimiter
+from functions.neardup import build_near_duplicates
+from functions.timeseries import build_daily_series
+from functions.precompute import PRECOMPUTE_TOOLS
+from functions.tools import TOOL_HANDLERS, run_tool
+from tests.conftest import PARITY_HANDLERS, PARITY_QUERIES, make_synthetic_data
+from tests.fakemodel import FakeModel
+
+
+def timed(fn, repeat=3):
+    """Best wall-clock time of `repeat` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def report(name, ms):
+    print(f"{name:<60} {ms:>10.1f} ms")
+
+
+def bench_topk(args):
+    df, _, _ = format_social_listening_data(make_synthetic_data(args.rows, args.posts))
+    posts = (
+        df.groupby(["Topic", "FormattedDate", "ParentId"])
+        .size()
+        .reset_index(name="Mentions")
+    )
+    per_topic = df.groupby(["Topic", "UrlTopic", "Title"]).size().reset_index(name="Mentions")
+    print(f"{len(df)} rows, {len(per_topic)} posts, {len(posts)} (brand, date, post) groups\n")
+
+    for k in (1, 5, 20):
+        report(f"full sort + head, k={k}", timed(lambda: per_topic.sort_values("Mentions", ascending=False).head(k)))
+        report(f"nlargest, k={k}", timed(lambda: per_topic.nlargest(k, "Mentions")))
+        report(f"per (brand, date): full sort + groupby.head, k={k}", timed(
+            lambda: posts.sort_values(["Topic", "FormattedDate", "Mentions"], ascending=[True, True, False])
+            .groupby(["Topic", "FormattedDate"]).head(k)
+        ))
+        report(f"per (brand, date): _top_k_per_group, k={k}", timed(
+            lambda: _top_k_per_group(posts, ["Topic", "FormattedDate"], "Mentions", k)
+        ))
+    print()
+    for name in ("get_top_post_details", "get_channel_detail", "get_label_details", "get_daily_detail"):
+        report(f"handler {name}", timed(lambda: TOOL_HANDLERS[name](df, {}), repeat=1))
+
+
+def bench_periods(args):
+    df, _, _ = format_social_listening_data(make_synthetic_data(args.rows))
+    series = build_daily_series(df)
+    start, end = datetime.date(2024, 2, 1), datetime.date(2024, 2, 7)
+    print(f"{len(df)} rows\n")
+
+    def rescan():
+        dates = pd.to_datetime(df["FormattedDate"])
+        in_range = df[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+        return in_range.groupby(["Topic", "Sentiment"]).size()
+
+    report("build DailySeries", timed(lambda: build_daily_series(df), repeat=1))
+    report("range total by brand x sentiment: filter + groupby", timed(rescan))
+    report("range total by brand x sentiment: prefix sums", timed(lambda: series.totals("sentiment", start, end)))
+    report("handler compare_periods", timed(lambda: TOOL_HANDLERS["compare_periods"](df, {}, index=series)))
+
+
+def bench_spikes(args):
+    df, _, _ = format_social_listening_data(make_synthetic_data(args.rows, days=args.days))
+    series = build_daily_series(df)
+    _, counts = series.daily_counts("channel")
+    print(f"{len(df)} rows, {counts.shape[0]} brand x channel series over {counts.shape[1]} days\n")
+
+    report("rolling z-scores, brand x channel", timed(lambda: rolling_zscores(counts)))
+    report("handler detect_spikes", timed(lambda: TOOL_HANDLERS["detect_spikes"](df, {}, index=series)))
+
+
+def bench_neardup(args):
+    raw = make_synthetic_data(args.rows)
+    # Seed near-identical variants of a few template comments
+    rng = np.random.default_rng(1)
+    templates = np.array(["Check inbox giúp em với ạ", "Shop ơi giao hàng chậm quá, 3 ngày rồi chưa nhận",
+                          "Sản phẩm đẹp lắm, sẽ ủng hộ tiếp"])
+    seeded = rng.choice(len(raw), len(raw) // 4, replace=False)
+    raw.loc[seeded, "Content"] = np.char.add(rng.choice(templates, len(seeded)),
+                                             rng.choice(["", " ạ", "!!", " nha", " shop"], len(seeded)))
+    df, _, _ = format_social_listening_data(raw)
+    clusters = build_near_duplicates(df)
+    print(f"{len(df)} rows, {clusters.describe()}\n")
+
+    report("build NearDuplicateIndex", timed(lambda: build_near_duplicates(df), repeat=1))
+    # Appending a day of data only clusters the new comments
+    day = df.tail(max(len(df) // 100, 1))
+    appended = build_near_duplicates(df.iloc[:-len(day)])
+    report(f"append {len(day)} rows to NearDuplicateIndex",
+           timed(lambda: appended.add(df, len(df) - len(day)), repeat=1))
+    same = (appended.cluster_of(appended.hashes) == clusters.cluster_of(appended.hashes)).all()
+    print(f"clusters after append match a full build: {same}")
+    for name in ("get_brand_sentiment_detail", "get_label_details"):
+        plain = len(json.dumps(TOOL_HANDLERS[name](df, {}), ensure_ascii=False, default=str))
+        clustered = len(json.dumps(TOOL_HANDLERS[name](df, {}, clusters=clusters), ensure_ascii=False, default=str))
+        print(f"{name:<40} payload {plain:>10} -> {clustered:>10} chars")
+
+
+def check_parity(df, backends):
+    """True if every backend returns exactly what the pandas backend returns."""
+    reference = backends["pandas"]
+    ok = True
+    for name, backend in backends.items():
+        for label, keys, metrics, filters in PARITY_QUERIES:
+            try:
+                pd.testing.assert_frame_equal(
+                    reference.group_aggregate(keys, metrics, filters), backend.group_aggregate(keys, metrics, filters)
+                )
+            except AssertionError as e:
+                ok = False
+                print(f"MISMATCH {name}: {label}\n{e}")
+        try:
+            pd.testing.assert_frame_equal(
+                reference.sentiment_breakdown(["Topic", "FormattedDate", "SiteName"]),
+                backend.sentiment_breakdown(["Topic", "FormattedDate", "SiteName"]),
+            )
+        except AssertionError as e:
+            ok = False
+            print(f"MISMATCH {name}: sentiment breakdown\n{e}")
+        for tool, params in PARITY_HANDLERS:
+            expected = json.dumps(TOOL_HANDLERS[tool](df, params, backend=reference), default=str)
+            if json.dumps(TOOL_HANDLERS[tool](df, params, backend=backend), default=str) != expected:
+                ok = False
+                print(f"MISMATCH {name}: {tool} output")
+    return ok
+
+
+def bench_backends(args):
+    df, _, _ = format_social_listening_data(make_synthetic_data(args.rows, null_fraction=args.null_fraction))
+    backends = {name: cls(df) for name, cls in BACKENDS.items()}
+    print(f"{len(df)} rows\n")
+    print("parity:", "OK" if check_parity(df, backends) else "FAILED", "\n")
+
+    for label, keys, metrics, filters in PARITY_QUERIES:
+        for name, backend in backends.items():
+            report(f"{name:<7} {label}", timed(lambda: backend.group_aggregate(keys, metrics, filters)))
+    for name, backend in backends.items():
+        report(f"{name:<7} sentiment breakdown by brand x date x site",
+               timed(lambda: backend.sentiment_breakdown(["Topic", "FormattedDate", "SiteName"])))
+    for name, backend in backends.items():
+        report(f"{name:<7} handler get_daily_detail",
+               timed(lambda: TOOL_HANDLERS["get_daily_detail"](df, {}, backend=backend), repeat=1))
+
+
+# Modules app.py imports before rendering anything
+STARTUP_MODULES = [
+    "streamlit",
+    "functions.apiclient",
+    "functions.chat",
+    "functions.dataset",
+    "functions.pagination",
+    "functions.tools",
+]
+# Heavy SDKs that must stay out of the startup path
+DEFERRED_MODULES = ["vertexai", "google.cloud.aiplatform"]
+
+
+def _timed_subprocess(code):
+    """Run code in a fresh interpreter from the repo root and return its stdout."""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def bench_startup(args):
+    startup = (
+        "import sys, time; start = time.perf_counter(); "
+        f"import {', '.join(STARTUP_MODULES)}; "
+        "print(time.perf_counter() - start, [m for m in %r if m in sys.modules])" % DEFERRED_MODULES
+    )
+    deferred = (
+        "import time, functions; start = time.perf_counter(); "
+        "import vertexai.generative_models, functions.functiondeclarations; "
+        "print(time.perf_counter() - start)"
+    )
+    render = (
+        "import time; from streamlit.testing.v1 import AppTest; start = time.perf_counter(); "
+        "AppTest.from_file('app.py', default_timeout=120).run(); print(time.perf_counter() - start)"
+    )
+
+    times, loaded = [], []
+    for _ in range(args.runs):
+        seconds, loaded = _timed_subprocess(startup).split(" ", 1)
+        times.append(float(seconds) * 1000)
+    report(f"startup imports (median of {args.runs} cold interpreters)", statistics.median(times))
+    report("Vertex AI SDK + declarations (deferred)", float(_timed_subprocess(deferred)) * 1000)
+    report("app.py first render (AppTest, incl. imports)", float(_timed_subprocess(render)) * 1000)
+    if loaded != "[]":
+        print(f"FAIL: {loaded} imported at startup")
+
+
+# Policies compared on the same fake model (seconds)
+POLICY_SCENARIOS = [
+    ("no deadline, no retries", dict(timeout=3600, retries=0)),
+    ("deadline 0.5s + 3 retries", dict(timeout=0.5, retries=3, backoff=0.05)),
+    ("deadline + retries + hedging after p90", dict(timeout=0.5, retries=3, backoff=0.05, hedge_percentile=90)),
+]
+POLICY_TOOL_CALLS = [("brand_health_overview", {}), ("get_channel_detail", {})]
+
+
+def bench_policy(args):
+    # Retries are expected here; keep the report readable
+    logging.getLogger("functions.callpolicy").setLevel(logging.ERROR)
+    function_handler = {name: (lambda params: {"ok": True}) for name, _ in POLICY_TOOL_CALLS}
+    # Requests per turn: one per tool call plus the final answer
+    requests = len(POLICY_TOOL_CALLS) + 1
+
+    for name, options in POLICY_SCENARIOS:
+        model = FakeModel(
+            latency=0.02, slow_rate=args.slow_rate, slow_latency=2.0,
+            failure_rate=args.failure_rate, tool_calls=POLICY_TOOL_CALLS, seed=0,
+        )
+        policy = CallPolicy(seed=0, **options)
+        limiter = ConcurrencyLimiter(args.concurrency)
+
+        def turn(_):
+            session = model.start_chat()
+            start = time.perf_counter()
+            try:
+                run_chat_turn(model, session, "How are the brands doing?", function_handler, limiter=limiter, policy=policy)
+            except Exception:
+                return None, True
+            # Abandoned and hedged attempts must not leave turns in the history
+            return time.perf_counter() - start, len(session.history) == 2 * requests
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(turn, range(args.turns)))
+        seconds = [s for s, _ in results if s is not None]
+        stats = policy.stats()
+        print(f"{name}: {len(seconds)}/{args.turns} turns answered, history intact: {all(ok for _, ok in results)}")
+        if seconds:
+            report("  turn p50", np.percentile(seconds, 50) * 1000)
+            report("  turn p95", np.percentile(seconds, 95) * 1000)
+            report("  turn max", max(seconds) * 1000)
+        print(
+            f"  model requests {model.calls}, retries {stats['retries']}, timeouts {stats['timeouts']}, "
+            f"hedges {stats['hedges']} (won {stats['hedge_wins']}, skipped {stats['hedges_skipped']})"
+        )
+
+
+def make_count_cells(cells=2_000_000, seed=0):
+    """Interaction counts written the ways exports write them, with some junk."""
+    rng = np.random.default_rng(seed)
+    n = rng.integers(0, 100_000, cells)
+    formats = rng.choice(6, cells, p=[0.5, 0.15, 0.1, 0.1, 0.1, 0.05])
+    cells = n.astype(str).astype(object)
+    thousands = formats == 1                                   # "12,345"
+    cells[thousands] = [f"{v:,}" for v in n[thousands]]
+    vi_thousands = formats == 2                                # "12.345"
+    cells[vi_thousands] = [f"{v:,}".replace(",", ".") for v in n[vi_thousands]]
+    abbreviated = formats == 3                                 # "12.3K" / "12,3 N"
+    cells[abbreviated] = [
+        f"{v / 1000:.1f}K" if v % 2 else f"{v / 1000:.1f} N".replace(".", ",") for v in n[abbreviated]
+    ]
+    cells[formats == 4] = ""
+    cells[formats == 5] = "n/a?"
+    return pd.Series(cells)
+
+
+def bench_counts(args):
+    cells = make_count_cells(args.cells)
+    print(f"{len(cells)} cells, {cells.nunique()} distinct values\n")
+
+    def coerce():
+        return pd.to_numeric(cells.astype(str).str.strip(), errors="coerce")
+
+    report("to_numeric(astype(str), errors='coerce')", timed(coerce))
+    report("parse_counts", timed(lambda: parse_counts(cells)))
+
+    counts, unparsable = parse_counts(cells)
+    blank = cells.eq("").sum()
+    print(f"\nNaN with to_numeric: {coerce().isna().sum()}")
+    print(f"NaN with parse_counts: {counts.isna().sum()} ({blank} blank, {unparsable} unparsable)")
+
+
+def bench_diskcache(args):
+    df, interaction_found, labels1_found = format_social_listening_data(make_synthetic_data(args.rows))
+    dataset = Dataset(df, interaction_found, labels1_found, name="bench", dataset_id="bench")
+    dataset.warm()
+    print(f"{len(df)} rows\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for name in PRECOMPUTE_TOOLS:
+            # A fresh DiskCache on the same directory stands for a restarted process
+            cold, warm = DiskCache(directory), DiskCache(directory)
+            report(f"{name} computed (and written)",
+                   timed(lambda: cached_tool_result("bench", name, {}, lambda: run_tool(dataset, name, {}, use_cache=False), cold), repeat=1))
+            report(f"{name} read after a restart",
+                   timed(lambda: cached_tool_result("bench", name, {}, lambda: None, warm)))
+            results[name] = run_tool(dataset, name, {}, use_cache=False)
+
+        raw = sum(len(pickle.dumps(r, protocol=pickle.HIGHEST_PROTOCOL)) for r in results.values())
+        stored = DiskCache(directory).size()
+        print(f"\n{raw / 1e6:.1f} MB pickled, {stored / 1e6:.1f} MB on disk ({raw / max(stored, 1):.1f}x)")
+
+        # A cap of half the entries keeps the most recently used ones
+        small = DiskCache(directory, max_bytes=stored // 2)
+        print(f"evicted {small.evict()} of {len(results)} entries under a {stored // 2 / 1e6:.1f} MB cap\n")
+
+        # Writes into a cache holding many entries only scan it when over the cap
+        many = DiskCache(directory)
+        for i in range(args.entries):
+            many.put(result_key("bench", "entry", {"i": i}), i)
+        report(f"put into a cache of {args.entries} entries",
+               timed(lambda: many.put(result_key("bench", "entry", {"i": -1}), 0), repeat=20))
+        print(f"directory scans for {args.entries + 20} writes: {many.stats()['scans']}")
+        report(f"scan of a cache of {args.entries} entries (once over the cap)", timed(many.evict))
+
+
+def bench_compare(args):
+    datasets = []
+    for seed in range(args.datasets):
+        df, interaction_found, labels1_found = format_social_listening_data(make_synthetic_data(args.rows, seed=seed))
+        datasets.append(Dataset(df, interaction_found, labels1_found, name=f"campaign {seed}"))
+    print(f"{args.datasets} datasets of {args.rows} rows\n")
+
+    def parallel():
+        for dataset in datasets:
+            dataset._indexes.pop("summary", None)
+        return dataset_summaries(datasets)
+
+    report("summaries one after the other", timed(lambda: [build_dataset_summary(d.df) for d in datasets]))
+    report("summaries in parallel", timed(parallel))
+    # The tool itself only reads the summaries
+    others = [(d.name, d.index("summary")) for d in datasets[1:]]
+    report("compare_datasets by brand",
+           timed(lambda: TOOL_HANDLERS["compare_datasets"](datasets[0].df, {}, index=datasets[0].index("summary"), others=others)))
+    frame_bytes = sum(d.df.memory_usage(deep=True).sum() for d in datasets)
+    summary_bytes = sum(d.index("summary").memory_usage(deep=True).sum() for d in datasets)
+    print(f"\nframes {frame_bytes / 1e6:.0f} MB, summaries {summary_bytes / 1e3:.1f} kB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    topk = sub.add_parser("topk", help="partial top-k selection vs full sorts")
+    topk.add_argument("--rows", type=int, default=200_000)
+    topk.add_argument("--posts", type=int, default=50_000)
+    topk.set_defaults(func=bench_topk)
+
+    periods = sub.add_parser("periods", help="date-range totals from prefix sums vs rescanning")
+    periods.add_argument("--rows", type=int, default=200_000)
+    periods.set_defaults(func=bench_periods)
+
+    spikes = sub.add_parser("spikes", help="rolling z-score anomaly detection")
+    spikes.add_argument("--rows", type=int, default=200_000)
+    spikes.add_argument("--days", type=int, default=365)
+    spikes.set_defaults(func=bench_spikes)
+
+    neardup = sub.add_parser("neardup", help="MinHash/LSH near-duplicate clustering")
+    neardup.add_argument("--rows", type=int, default=50_000)
+    neardup.set_defaults(func=bench_neardup)
+
+    backends = sub.add_parser("backends", help="pandas vs DuckDB parity check and timings")
+    backends.add_argument("--rows", type=int, default=1_000_000)
+    backends.add_argument("--null-fraction", type=float, default=0.1)
+    backends.set_defaults(func=bench_backends)
+
+    startup = sub.add_parser("startup", help="cold-start import and first render time of the app")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    policy = sub.add_parser("policy", help="model call deadline/retry/hedging against the offline fake model")
+    policy.add_argument("--turns", type=int, default=300)
+    policy.add_argument("--concurrency", type=int, default=8)
+    policy.add_argument("--failure-rate", type=float, default=0.05)
+    policy.add_argument("--slow-rate", type=float, default=0.03)
+    policy.set_defaults(func=bench_policy)
+
+    counts = sub.add_parser("counts", help="interaction count parsing (separators, K/M/N suffixes)")
+    counts.add_argument("--cells", type=int, default=2_000_000)
+    counts.set_defaults(func=bench_counts)
+
+    diskcache = sub.add_parser("diskcache", help="tool results computed vs read from the disk cache")
+    diskcache.add_argument("--rows", type=int, default=200_000)
+    diskcache.add_argument("--entries", type=int, default=5_000)
+    diskcache.set_defaults(func=bench_diskcache)
+
+    compare = sub.add_parser("compare", help="per-dataset summaries and the compare_datasets tool")
+    compare.add_argument("--rows", type=int, default=500_000)
+    compare.add_argument("--datasets", type=int, default=3)
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
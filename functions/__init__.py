@@ -9,15 +9,43 @@ from .functions import (
     generate_brand_sentiment_details,
     generate_label_details
 )
-from .functiondeclarations import (
-    brand_health_overview,
-    get_top_post_details,
-    get_channel_detail,
-    get_brand_sentiment_detail,
-    get_label_details,
-    get_daily_detail
-    # Import other FunctionDeclaration instances here
-)
+from .search import search_mentions_data
+from .timeseries import compare_periods_data
+from .anomaly import detect_spikes_data
+from .aggregate import aggregate_data
+from .comparison import compare_datasets_data
+
+# Importing the submodule bound `aggregate` to it; the package attribute is
+# the FunctionDeclaration of the same name (see __getattr__ below)
+del aggregate
+
+# The FunctionDeclarations are only needed to create a chat model and
+# importing them loads the Vertex AI SDK (seconds), so they are imported on
+# first access instead of with the package.
+_DECLARATIONS = [
+    "brand_health_overview",
+    "get_top_post_details",
+    "get_channel_detail",
+    "get_brand_sentiment_detail",
+    "get_label_details",
+    "get_daily_detail",
+    "search_mentions",
+    "compare_periods",
+    "detect_spikes",
+    "aggregate",
+    "fetch_more",
+    "compare_datasets",
+    # Add other FunctionDeclaration names here
+]
+
+
+def __getattr__(name):
+    if name in _DECLARATIONS:
+        from . import functiondeclarations
+
+        return getattr(functiondeclarations, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "format_social_listening_data",
@@ -27,11 +55,22 @@ __all__ = [
     "generate_channel_details",
     "generate_brand_sentiment_details",
     "generate_label_details",
+    "search_mentions_data",
+    "compare_periods_data",
+    "detect_spikes_data",
+    "aggregate_data",
+    "compare_datasets_data",
     "brand_health_overview",
     "get_daily_detail",
     "get_top_post_details",
     "get_channel_detail",
     "get_brand_sentiment_detail",
     "get_label_details",
+    "search_mentions",
+    "compare_periods",
+    "detect_spikes",
+    "aggregate",
+    "fetch_more",
+    "compare_datasets",
     # Add other FunctionDeclarations to __all__
 ]
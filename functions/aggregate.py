@@ -0,0 +1,286 @@
+# functions/aggregate.py
+#
+# Generic group-by tool: the model describes a small aggregation (group-by
+# dimensions, metrics, filters, limit) instead of pulling a whole nested
+# payload to read one number. Only the whitelisted dimensions and metrics
+# below can be used, and the query runs on the dataset's execution backend
+# with a time limit.
+#
+# A pandas query cannot be interrupted, so a query that times out keeps
+# running in the background. Queries that could return more than
+# INSIGHT_AGGREGATE_MAX_GROUPS groups are refused before they run (the
+# estimate comes from the distinct values of each dimension, an index of
+# the dataset), and at most AGGREGATE_WORKERS queries run at once: a call
+# that cannot get a worker within its time limit is refused instead of
+# queueing behind queries nobody waits for anymore.
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pandas as pd
+
+from .backends import make_backend
+from .functions import _int_param
+from .search import _parse_date, fold_text
+
+logger = logging.getLogger(__name__)
+
+# Dimension name (as exposed to the model) -> column
+DIMENSIONS = {
+    "brand": "Topic",
+    "sentiment": "Sentiment",
+    "channel": "ChannelDeep",
+    "site": "SiteName",
+    "label": "Labels1",
+    "type": "Type",
+    "date": "FormattedDate",
+}
+
+# Metric name -> [(agg, column), ...]; metrics with several parts are summed
+METRICS = {
+    "mentions": [("size", None)],
+    "engagement": [("sum", "Engagement")],
+    "reactions": [("sum", "Reactions")],
+    "comments": [("sum", "Comments")],
+    "shares": [("sum", "Shares")],
+    "views": [("sum", "Views")],
+    "sites": [("nunique", "SiteName")],
+    "posts": [("nunique", "UrlTopic")],
+}
+
+FILTER_OPS = ("==", "!=", "in", "not in", "contains")
+MAX_GROUP_BY = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+DEFAULT_TIMEOUT = 10.0
+MAX_GROUPS = int(os.environ.get("INSIGHT_AGGREGATE_MAX_GROUPS", 200_000))
+AGGREGATE_WORKERS = 4
+
+# Queries run here so they can be abandoned after the time limit; a worker
+# is held (_workers) until its query really ends
+_executor = ThreadPoolExecutor(max_workers=AGGREGATE_WORKERS, thread_name_prefix="aggregate")
+_workers = threading.BoundedSemaphore(AGGREGATE_WORKERS)
+
+
+class AggregateSpecError(ValueError):
+    """An aggregate spec that uses unknown dimensions, metrics or operators."""
+
+
+def _as_list(value):
+    """The model sends arrays as repeated proto values, a single string, or nothing."""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def build_dimension_values(df) -> dict:
+    """
+    Distinct values of each dimension column, as {column: {"seen": set of
+    values, "folded": {folded value: value}}}; see _resolve_values().
+    """
+    return update_dimension_values({}, df, 0)
+
+
+def update_dimension_values(values, df, start):
+    """Add the distinct values of the rows df.iloc[start:]."""
+    rows = df.iloc[start:]
+    for col in DIMENSIONS.values():
+        if col not in rows.columns:
+            continue
+        column = values.setdefault(col, {"seen": set(), "folded": {}})
+        for value in pd.unique(rows[col].dropna()):
+            if value not in column["seen"]:
+                column["seen"].add(value)
+                column["folded"][fold_text(value)] = value
+    return values
+
+
+def _resolve_values(column, values):
+    """
+    Map the model's filter values to the values stored in the column,
+    ignoring case and diacritics ('tiktok' -> 'Tiktok'). Values with no
+    match are kept as given (and match nothing).
+    """
+    return [column["folded"].get(fold_text(v), v) for v in values]
+
+
+def estimate_groups(dimension_values, keys, filters, rows) -> int:
+    """
+    Upper bound of the number of groups of keys: the product of their
+    distinct values (narrowed by ==, in and date range filters), at most
+    the number of rows.
+    """
+    estimate = 1
+    for col in keys:
+        seen = dimension_values[col]["seen"]
+        count = len(seen)
+        ranges = [(op, value) for c, op, value in filters if c == col and op in (">=", "<=")]
+        if ranges:
+            count = sum(all(v >= bound if op == ">=" else v <= bound for op, bound in ranges) for v in seen)
+        for c, op, value in filters:
+            if c == col and op == "==":
+                count = min(count, 1)
+            elif c == col and op == "in":
+                count = min(count, len(value))
+        estimate *= max(count, 1)
+        if estimate >= rows:
+            break
+    return min(estimate, rows)
+
+
+def parse_aggregate_spec(df, params, dimension_values=None) -> dict:
+    """
+    Validate the model's params against the whitelists and the dataset's
+    columns. Returns the group-by columns, the metric parts, and the backend
+    filters; raises AggregateSpecError with a message meant for the model.
+    dimension_values is the dataset's build_dimension_values() index.
+    """
+    if dimension_values is None:
+        dimension_values = build_dimension_values(df)
+    group_by = [str(d).lower() for d in _as_list(params.get("group_by"))]
+    unknown = [d for d in group_by if d not in DIMENSIONS or DIMENSIONS[d] not in df.columns]
+    if unknown:
+        raise AggregateSpecError(
+            f"Unknown group_by dimension(s) {unknown}; use {[d for d, c in DIMENSIONS.items() if c in df.columns]}."
+        )
+    if len(group_by) > MAX_GROUP_BY:
+        raise AggregateSpecError(f"At most {MAX_GROUP_BY} group_by dimensions are allowed.")
+    group_by = list(dict.fromkeys(group_by))
+
+    metrics = {}
+    for name in [str(m).lower() for m in _as_list(params.get("metrics"))] or ["mentions"]:
+        parts = [(agg, col) for agg, col in METRICS.get(name, []) if col is None or col in df.columns]
+        if not parts:
+            raise AggregateSpecError(
+                f"Unknown metric {name!r}; use {[m for m in METRICS if m == 'mentions' or METRICS[m][0][1] in df.columns]}."
+            )
+        metrics[name] = parts
+
+    filters = []
+    for f in _as_list(params.get("filters")):
+        dimension = str(f.get("dimension") or "").lower()
+        op = str(f.get("op") or "==").lower()
+        values = _as_list(f.get("values")) + _as_list(f.get("value"))
+        if dimension not in DIMENSIONS or DIMENSIONS[dimension] not in df.columns or dimension == "date":
+            raise AggregateSpecError(
+                f"Cannot filter on {dimension!r}; use start_date/end_date for dates."
+                if dimension == "date" else f"Unknown filter dimension {dimension!r}."
+            )
+        if op not in FILTER_OPS:
+            raise AggregateSpecError(f"Unknown filter op {op!r}; use one of {list(FILTER_OPS)}.")
+        if not values:
+            raise AggregateSpecError(f"Filter on {dimension!r} has no value.")
+
+        col = DIMENSIONS[dimension]
+        if op == "contains":
+            filters.append((col, op, str(values[0])))
+            continue
+        values = _resolve_values(dimension_values[col], [str(v) for v in values])
+        if op in ("==", "!=") and len(values) > 1:
+            op = "in" if op == "==" else "not in"
+        filters.append((col, op, values[0] if op in ("==", "!=") else values))
+
+    date_col = DIMENSIONS["date"]
+    for key, op in (("start_date", ">="), ("end_date", "<=")):
+        date = _parse_date(params.get(key))
+        if date and date_col in df.columns:
+            filters.append((date_col, op, date))
+
+    return {"group_by": group_by, "metrics": metrics, "filters": filters}
+
+
+def aggregate_data(
+    df,
+    params,
+    backend=None,
+    dimension_values=None,
+    default_limit: int = DEFAULT_LIMIT,
+    max_limit: int = MAX_LIMIT,
+    max_groups: int = MAX_GROUPS,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> dict:
+    """
+    Run a small aggregation described by params:
+      - group_by: up to 3 of brand, sentiment, channel, site, label, type, date
+      - metrics: any of mentions (default), engagement, reactions, comments,
+        shares, views, sites (distinct sites), posts (distinct posts)
+      - filters: [{dimension, op, value | values}], op one of ==, !=, in,
+        not in, contains; values are matched ignoring case and diacritics
+      - start_date, end_date: date range (inclusive)
+      - sort: metric to sort by, descending (default: the first metric, or
+        chronological when grouping by date only)
+      - limit: number of groups returned (default 20, max 100)
+
+    Returns the groups as a list of flat rows plus the total number of
+    groups, or {"Error": ...} if the spec is invalid, could return more
+    than max_groups groups, or the query takes longer than `timeout`
+    seconds (waiting for a worker included).
+    """
+    if dimension_values is None:
+        dimension_values = build_dimension_values(df)
+    try:
+        spec = parse_aggregate_spec(df, params, dimension_values)
+    except AggregateSpecError as e:
+        return {"Error": str(e)}
+
+    group_by, metrics, filters = spec["group_by"], spec["metrics"], spec["filters"]
+    keys = [DIMENSIONS[d] for d in group_by]
+    parts = {
+        f"{name}.{i}": part
+        for name, name_parts in metrics.items()
+        for i, part in enumerate(name_parts)
+    }
+
+    estimate = estimate_groups(dimension_values, keys, filters, len(df))
+    if estimate > max_groups:
+        return {"Error": f"This aggregation could return up to {estimate} groups; group by fewer dimensions or filter them."}
+    if backend is None:
+        backend = make_backend(df)
+
+    deadline = time.monotonic() + timeout
+    if not _workers.acquire(timeout=timeout):
+        logger.warning(f"aggregate found no free worker within {timeout}s: {params}")
+        return {"Error": "Too many aggregations are still running; try again shortly."}
+    future = _executor.submit(backend.group_aggregate, keys, parts, filters)
+    future.add_done_callback(lambda _: _workers.release())
+    try:
+        result = future.result(timeout=max(deadline - time.monotonic(), 0))
+    except TimeoutError:
+        backend.interrupt()
+        logger.warning(f"aggregate timed out after {timeout}s: {params}")
+        return {"Error": f"The aggregation took longer than {timeout:g}s; add filters or fewer group_by dimensions."}
+
+    table = result[keys].rename(columns=dict(zip(keys, group_by)))
+    for name, name_parts in metrics.items():
+        table[name] = sum(result[f"{name}.{i}"] for i in range(len(name_parts)))
+
+    sort = str(params.get("sort") or "").lower()
+    if sort in metrics:
+        table = table.sort_values(sort, ascending=False, kind="stable")
+    elif group_by != ["date"]:
+        table = table.sort_values(next(iter(metrics)), ascending=False, kind="stable")
+    limit = min(max(_int_param(params, "limit", default_limit), 1), max_limit)
+
+    rows = []
+    for row in table.head(limit).itertuples(index=False):
+        rows.append({
+            name: (str(value) if name in group_by else value.item() if hasattr(value, "item") else value)
+            for name, value in zip(table.columns, row)
+        })
+
+    return {
+        "GroupBy": group_by,
+        "Metrics": list(metrics),
+        "Filters": [
+            {"Column": col, "Op": op, "Value": [str(v) for v in value] if isinstance(value, list) else str(value)}
+            for col, op, value in filters
+        ],
+        "TotalGroups": int(len(table)),
+        "Truncated": bool(len(table) > limit),
+        "Rows": rows,
+    }
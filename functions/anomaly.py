@@ -0,0 +1,197 @@
+# functions/anomaly.py
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from .functions import _int_param, _top_k_per_group
+from .search import _parse_date
+from .timeseries import build_daily_series
+
+
+def rolling_zscores(counts, window=14, min_periods=7):
+    """
+    Z-scores of daily counts (keys x days) against a trailing baseline: the
+    mean and standard deviation of the previous `window` days, counted from
+    each key's first day with mentions. The standard deviation is floored at
+    sqrt(mean) (the Poisson noise level, at least 1) so flat, quiet series do
+    not flag every small bump. Days with fewer than min_periods baseline days
+    get a z-score of 0.
+
+    Returns (zscores, baseline means), both keys x days.
+    """
+    counts = counts.astype(np.float64)
+    n_keys, n_days = counts.shape
+    zeros = np.zeros((n_keys, 1))
+    csum = np.hstack([zeros, counts.cumsum(axis=1)])
+    csq = np.hstack([zeros, (counts ** 2).cumsum(axis=1)])
+
+    t = np.arange(n_days)
+    lo = np.maximum(t - window, 0)
+    total = csum[:, t] - csum[:, lo]
+    total_sq = csq[:, t] - csq[:, lo]
+
+    # Baseline length: days since the key's first mention, capped at window
+    active = counts > 0
+    first = np.where(active.any(axis=1), active.argmax(axis=1), n_days)
+    n = np.clip(np.minimum(t[None, :] - first[:, None], window), 0, None).astype(np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(n > 0, total / n, 0.0)
+        var = np.where(n > 0, total_sq / n - mean ** 2, 0.0)
+    std = np.maximum(np.sqrt(np.clip(var, 0, None)), np.sqrt(np.maximum(mean, 1.0)))
+    z = np.where(n >= min_periods, (counts - mean) / std, 0.0)
+    return z, mean
+
+
+def _find_anomalies(series, breakdown, window, min_periods, threshold, min_mentions, direction, start, end):
+    keys, counts = series.daily_counts(breakdown)
+    if not keys:
+        return []
+
+    # Day range to report, clamped to the data; nothing when it misses it
+    first_day, last_day = 0, counts.shape[1] - 1
+    if start:
+        first_day = max(series.day_of(start), first_day)
+    if end:
+        last_day = min(series.day_of(end), last_day)
+    if first_day > last_day:
+        return []
+
+    z, mean = rolling_zscores(counts, window, min_periods)
+
+    flagged = np.zeros(z.shape, dtype=bool)
+    if direction in ("up", "both"):
+        flagged |= (z >= threshold) & (counts >= min_mentions)
+    if direction in ("down", "both"):
+        flagged |= (z <= -threshold) & (mean >= min_mentions)
+    flagged[:, :first_day] = False
+    flagged[:, last_day + 1:] = False
+
+    rows, days = np.nonzero(flagged)
+    return [
+        (keys[r], d, int(counts[r, d]), float(mean[r, d]), float(z[r, d]))
+        for r, d in zip(rows, days)
+    ]
+
+
+def detect_spikes_data(
+    df,
+    params,
+    index=None,
+    site_col: str = "SiteName",
+    channel_col: str = "ChannelDeep",
+    sentiment_col: str = "Sentiment",
+    url_col: str = "UrlTopic",
+    title_col: str = "Title",
+    window: int = 14,
+    min_periods: int = 7,
+    threshold: float = 3.0,
+    min_mentions: int = 5,
+    default_limit: int = 10,
+    top_n: int = 5,
+) -> dict:
+    """
+    Find the days on which a brand's (or a brand's channel's) mentions
+    deviate from their trailing baseline. params:
+      - brand: only look at this brand
+      - start_date, end_date: only report anomalies in this range
+      - level: "brand", "channel" or "both" (default)
+      - direction: "up" (spikes, default), "down" (drops) or "both"
+      - threshold: z-score threshold (default 3)
+      - window: baseline length in days (default 14)
+      - limit: maximum number of anomalies returned (largest |z| first)
+
+    Counts come from the DailySeries index; only the rows of the returned
+    days are read, to list their top sites and posts.
+    """
+    series = index if index is not None else build_daily_series(df)
+    if series.first_day is None:
+        return {"Anomalies": []}
+
+    level = str(params.get("level") or "both").lower()
+    direction = str(params.get("direction") or "up").lower()
+    if direction not in ("up", "down", "both"):
+        direction = "up"
+    try:
+        threshold = float(params.get("threshold") or threshold)
+    except (TypeError, ValueError):
+        pass
+    window = max(_int_param(params, "window", window), 2)
+    limit = max(_int_param(params, "limit", default_limit), 1)
+    min_periods = min(min_periods, window)
+    start = _parse_date(params.get("start_date"))
+    end = _parse_date(params.get("end_date"))
+
+    found = []
+    if level in ("brand", "both"):
+        found += [
+            (key, None, d, c, m, z)
+            for key, d, c, m, z in _find_anomalies(
+                series, "brand", window, min_periods, threshold, min_mentions, direction, start, end
+            )
+        ]
+    if level in ("channel", "both"):
+        found += [
+            (key[0], key[1], d, c, m, z)
+            for key, d, c, m, z in _find_anomalies(
+                series, "channel", window, min_periods, threshold, min_mentions, direction, start, end
+            )
+        ]
+
+    brand = params.get("brand")
+    if brand:
+        found = [a for a in found if str(a[0]).lower() == str(brand).lower()]
+    total_found = len(found)
+    found = sorted(found, key=lambda a: abs(a[5]), reverse=True)[:limit]
+
+    # Rows of every reported (brand, day), read with a single take and
+    # summarised with one grouped top-k per detail
+    dates = [(series.first_day + pd.Timedelta(days=int(a[2]))).date() for a in found]
+    positions = [series.rows_of(a[0], date) for a, date in zip(found, dates)]
+    cols = [site_col, channel_col, sentiment_col, url_col, title_col]
+    rows = df.iloc[np.concatenate(positions + [np.empty(0, dtype=np.int64)]), [df.columns.get_loc(c) for c in cols]]
+    rows = rows.assign(Anomaly=np.repeat(np.arange(len(found)), [len(p) for p in positions]))
+    channels = np.array([a[1] for a in found], dtype=object)[rows["Anomaly"].to_numpy()]
+    rows = rows[pd.isna(channels) | (rows[channel_col].to_numpy() == channels)]
+
+    sentiments = defaultdict(dict)
+    for (i, sentiment), n in rows.groupby(["Anomaly", sentiment_col]).size().items():
+        sentiments[i][str(sentiment)] = int(n)
+    top_sites = defaultdict(list)
+    sites = rows.groupby(["Anomaly", site_col]).size().reset_index(name="Mentions")
+    for i, site, n in _top_k_per_group(sites, ["Anomaly"], "Mentions", top_n).itertuples(index=False):
+        top_sites[i].append({"SiteName": str(site), "Mentions": int(n)})
+    top_posts = defaultdict(list)
+    posts = rows.groupby(["Anomaly", url_col, title_col], dropna=False).size().reset_index(name="Mentions")
+    for i, url, title, n in _top_k_per_group(posts, ["Anomaly"], "Mentions", top_n).itertuples(index=False):
+        top_posts[i].append({
+            "UrlTopic": str(url) if pd.notnull(url) else "",
+            "Title": str(title) if pd.notnull(title) else "",
+            "Mentions": int(n),
+        })
+
+    anomalies = []
+    for i, ((b, channel, day, count, mean, z), date) in enumerate(zip(found, dates)):
+        anomaly = {
+            "Topic": str(b),
+            "Date": str(date),
+            "Direction": "up" if z > 0 else "down",
+            "Mentions": count,
+            "Baseline": round(mean, 2),
+            "ZScore": round(z, 2),
+            "Sentiment": sentiments[i],
+            "TopSites": top_sites[i],
+            "TopPosts": top_posts[i],
+        }
+        if channel is not None:
+            anomaly["ChannelDeep"] = str(channel)
+        anomalies.append(anomaly)
+
+    return {
+        "WindowDays": window,
+        "Threshold": threshold,
+        "TotalAnomalies": total_found,
+        "Anomalies": anomalies,
+    }
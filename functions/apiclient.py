@@ -0,0 +1,45 @@
+# functions/apiclient.py
+
+import requests
+
+
+class InsightAPIClient:
+    """
+    Minimal client for the headless API in server.py, used by the Streamlit
+    app when INSIGHT_API_URL is set.
+    """
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, **kwargs):
+        response = requests.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def upload_dataset(self, file_name, raw: bytes) -> dict:
+        return self._request("POST", "/datasets", files={"file": (file_name, raw)})
+
+    def append_dataset(self, dataset_id, file_name, raw: bytes) -> dict:
+        return self._request("POST", f"/datasets/{dataset_id}/append", files={"file": (file_name, raw)})
+
+    def register_dataset(self, path, name=None) -> dict:
+        return self._request("POST", "/datasets/register", json={"path": path, "name": name})
+
+    def list_datasets(self) -> list:
+        return self._request("GET", "/datasets")
+
+    def run_tool(self, dataset_id, tool_name, params=None, compare_with=None):
+        return self._request(
+            "POST", f"/datasets/{dataset_id}/tools/{tool_name}", json=params or {},
+            params={"compare_with": list(compare_with or [])},
+        )
+
+    def create_session(self, dataset_id, compare_with=None) -> str:
+        body = {"dataset_id": dataset_id, "compare_with": list(compare_with or [])}
+        return self._request("POST", "/sessions", json=body)["session_id"]
+
+    def send_message(self, session_id, prompt, dataset_id=None) -> str:
+        body = {"prompt": prompt, "dataset_id": dataset_id}
+        return self._request("POST", f"/sessions/{session_id}/messages", json=body)["text"]
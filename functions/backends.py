@@ -0,0 +1,255 @@
+# functions/backends.py
+#
+# Execution backends for the group-by aggregations behind the tools. Both
+# backends run over the same formatted DataFrame and return identical
+# results (same columns, dtypes, row order), nulls included; see
+# tests/test_backends.py for the parity tests and `python bench.py backends`
+# for timings.
+#
+# The whole-dataset group-bys of get_daily_detail, brand_health_overview,
+# get_top_post_details and aggregate run on the backend. The tools that
+# group small per-brand / per-channel subsets to pick random samples of
+# comments (channel, sentiment and label details) stay on pandas: their
+# cost is in the sampling, not the group-bys.
+
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Backend used for new datasets: "pandas" (default) or "duckdb"
+DEFAULT_BACKEND = os.environ.get("INSIGHT_BACKEND", "pandas")
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+
+# Filter operators accepted in (column, op, value) filters
+FILTER_OPS = ("==", "!=", "in", "not in", ">", ">=", "<", "<=", "contains")
+
+
+class PandasBackend:
+    """Aggregations with pandas groupby."""
+
+    name = "pandas"
+
+    def __init__(self, df):
+        self.df = df
+
+    def _filtered(self, filters):
+        df = self.df
+        if not filters:
+            return df
+        mask = np.ones(len(df), dtype=bool)
+        for col, op, value in filters:
+            series = df[col]
+            if op == "==":
+                cond = series == value
+            elif op == "!=":
+                cond = (series != value) & series.notna()
+            elif op == "in":
+                cond = series.isin(list(value))
+            elif op == "not in":
+                cond = ~series.isin(list(value)) & series.notna()
+            elif op == ">":
+                cond = series > value
+            elif op == ">=":
+                cond = series >= value
+            elif op == "<":
+                cond = series < value
+            elif op == "<=":
+                cond = series <= value
+            elif op == "contains":
+                cond = series.astype("string").str.contains(str(value), case=False, regex=False).fillna(False)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            mask &= np.asarray(cond, dtype=bool)
+        return df[mask]
+
+    def group_aggregate(self, keys, metrics, filters=None, dropna=True) -> pd.DataFrame:
+        """
+        Group rows by `keys` and compute `metrics`, a dict of output name ->
+        (agg, column) where agg is "size" (rows, column ignored), "count"
+        (non-null values), "sum" or "nunique". Rows with a missing key are
+        dropped, or with dropna=False grouped together (sorted last).
+        Returns one row per group, sorted by the keys.
+        """
+        df = self._filtered(filters)
+        if not keys:
+            row = {out: [_scalar_agg(df, agg, col)] for out, (agg, col) in metrics.items()}
+            return pd.DataFrame(row)
+        named = {
+            out: (keys[0], "size") if agg == "size" else (col, agg)
+            for out, (agg, col) in metrics.items()
+        }
+        return df.groupby(keys, dropna=dropna).agg(**named).reset_index()
+
+    def sentiment_breakdown(self, keys, sentiment_col="Sentiment", filters=None) -> pd.DataFrame:
+        """
+        Rows per `keys` ('mention_count', rows without a sentiment included)
+        and one count column per sentiment (Positive, Neutral, Negative).
+        """
+        df = self._filtered(filters)
+        mention_count = df.groupby(keys).size()
+        counts = df.groupby(keys + [sentiment_col]).size().unstack(sentiment_col, fill_value=0)
+        counts = counts.reindex(index=mention_count.index, columns=SENTIMENTS, fill_value=0).astype("int64")
+        counts['mention_count'] = mention_count
+        counts.columns.name = None
+        return counts.reset_index()
+
+    def interrupt(self):
+        """pandas operations cannot be interrupted; a timed-out query runs to completion."""
+
+
+def _scalar_agg(df, agg, col):
+    if agg == "size":
+        return len(df)
+    return getattr(df[col], agg)()
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class DuckDBBackend:
+    """
+    The same aggregations as SQL on an in-process DuckDB connection. The
+    frame is converted to an Arrow table once, when the backend is built
+    (string columns are already Arrow-backed, so this is cheap); scanning
+    the DataFrame directly would re-convert its object columns on every
+    query. Results are converted back to the dtypes the pandas backend
+    returns. Queries DuckDB cannot run (e.g. an object column mixing types)
+    fall back to pandas.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, df):
+        import duckdb
+        import pyarrow as pa
+
+        self.df = df
+        self.con = duckdb.connect()
+        self._interrupted_error = duckdb.InterruptException
+        # A connection runs one query at a time
+        self._lock = threading.Lock()
+        try:
+            self.con.register("data", pa.Table.from_pandas(df, preserve_index=False))
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.warning(f"Arrow conversion failed, DuckDB will scan the DataFrame: {e}")
+            self.con.register("data", df)
+        self._pandas = PandasBackend(df)
+
+    def _where(self, keys, filters):
+        """WHERE clause dropping rows with a missing key and applying the filters."""
+        clauses = [f"{_quote(k)} IS NOT NULL" for k in keys]
+        params = []
+        for col, op, value in filters or []:
+            if op not in FILTER_OPS:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if op in ("in", "not in"):
+                values = list(value)
+                if not values:
+                    clauses.append("FALSE" if op == "in" else f"{_quote(col)} IS NOT NULL")
+                    continue
+                clauses.append(f"{_quote(col)} {op.upper()} ({', '.join('?' * len(values))})")
+                params += values
+            elif op == "contains":
+                clauses.append(f"contains(lower(CAST({_quote(col)} AS VARCHAR)), ?)")
+                params.append(str(value).lower())
+            else:
+                clauses.append(f"{_quote(col)} {'=' if op == '==' else op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self.con.execute(sql, params).df()
+
+    def interrupt(self):
+        """Abort the running query (it raises in the thread that runs it)."""
+        self.con.interrupt()
+
+    def _restore_dtypes(self, result, keys):
+        """Give key columns the Python/pandas types the pandas backend returns."""
+        for k in keys:
+            source = self.df[k]
+            if source.dtype == object and pd.api.types.is_datetime64_any_dtype(result[k]):
+                result[k] = result[k].dt.date.astype(object)
+            elif source.dtype != result[k].dtype and source.dtype != object:
+                result[k] = result[k].astype(source.dtype)
+            elif source.dtype == object:
+                result[k] = result[k].astype(object)
+        return result
+
+    def group_aggregate(self, keys, metrics, filters=None, dropna=True) -> pd.DataFrame:
+        select = []
+        for out, (agg, col) in metrics.items():
+            if agg == "size":
+                expr = "COUNT(*)"
+            elif agg == "count":
+                expr = f"COUNT({_quote(col)})"
+            elif agg == "sum":
+                expr = f"COALESCE(SUM({_quote(col)}), 0)"
+            elif agg == "nunique":
+                expr = f"COUNT(DISTINCT {_quote(col)})"
+            else:
+                raise ValueError(f"Unsupported aggregation: {agg}")
+            select.append(f"{expr} AS {_quote(out)}")
+
+        # NULL keys form one group, sorted last (NULLS LAST), as in pandas
+        where, params = self._where(keys if dropna else [], filters)
+        key_list = ", ".join(_quote(k) for k in keys)
+        sql = f"SELECT {key_list + ', ' if keys else ''}{', '.join(select)} FROM data{where}"
+        if keys:
+            sql += f" GROUP BY {key_list} ORDER BY {', '.join(_quote(k) + ' NULLS LAST' for k in keys)}"
+        try:
+            result = self._query(sql, params)
+        except self._interrupted_error:
+            raise
+        except Exception as e:
+            logger.warning(f"DuckDB aggregation failed, using pandas: {e}")
+            return self._pandas.group_aggregate(keys, metrics, filters, dropna)
+
+        for out, (agg, col) in metrics.items():
+            if agg == "sum" and not pd.api.types.is_integer_dtype(self.df[col]):
+                result[out] = result[out].astype("float64")
+            else:
+                result[out] = result[out].astype("int64")
+        return self._restore_dtypes(result, keys)
+
+    def sentiment_breakdown(self, keys, sentiment_col="Sentiment", filters=None) -> pd.DataFrame:
+        counts = ", ".join(
+            f"COUNT(*) FILTER (WHERE {_quote(sentiment_col)} = '{s}') AS {_quote(s)}" for s in SENTIMENTS
+        )
+        # Rows without a sentiment count in mention_count only
+        where, params = self._where(keys, filters)
+        key_list = ", ".join(_quote(k) for k in keys)
+        sql = (
+            f"SELECT {key_list}, {counts}, COUNT(*) AS mention_count FROM data{where} "
+            f"GROUP BY {key_list} ORDER BY {key_list}"
+        )
+        try:
+            result = self._query(sql, params)
+        except self._interrupted_error:
+            raise
+        except Exception as e:
+            logger.warning(f"DuckDB aggregation failed, using pandas: {e}")
+            return self._pandas.sentiment_breakdown(keys, sentiment_col, filters)
+
+        for col in SENTIMENTS + ["mention_count"]:
+            result[col] = result[col].astype("int64")
+        return self._restore_dtypes(result, keys)
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+def make_backend(df, name=None):
+    """Backend `name` (default INSIGHT_BACKEND) over the formatted DataFrame."""
+    return BACKENDS[name or DEFAULT_BACKEND](df)
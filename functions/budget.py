@@ -0,0 +1,99 @@
+# functions/budget.py
+#
+# Per-turn budget of the function-calling loop: tool calls, wall-clock time
+# and bytes of tool results sent back to the model. Once half of any of
+# them is spent, tools are called for brief output (smaller samples and
+# limits); once one is used up, the model is told to answer with what it
+# already has.
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_TOOL_CALLS = int(os.environ.get("INSIGHT_TURN_MAX_TOOL_CALLS", 8))
+MAX_TURN_SECONDS = float(os.environ.get("INSIGHT_TURN_MAX_SECONDS", 120))
+MAX_PAYLOAD_BYTES = int(os.environ.get("INSIGHT_TURN_MAX_PAYLOAD_BYTES", 400_000))
+# Share of the budget after which tools return brief output
+BRIEF_AT = 0.5
+
+# Tool -> size params used for brief output; the model's own values are
+# kept when they are smaller. Paged tools are left out: their summaries are
+# already bounded (pagination.py), and smaller params would miss the
+# precomputed results.
+BRIEF_PARAMS = {
+    "get_top_post_details": {"top_n": 5, "max_comments": 5},
+    "get_channel_detail": {"max_sites": 5, "max_posts_per_site": 2},
+    "get_brand_sentiment_detail": {"max_comments_per_sentiment": 10},
+    "search_mentions": {"limit": 5},
+    "detect_spikes": {"limit": 5},
+    "aggregate": {"limit": 10},
+}
+
+BRIEF_NOTE = "Over half of this turn's budget is spent, so results are brief; answer soon."
+EXHAUSTED_NOTE = (
+    "This turn's tool budget is used up and the tool was not run. "
+    "Answer now with the data you already have, and say what is missing."
+)
+
+
+def _brief_value(value, brief):
+    try:
+        return min(int(value), brief) if value not in (None, "") else brief
+    except (TypeError, ValueError):
+        return brief
+
+
+class TurnBudget:
+    """Tool calls, seconds and result bytes one chat turn may spend."""
+
+    def __init__(self, max_tool_calls=MAX_TOOL_CALLS, max_seconds=MAX_TURN_SECONDS, max_payload_bytes=MAX_PAYLOAD_BYTES):
+        self.max_tool_calls = max_tool_calls
+        self.max_seconds = max_seconds
+        self.max_payload_bytes = max_payload_bytes
+        self.started = time.perf_counter()
+        self.tool_calls = 0
+        self.payload_bytes = 0
+        self.brief_calls = 0
+        self.refused_calls = 0
+
+    def charge(self, result) -> int:
+        """Count one tool call and the JSON size of its result; returns the size."""
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+        self.tool_calls += 1
+        self.payload_bytes += size
+        return size
+
+    def spent(self) -> float:
+        """Largest spent share of the three limits (1.0 = used up)."""
+        return max(
+            self.tool_calls / self.max_tool_calls if self.max_tool_calls else 0.0,
+            (time.perf_counter() - self.started) / self.max_seconds if self.max_seconds else 0.0,
+            self.payload_bytes / self.max_payload_bytes if self.max_payload_bytes else 0.0,
+        )
+
+    def brief(self) -> bool:
+        return self.spent() >= BRIEF_AT
+
+    def exhausted(self) -> bool:
+        return self.spent() >= 1.0
+
+    def brief_params(self, name, params) -> dict:
+        """params with the tool's size params capped for brief output."""
+        brief = BRIEF_PARAMS.get(name)
+        if not brief:
+            return params
+        self.brief_calls += 1
+        return dict(params, **{key: _brief_value(params.get(key), value) for key, value in brief.items()})
+
+    def status(self) -> dict:
+        return {
+            "ToolCalls": self.tool_calls,
+            "Seconds": round(time.perf_counter() - self.started, 2),
+            "PayloadBytes": self.payload_bytes,
+            "Spent": round(self.spent(), 2),
+            "BriefCalls": self.brief_calls,
+            "RefusedCalls": self.refused_calls,
+        }
@@ -0,0 +1,221 @@
+# functions/callpolicy.py
+#
+# Deadlines, retries and hedged requests around the model round-trips. A
+# request is made as independent attempts (run_chat_turn runs each on a
+# fork of the chat session), so an attempt that is abandoned after its
+# deadline, or that loses to a hedged duplicate, never changes the
+# conversation. Every attempt holds a slot of the concurrency limiter until
+# it returns, abandoned or not, so attempts never exceed the limit.
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds an attempt may take before it is abandoned
+LLM_TIMEOUT = float(os.environ.get("INSIGHT_LLM_TIMEOUT", 60))
+# Attempts after the first one on timeouts and retryable errors
+LLM_RETRIES = int(os.environ.get("INSIGHT_LLM_RETRIES", 2))
+# Send a duplicate attempt once the first one is slower than this
+# percentile of recent latencies, e.g. 95 (unset: no hedging)
+LLM_HEDGE_PERCENTILE = os.environ.get("INSIGHT_LLM_HEDGE_PERCENTILE")
+
+# Names of google.api_core exceptions worth another attempt: overload,
+# rate limits and transient server errors
+RETRYABLE_API_ERRORS = [
+    "TooManyRequests",
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "BadGateway",
+    "GatewayTimeout",
+    "DeadlineExceeded",
+    "Aborted",
+]
+
+# Attempts run here so they can be abandoned; an abandoned attempt keeps its
+# thread (and its limiter slot) until the SDK call returns
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+class ModelCallTimeout(TimeoutError):
+    """A model request that did not answer within the deadline."""
+
+
+def retryable_errors() -> tuple:
+    """Exception types a new attempt may fix (the Google API ones if installed)."""
+    errors = [ModelCallTimeout, ConnectionError]
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return tuple(errors)
+    return tuple(errors + [getattr(exceptions, name) for name in RETRYABLE_API_ERRORS if hasattr(exceptions, name)])
+
+
+def _timed(attempt):
+    started = time.perf_counter()
+    result = attempt()
+    return result, time.perf_counter() - started
+
+
+class CallPolicy:
+    """
+    Runs attempt() with a per-attempt deadline (`timeout` seconds), retries
+    timeouts and retryable errors up to `retries` times with exponential
+    backoff and full jitter, and optionally hedges: when an attempt is
+    slower than the `hedge_percentile` of recent latencies, a duplicate is
+    sent and the first successful answer wins. Hedging starts once
+    `hedge_min_samples` latencies are known.
+
+    With a limiter, every attempt waits for a slot before it is sent (the
+    deadline starts once it has one) and holds it until it returns. A
+    duplicate is only sent if a slot is free right away.
+    """
+
+    def __init__(
+        self,
+        timeout=LLM_TIMEOUT,
+        retries=LLM_RETRIES,
+        backoff=1.0,
+        max_backoff=20.0,
+        hedge_percentile=LLM_HEDGE_PERCENTILE,
+        hedge_min_samples=20,
+        history=500,
+        seed=None,
+    ):
+        self.timeout = float(timeout)
+        self.retries = max(int(retries), 0)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = float(hedge_percentile) if hedge_percentile not in (None, "") else None
+        self.hedge_min_samples = hedge_min_samples
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=history)
+        self._counts = {
+            "calls": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+            "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "failures": 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def hedge_delay(self):
+        """Seconds after which a duplicate attempt is sent, or None."""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            return float(np.percentile(self._latencies, self.hedge_percentile))
+
+    def backoff_delay(self, retry) -> float:
+        """Full jitter: uniform in [0, min(max_backoff, backoff * 2**retry)]."""
+        return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    @staticmethod
+    def _submit(attempt, limiter, on_wait=None, wait_for_slot=True):
+        """
+        Run attempt on the executor holding a slot of limiter until it
+        returns; None if wait_for_slot is False and no slot is free.
+        """
+        if limiter is not None:
+            if wait_for_slot:
+                limiter.acquire(on_wait)
+            elif not limiter.try_acquire():
+                return None
+        try:
+            future = _executor.submit(_timed, attempt)
+        except BaseException:
+            if limiter is not None:
+                limiter.release()
+            raise
+        if limiter is not None:
+            future.add_done_callback(lambda _: limiter.release())
+        return future
+
+    def _attempt(self, attempt, limiter=None, on_wait=None):
+        """One deadline-bounded attempt, possibly hedged with a duplicate."""
+        first = self._submit(attempt, limiter, on_wait)
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        hedge_delay = self.hedge_delay()
+        pending = {first}
+        hedged = False
+        error = None
+        self._count("attempts")
+
+        while pending:
+            until = deadline if hedged or hedge_delay is None else min(deadline, started + hedge_delay)
+            done, pending = wait(pending, timeout=max(until - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    # The other attempt of a hedged pair may still succeed
+                    error = future.exception()
+                    continue
+                result, seconds = future.result()
+                with self._lock:
+                    self._latencies.append(seconds)
+                if future is not first:
+                    self._count("hedge_wins")
+                return result
+            if not pending:
+                break
+            if time.perf_counter() >= deadline:
+                self._count("timeouts")
+                raise ModelCallTimeout(f"The model did not answer within {self.timeout:g}s")
+            if not done and not hedged:
+                hedged = True
+                duplicate = self._submit(attempt, limiter, wait_for_slot=False)
+                if duplicate is None:
+                    # Every slot is busy; the first attempt has the deadline left
+                    self._count("hedges_skipped")
+                else:
+                    self._count("hedges")
+                    pending.add(duplicate)
+        raise error
+
+    def call(self, attempt, limiter=None, on_wait=None):
+        """
+        Result of the first successful attempt; raises the last error if all
+        fail. Attempts take slots of `limiter`, if given; on_wait(position)
+        is called while one waits for a slot (see ConcurrencyLimiter.acquire).
+        """
+        self._count("calls")
+        retryable = retryable_errors()
+        for retry in range(self.retries + 1):
+            try:
+                return self._attempt(attempt, limiter, on_wait)
+            except retryable as e:
+                if retry == self.retries:
+                    self._count("failures")
+                    raise
+                delay = self.backoff_delay(retry)
+                self._count("retries")
+                logger.warning(f"Model call failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception:
+                self._count("failures")
+                raise
+
+    def stats(self) -> dict:
+        """Counters and latencies (seconds) of recent successful attempts."""
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=float)
+            stats = dict(self._counts)
+        stats["latency_p50"] = float(np.percentile(latencies, 50)) if len(latencies) else 0.0
+        stats["latency_p95"] = float(np.percentile(latencies, 95)) if len(latencies) else 0.0
+        stats["hedge_after"] = self.hedge_delay()
+        return stats
+
+
+# Shared by every chat session of the process
+LLM_POLICY = CallPolicy()
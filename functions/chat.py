@@ -0,0 +1,237 @@
+# functions/chat.py
+
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from .budget import BRIEF_NOTE, EXHAUSTED_NOTE, TurnBudget
+from .callpolicy import LLM_POLICY
+from .limiter import LLM_LIMITER
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = "hybrid-autonomy-445719-q2"
+MODEL_NAME = "gemini-1.5-pro-002"
+# Faster model for simple lookups (see router.py)
+FAST_MODEL_NAME = os.environ.get("INSIGHT_FAST_MODEL", "gemini-1.5-flash-002")
+
+INSIGHT_INSTRUCTION = """
+    You are a social media listening insight writer. Based on the information provided by the function's responses, generate actionable and well-articulated insights
+    """
+
+LOOKUP_INSTRUCTION = """
+    Answer the question directly and briefly, with the figures from the function's responses
+    """
+
+
+def _import_chat_sdk():
+    try:
+        import vertexai.generative_models  # noqa: F401
+        from . import functiondeclarations  # noqa: F401
+    except Exception as e:
+        logger.warning(f"Background import of the Vertex AI SDK failed: {e}")
+
+
+def preload_chat_sdk() -> threading.Thread:
+    """
+    Import the Vertex AI SDK and build the FunctionDeclarations on a
+    background thread (they take seconds to import), so the UI can render
+    first. A later import of the same modules waits for this one to finish.
+    """
+    thread = threading.Thread(target=_import_chat_sdk, name="preload-chat-sdk", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_vertexai(project_id=PROJECT_ID, credentials_json=None):
+    """
+    Initialize Vertex AI. If a service-account JSON string is given it is
+    written to a temporary file and exported as GOOGLE_APPLICATION_CREDENTIALS,
+    otherwise the environment's default credentials are used.
+    """
+    if credentials_json:
+        credentials_dict = json.loads(credentials_json)
+        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
+            json.dump(credentials_dict, temp_file)
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_file.name
+
+    import vertexai
+    vertexai.init(project=project_id)
+
+
+def create_chat_model(function_declarations, model_name=MODEL_NAME, system_instruction=None, tool_calling=True):
+    """
+    Build the Gemini model with the insight tools attached (and a system
+    instruction, e.g. the dataset digest). With tool_calling=False the tools
+    are declared (the history may hold calls to them) but the model can only
+    answer with text.
+    """
+    from vertexai.generative_models import GenerationConfig, GenerativeModel, Tool, ToolConfig
+
+    tool_config = None
+    if not tool_calling:
+        tool_config = ToolConfig(
+            function_calling_config=ToolConfig.FunctionCallingConfig(mode=ToolConfig.FunctionCallingConfig.Mode.NONE)
+        )
+    return GenerativeModel(
+        model_name,
+        generation_config=GenerationConfig(temperature=0),
+        tools=[Tool(function_declarations=function_declarations)],
+        tool_config=tool_config,
+        system_instruction=system_instruction,
+    )
+
+
+def _fork_session(model, history):
+    """A new chat session of model starting from (a copy of) history."""
+    return model.start_chat(history=list(history))
+
+
+def run_chat_turn(
+    model,
+    chat_session,
+    prompt,
+    function_handler,
+    on_unknown_function=None,
+    on_queue=None,
+    limiter=LLM_LIMITER,
+    policy=LLM_POLICY,
+    instruction=INSIGHT_INSTRUCTION,
+    budget=None,
+    answer_model=None,
+) -> str:
+    """
+    Send the user's prompt to the LLM, handle function calls in a loop,
+    then return the final textual response. chat_session is a session of
+    `model`, which holds the conversation.
+
+    function_handler maps tool names to callables taking the call's params.
+    on_unknown_function, if given, is called with the name of any function
+    the model requests that is not in function_handler.
+
+    Requests are made under `policy` (deadline, retries, hedging); if it
+    gives up, its last error is raised. Every attempt takes a slot of
+    `limiter` (shared by all sessions of the process) until it returns;
+    on_queue(position), if given, is called while one waits for a slot.
+    `instruction` is appended to the prompt.
+
+    Tool calls are limited by `budget` (a TurnBudget, by default a new one
+    with the configured limits): past half of it, tools are called for
+    brief output; once it is used up, further calls are refused and the
+    model is asked to answer with what it has. If it calls a tool again, that
+    call is refused as well and the answer is requested from `answer_model`
+    (the same model with tool calling disabled, see create_chat_model).
+
+    The conversation never ends on an unanswered function call: when the
+    turn stops on one (unknown function, or still calling tools without an
+    answer_model), the turn is left out of the history.
+    """
+    from vertexai.generative_models import Part
+
+    if budget is None:
+        budget = TurnBudget()
+
+    turn_start = len(chat_session.history)
+
+    def send_message(content, reply_model=None):
+        # Each attempt runs on a fork of the session (of reply_model if
+        # given) and only the exchange of the attempt that answers is added
+        # to the conversation
+        history = list(chat_session.history)
+
+        def attempt():
+            fork = _fork_session(reply_model or model, history)
+            response = fork.send_message(content)
+            return response, fork.history[len(history):]
+
+        response, exchange = policy.call(attempt, limiter=limiter, on_wait=on_queue)
+        chat_session.history.extend(exchange)
+        return response
+
+    prompt += instruction
+
+    # 1. Send the user's message to the LLM
+    response = send_message(prompt)
+
+    # 2. Handle multiple function calls, if any
+    while True:
+        # Safely check if there's a function call
+        function_call = None
+        # Make sure we have a candidate with parts
+        if (response.candidates
+            and response.candidates[0].content
+            and response.candidates[0].content.parts):
+            function_call = response.candidates[0].content.parts[0].function_call
+
+        # If no function call is present, break
+        if not function_call:
+            break
+
+        # If the model wants to call a known function, handle it
+        if function_call.name in function_handler:
+            function_name = function_call.name
+            # Convert the function call arguments into a Python dict
+            params = {key: value for key, value in function_call.args.items()}
+            reply_model = None
+
+            if budget.exhausted():
+                if budget.refused_calls and (answer_model is None or budget.refused_calls > 1):
+                    # The model ignored the request to answer; stop here
+                    logger.warning(f"Turn budget exhausted, model still calls {function_name}: {budget.status()}")
+                    break
+                if budget.refused_calls:
+                    # The model ignored the request to answer; refuse this
+                    # call too and take the answer from the model without tools
+                    logger.warning(f"Turn budget exhausted, model still calls {function_name}, answering without tools")
+                    reply_model = answer_model
+                else:
+                    logger.info(f"Turn budget exhausted, asking for a final answer: {budget.status()}")
+                budget.refused_calls += 1
+                function_response = {"content": {"Error": EXHAUSTED_NOTE}}
+            else:
+                # Past half of the budget, ask the tool for brief output
+                brief = budget.brief()
+                if brief:
+                    params = budget.brief_params(function_name, params)
+
+                # Execute the local Python function
+                function_result = function_handler[function_name](params)
+                budget.charge(function_result)
+                function_response = {"content": function_result}
+                if brief:
+                    function_response["budget"] = BRIEF_NOTE
+
+            # Send that result back to the LLM as a function response
+            response = send_message(
+                Part.from_function_response(
+                    name=function_name,
+                    response=function_response,
+                ),
+                reply_model=reply_model,
+            )
+        else:
+            # The LLM requested an unknown function or something else
+            logger.warning("Unknown function call requested: %s", function_call.name)
+            if on_unknown_function:
+                on_unknown_function(function_call.name)
+            break
+
+    if function_call:
+        # The turn stopped on a function call that got no response; a
+        # conversation ending on one cannot be continued
+        logger.warning("Leaving the unanswered turn out of the chat history")
+        del chat_session.history[turn_start:]
+
+    # 3. Attempt to get final text. If the model only produced function calls,
+    #    .text might raise a ValueError.
+    try:
+        final_text = response.text
+    except ValueError:
+        if budget.exhausted():
+            final_text = "This question needed more data than one answer allows. Please ask a narrower question."
+        else:
+            final_text = "No final text was provided. The model returned only a function call."
+
+    return final_text
@@ -0,0 +1,154 @@
+# functions/comparison.py
+#
+# Comparison of datasets loaded side by side (e.g. this campaign vs the
+# last one). Every dataset gets a small summary index: mentions, engagement
+# and row counts per brand x channel x sentiment. The summaries of the
+# datasets being compared are built in parallel, and their dimension
+# columns are re-coded onto one categorical dtype per dimension, so the
+# brand / channel / sentiment names are held once for all of them and the
+# rows line up by code. The datasets' frames are never copied or
+# concatenated.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .timeseries import _change
+
+# Dimension name (tool param) -> column
+DIMENSIONS = {"brand": "Topic", "channel": "ChannelDeep", "sentiment": "Sentiment"}
+UNKNOWN = "Unknown"
+
+COMPARISON_INSTRUCTION = """
+    Other datasets are loaded for comparison with this one: {names}. Use compare_datasets for questions comparing them (e.g. this campaign vs the last one); the other tools only see this dataset
+    """
+
+# Summaries of several datasets are built at once; pandas releases the GIL
+# for most of a groupby
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="comparison")
+
+
+def build_dataset_summary(df):
+    """Mentions and Engagement per Topic x ChannelDeep x Sentiment (categorical columns)."""
+    keys = [df[col] if col in df.columns else pd.Series(UNKNOWN, index=df.index, name=col) for col in DIMENSIONS.values()]
+    engagement = df["Engagement"] if "Engagement" in df.columns else pd.Series(0, index=df.index)
+    summary = engagement.groupby(keys, dropna=False).agg(["size", "sum"]).reset_index()
+    summary.columns = list(DIMENSIONS.values()) + ["Mentions", "Engagement"]
+    # Missing values are grouped together and named once grouped
+    for col in DIMENSIONS.values():
+        summary[col] = summary[col].astype("string").fillna(UNKNOWN).astype("category")
+    return summary.groupby(list(DIMENSIONS.values()), observed=True, as_index=False).sum()
+
+
+def dataset_summaries(datasets) -> list:
+    """The summary index of every dataset, built in parallel where missing."""
+    return list(_executor.map(lambda dataset: dataset.index("summary"), datasets))
+
+
+def share_categories(summaries) -> list:
+    """
+    The summaries with each dimension re-coded onto one CategoricalDtype
+    holding the union of their values, shared by all of them.
+    """
+    summaries = [summary.copy() for summary in summaries]
+    for col in DIMENSIONS.values():
+        values = sorted(set().union(*(summary[col].cat.categories for summary in summaries)))
+        dtype = pd.CategoricalDtype(values)
+        for summary in summaries:
+            summary[col] = summary[col].astype(dtype)
+    return summaries
+
+
+def _totals(summary, col):
+    """Mentions, Engagement and net sentiment per value of col (every category, zeros included)."""
+    totals = summary.groupby(col, observed=False)[["Mentions", "Engagement"]].sum()
+    sentiment = summary.groupby([col, "Sentiment"], observed=False)["Mentions"].sum().unstack()
+    positive = sentiment["Positive"] if "Positive" in sentiment.columns else 0
+    negative = sentiment["Negative"] if "Negative" in sentiment.columns else 0
+    neutral = sentiment["Neutral"] if "Neutral" in sentiment.columns else 0
+    known = positive + negative + neutral
+    totals["NetSentiment"] = (100.0 * (positive - negative) / known.where(known > 0)).round(2)
+    return totals
+
+
+def comparison_instruction(names) -> str:
+    """System instruction telling the models which datasets can be compared."""
+    return COMPARISON_INSTRUCTION.format(names=", ".join(f"'{name}'" for name in names))
+
+
+def compare_datasets_data(
+    df,
+    params,
+    index=None,
+    others=(),
+    name="This dataset",
+) -> dict:
+    """
+    Compare this dataset (Current) with each of `others`, a list of
+    (name, summary index) (Previous). params:
+      - by: "brand" (default), "channel" or "sentiment"
+      - brand: only count this brand's mentions
+      - dataset: only compare with the datasets whose name contains this
+    Returns per compared dataset and value of `by` the mentions and
+    engagement in both datasets with the absolute and percentage change,
+    the share of mentions and, unless by sentiment, the net sentiment.
+    """
+    summary = index if index is not None else build_dataset_summary(df)
+    others = list(others)
+    if not others:
+        return {"Error": "No other dataset is loaded for comparison."}
+    wanted = str(params.get("dataset") or "").lower()
+    if wanted:
+        matching = [(n, s) for n, s in others if wanted in str(n).lower()]
+        if not matching:
+            return {
+                "Error": f"No dataset loaded for comparison is named {params.get('dataset')!r}.",
+                "Datasets": [str(n) for n, _ in others],
+            }
+        others = matching
+
+    by = str(params.get("by") or "brand").lower()
+    if by not in DIMENSIONS:
+        by = "brand"
+    col = DIMENSIONS[by]
+
+    summaries = share_categories([summary] + [s for _, s in others])
+    brand = params.get("brand")
+    if brand:
+        summaries = [s[s["Topic"].astype("string").str.lower() == str(brand).lower()] for s in summaries]
+
+    current = _totals(summaries[0], col)
+    current_total = current["Mentions"].sum()
+    comparisons = []
+    for (other_name, _), other in zip(others, summaries[1:]):
+        previous = _totals(other, col)
+        previous_total = previous["Mentions"].sum()
+        rows = []
+        # Same categories, so both frames have the same index in the same order
+        for key in current.index:
+            cur, prev = current.loc[key], previous.loc[key]
+            if not cur["Mentions"] and not prev["Mentions"]:
+                continue
+            row = {
+                col: str(key),
+                "Mentions": _change(int(cur["Mentions"]), int(prev["Mentions"])),
+                "Engagement": _change(int(round(cur["Engagement"])), int(round(prev["Engagement"]))),
+                "Share%": {
+                    "Current": round(100.0 * cur["Mentions"] / current_total, 2) if current_total else 0.0,
+                    "Previous": round(100.0 * prev["Mentions"] / previous_total, 2) if previous_total else 0.0,
+                },
+            }
+            if by != "sentiment":
+                row["NetSentiment%"] = {
+                    "Current": None if pd.isna(cur["NetSentiment"]) else float(cur["NetSentiment"]),
+                    "Previous": None if pd.isna(prev["NetSentiment"]) else float(prev["NetSentiment"]),
+                }
+            rows.append(row)
+        rows.sort(key=lambda r: r["Mentions"]["Current"], reverse=True)
+        comparisons.append({
+            "ComparedWith": str(other_name),
+            "Mentions": _change(int(current_total), int(previous_total)),
+            "Rows": rows,
+        })
+
+    return {"Current": name, "By": by, "Brand": brand or None, "Comparisons": comparisons}
@@ -0,0 +1,85 @@
+# functions/counts.py
+#
+# Parsing of interaction counts as exported by the listening tools: plain
+# numbers, "1,234" / "1.234" / "1 234" with thousands separators, and
+# abbreviations such as "1.2K", "3,4 N" (nghìn) or "2M". Each distinct
+# value is parsed once with vectorized string operations and the results
+# are mapped back to the rows, so columns of millions of cells (which
+# repeat a few thousand distinct values) parse in well under a second.
+
+import numpy as np
+import pandas as pd
+
+# Suffix (lower case) -> multiplier; n = nghìn (thousand), tr = triệu (million)
+COUNT_SUFFIXES = {"k": 1e3, "n": 1e3, "m": 1e6, "tr": 1e6, "b": 1e9}
+
+# Missing values as written in exports; they become NaN without counting as
+# unparsable
+BLANK_VALUES = ["", "-", "nan", "none", "null", "n/a", "na"]
+
+# Digits with separators (',', '.', spaces), then an optional suffix
+_COUNT_PATTERN = r"^(\d[\d.,\s]*)(?<![.,\s])\s*(" + "|".join(COUNT_SUFFIXES) + r")?$"
+
+
+def _parse_texts(text):
+    """Counts of lower-cased, stripped strings; NaN where they do not parse."""
+    parts = text.str.extract(_COUNT_PATTERN)
+    number = parts[0].str.replace(r"\s", "", regex=True)
+    suffix = parts[1]
+
+    # The last separator is a decimal mark when both ',' and '.' appear
+    # ("1,234.5", "1.234,5"), or when it is the only one and either a suffix
+    # follows ("1,2K") or it is not followed by a group of 3 digits ("1,5").
+    # Otherwise every separator groups thousands ("1,234", "1.234.567").
+    separators = number.str.count(r"[.,]")
+    last = number.str.extract(r"^(.*)[.,](\d*)$")
+    decimal = last[0].notna() & (
+        (number.str.contains(",", regex=False) & number.str.contains(".", regex=False))
+        | (separators.eq(1) & (suffix.notna() | last[1].str.len().ne(3)))
+    )
+    whole = number.where(~decimal, last[0]).str.replace(r"[.,]", "", regex=True)
+    digits = whole + ("." + last[1]).where(decimal, "")
+
+    values = pd.to_numeric(digits, errors="coerce").astype(float)
+    scaled = values * suffix.map(COUNT_SUFFIXES).astype(float).fillna(1.0)
+    # Abbreviated counts are whole numbers ("1.1K" is 1100, not 1100.0000000000002)
+    return scaled.where(suffix.isna(), scaled.round())
+
+
+def parse_counts(values) -> tuple:
+    """
+    Parse a column of interaction counts. Returns (counts, unparsable): the
+    counts as a numeric Series (int64 when all are whole numbers, float64
+    with NaN otherwise) and the number of non-blank values that could not be
+    parsed (and are NaN).
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series, 0
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+    is_text = uniques.map(lambda v: isinstance(v, str)).astype(bool)
+
+    parsed = pd.Series(np.nan, index=uniques.index)
+    # Numbers read as such (e.g. an Excel column mixing numbers and "1.2K")
+    parsed[~is_text] = pd.to_numeric(uniques[~is_text], errors="coerce")
+    text = uniques[is_text].astype("string").str.strip().str.lower()
+    parsed[is_text] = _parse_texts(text)
+
+    blank = pd.Series(False, index=uniques.index)
+    blank[is_text] = text.isin(BLANK_VALUES).fillna(False).astype(bool)
+    bad = (parsed.isna() & ~blank).to_numpy()
+
+    valid = codes >= 0
+    if len(uniques):
+        counts = np.where(valid, parsed.to_numpy(dtype=float)[codes], np.nan)
+        unparsable = int(bad[codes[valid]].sum())
+    else:
+        counts = np.full(len(series), np.nan)
+        unparsable = 0
+
+    counts = pd.Series(counts, index=series.index, name=series.name)
+    if len(counts) and counts.notna().all() and (counts % 1 == 0).all():
+        counts = counts.astype("int64")
+    return counts, unparsable
@@ -0,0 +1,460 @@
+# functions/dataset.py
+
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import Future
+
+import pandas as pd
+
+from .aggregate import build_dimension_values, update_dimension_values
+from .backends import make_backend
+from .comparison import build_dataset_summary
+from .digest import build_digest
+from .diskcache import CACHE_DIR, DATASETS_SUBDIR, DISK_CACHE
+from .functions import add_derived_columns, format_social_listening_data, has_labels1_coverage
+from .search import build_search_index, update_search_index
+from .signing import sign, verify
+from .timeseries import build_daily_series, update_daily_series
+from .neardup import build_near_duplicates, update_near_duplicates
+
+logger = logging.getLogger(__name__)
+
+# When set, formatted datasets are persisted as Arrow IPC files in this
+# directory and memory-mapped by every process that loads the same file.
+# Defaults to a directory of the disk cache (INSIGHT_CACHE_DIR, see
+# diskcache.py), if there is one.
+ARROW_DIR = os.environ.get("INSIGHT_ARROW_DIR") or (CACHE_DIR and os.path.join(CACHE_DIR, DATASETS_SUBDIR))
+ARROW_METADATA_KEY = b"insightchatbot"
+ARROW_INDEXES_KEY = b"insightchatbot.indexes"
+# Bump when the structure of a persisted index changes; files written with
+# another version (or whose indexes are not signed with this installation's
+# key, see signing.py) have their indexes rebuilt on load.
+INDEX_FORMAT_VERSION = 2
+
+# Local dataset store used by the Streamlit app: every loaded dataset is
+# kept as one Arrow file (formatted columns + derived indexes) and can be
+# reopened from the sidebar without parsing the Excel file again.
+STORE_DIR = ARROW_DIR or os.path.join(os.path.expanduser("~"), ".insightchatbot", "datasets")
+
+
+def read_source_bytes(source) -> bytes:
+    """
+    Return the raw bytes of an Excel source, which can be a file path,
+    a Streamlit UploadedFile / BytesIO, any readable file object, or bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            return fh.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+def dataset_id_for(raw: bytes) -> str:
+    """Content hash used to identify (and de-duplicate) uploaded files."""
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def appended_dataset_id(dataset_id, raw: bytes) -> str:
+    """Id of the dataset obtained by appending the file `raw` to `dataset_id`."""
+    return hashlib.sha1(f"{dataset_id}+{dataset_id_for(raw)}".encode()).hexdigest()[:16]
+
+
+def loaddata(source):
+    """Load the 'Data' sheet of a CMS export."""
+    df = pd.read_excel(source, sheet_name="Data")
+    df['PublishedDate'] = pd.to_datetime(df['PublishedDate']).dt.date
+    return df
+
+
+# Derived indexes the tools use: name -> (build(df), update(state, df, start)).
+# build() computes the index from scratch; update() folds in the rows
+# df.iloc[start:] that were just appended and returns the new state. Indexes
+# registered without update() are rebuilt after an append. Indexes are
+# saved with the dataset's Arrow file unless registered with persist=False
+# (e.g. objects holding connections), in which case they are rebuilt on load.
+INDEX_BUILDERS = {}
+TRANSIENT_INDEXES = set()
+
+
+def register_index(name, build, update=None, persist=True):
+    INDEX_BUILDERS[name] = (build, update)
+    if not persist:
+        TRANSIENT_INDEXES.add(name)
+
+
+def _build_ids(df):
+    return set(df['Id'].dropna()) if 'Id' in df.columns else set()
+
+
+def _update_ids(ids, df, start):
+    if 'Id' in df.columns:
+        ids.update(df['Id'].iloc[start:].dropna())
+    return ids
+
+
+def _build_labels1_count(df):
+    return int(df['Labels1'].notnull().sum()) if 'Labels1' in df.columns else 0
+
+
+def _update_labels1_count(count, df, start):
+    return count + _build_labels1_count(df.iloc[start:])
+
+
+register_index("ids", _build_ids, _update_ids)
+register_index("labels1_count", _build_labels1_count, _update_labels1_count)
+# Summary given to the chat models as context (see digest.py); cheap enough
+# to rebuild on append, and built early so the first question need not wait
+register_index("digest", build_digest)
+register_index("search", build_search_index, update_search_index)
+register_index("daily_series", build_daily_series, update_daily_series)
+register_index("near_duplicates", build_near_duplicates, update_near_duplicates)
+# Per brand x channel x sentiment totals compared across datasets (see comparison.py)
+register_index("summary", build_dataset_summary)
+# Distinct values of the aggregate tool's dimensions (see aggregate.py)
+register_index("dimension_values", build_dimension_values, update_dimension_values)
+# Execution backend (INSIGHT_BACKEND) over the frame; recreated after an append
+register_index("backend", make_backend, persist=False)
+
+
+class Dataset:
+    """
+    A formatted social listening DataFrame together with the flags
+    returned by format_social_listening_data(), a stable id and the
+    derived indexes built from it.
+    """
+
+    def __init__(self, df, interaction_found, labels1_found, name="", dataset_id="", store_dir=None):
+        self.df = df
+        self.interaction_found = interaction_found
+        self.labels1_found = labels1_found
+        self.name = name
+        self.dataset_id = dataset_id
+        # Directory the dataset is persisted to (None: not persisted)
+        self.store_dir = store_dir
+        self.version = 0
+        self._indexes = {}
+        self._lock = threading.RLock()
+        # (tool, params) -> Future of a precomputed tool result, see precompute.py
+        self._results = {}
+        self._results_lock = threading.Lock()
+        # Background preparation of this dataset, if one was started
+        self.precomputation = None
+
+    def describe(self) -> dict:
+        return {
+            "dataset_id": self.dataset_id,
+            "name": self.name,
+            "rows": int(len(self.df)),
+            "interaction_found": bool(self.interaction_found),
+            "labels1_found": bool(self.labels1_found),
+        }
+
+    def index(self, name):
+        """Return the derived index `name`, building it on first use."""
+        with self._lock:
+            if name not in self._indexes:
+                build, _ = INDEX_BUILDERS[name]
+                self._indexes[name] = build(self.df)
+            return self._indexes[name]
+
+    def warm(self, names=None):
+        """Build the given (default: all registered) indexes up front."""
+        for name in names or list(INDEX_BUILDERS):
+            self.index(name)
+
+    def missing_indexes(self) -> list:
+        """Registered indexes that have not been built (or restored) yet."""
+        with self._lock:
+            return [name for name in INDEX_BUILDERS if name not in self._indexes]
+
+    @staticmethod
+    def _result_key(name, params):
+        return name, json.dumps(params or {}, sort_keys=True, default=str)
+
+    def reserve_result(self, name, params):
+        """
+        A Future to set with the result of tool `name` for `params`, or None
+        if that result is already stored or being computed. Calls made in
+        the meantime wait for the Future (see cached_result()).
+        """
+        key = self._result_key(name, params)
+        with self._results_lock:
+            if key in self._results:
+                return None
+            future = self._results[key] = Future()
+            return future
+
+    def cached_result(self, name, params):
+        """
+        The stored result of tool `name` for `params`, waiting for it if it
+        is still being computed; None if there is none or it failed.
+        """
+        with self._results_lock:
+            future = self._results.get(self._result_key(name, params))
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def has_result(self, name, params):
+        """Whether the result of tool `name` for `params` is stored and ready (never waits)."""
+        with self._results_lock:
+            future = self._results.get(self._result_key(name, params))
+        return future is not None and future.done() and future.exception() is None
+
+    def persist(self):
+        """Save the dataset and its indexes to its store directory, if it has one."""
+        if not self.store_dir:
+            return
+        path = arrow_path(self.dataset_id, self.store_dir)
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        try:
+            save_arrow(self, path)
+        except Exception as e:
+            logger.error(f"Failed to persist dataset {self.dataset_id} as Arrow: {e}")
+            return
+        if _in_disk_cache(path):
+            DISK_CACHE.record_write(path, replaced)
+
+    def append(self, source) -> int:
+        """
+        Append a new export (e.g. one day of data) in place. Only the new
+        rows are formatted; rows whose Id is already present are dropped,
+        and every index built so far is updated with the new rows only.
+        Returns the number of rows added.
+        """
+        raw = read_source_bytes(source)
+        new_df = loaddata(io.BytesIO(raw))
+        new_df, interaction_found, _ = format_social_listening_data(new_df)
+
+        # A background preparation of the current version must not keep
+        # reading (or storing results for) it: stop it and wait for the step
+        # it is running
+        job = self.precomputation
+        if job is not None:
+            job.cancel()
+            job.wait()
+
+        with self._lock:
+            if 'Id' in new_df.columns:
+                ids = self.index("ids")
+                known = new_df['Id'].isin(ids)
+                repeated = new_df['Id'].duplicated() & new_df['Id'].notnull()
+                new_df = new_df[~(known | repeated)]
+
+            start = len(self.df)
+            df = pd.concat([self.df, new_df], ignore_index=True)
+
+            for name, state in list(self._indexes.items()):
+                build, update = INDEX_BUILDERS[name]
+                self._indexes[name] = update(state, df, start) if update else build(df)
+
+            self.df = df
+            self.interaction_found = self.interaction_found or interaction_found
+            self.labels1_found = has_labels1_coverage(self.index("labels1_count"))
+            self.dataset_id = appended_dataset_id(self.dataset_id, raw)
+            self.version += 1
+            with self._results_lock:
+                self._results = {}
+
+        self.persist()
+
+        logger.info("Appended %d rows to %s (now %d rows)", len(new_df), self.name, len(df))
+        return len(new_df)
+
+
+def _in_disk_cache(path):
+    """Whether path is under the disk cache, whose size cap then covers it."""
+    if DISK_CACHE is None:
+        return False
+    return os.path.abspath(path).startswith(os.path.abspath(DISK_CACHE.directory) + os.sep)
+
+
+def arrow_path(dataset_id, arrow_dir=None):
+    return os.path.join(arrow_dir or ARROW_DIR, f"{dataset_id}.arrow")
+
+
+def _to_arrow_table(df):
+    """
+    Convert a formatted DataFrame to an Arrow table. Object columns holding
+    mixed types (e.g. numeric and text Ids) are stored as strings.
+    """
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def save_arrow(dataset, path):
+    """
+    Persist the formatted DataFrame, its flags and the indexes built so far
+    as an uncompressed Arrow IPC file. The flags go in the schema metadata
+    (at the start of the file, see read_arrow_info()) and the pickled
+    indexes, signed (see signing.py), in the footer metadata. The file is written next to its
+    destination and renamed into place so concurrent workers never map a
+    partial file.
+    """
+    import pyarrow as pa
+
+    table = _to_arrow_table(dataset.df)
+    info = dataset.describe()
+    info["saved_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    metadata = dict(table.schema.metadata or {})
+    metadata[ARROW_METADATA_KEY] = json.dumps(info).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    with dataset._lock:
+        indexes = {name: state for name, state in dataset._indexes.items() if name not in TRANSIENT_INDEXES}
+        footer = {ARROW_INDEXES_KEY: sign(pickle.dumps((INDEX_FORMAT_VERSION, indexes), protocol=pickle.HIGHEST_PROTOCOL))}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, metadata=footer) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def load_arrow(path, name=None) -> Dataset:
+    """
+    Memory-map a dataset written by save_arrow(). Numeric columns without
+    nulls are zero-copy views of the mapped pages, so processes mapping the
+    same file share one physical copy of them. Saved indexes are restored
+    if their signature matches; missing ones are built on first use.
+    """
+    import pyarrow as pa
+
+    if _in_disk_cache(path):
+        DISK_CACHE.touch(path)
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    table = reader.read_all()
+    info = json.loads(table.schema.metadata[ARROW_METADATA_KEY])
+    df = table.to_pandas(split_blocks=True)
+    if "Engagement" not in df.columns:
+        # Saved before format_social_listening_data added the derived columns
+        add_derived_columns(df)
+
+    dataset = Dataset(
+        df,
+        info["interaction_found"],
+        info["labels1_found"],
+        name=name or info["name"],
+        dataset_id=info["dataset_id"],
+        store_dir=os.path.dirname(path),
+    )
+
+    footer = reader.metadata or {}
+    if ARROW_INDEXES_KEY in footer:
+        try:
+            # Only unpickled once the signature proves we wrote them
+            version, indexes = pickle.loads(verify(footer[ARROW_INDEXES_KEY]))
+            if version == INDEX_FORMAT_VERSION:
+                dataset._indexes.update((k, v) for k, v in indexes.items() if k in INDEX_BUILDERS)
+        except Exception as e:
+            logger.warning(f"Ignoring saved indexes of {path}: {e}")
+    return dataset
+
+
+def read_arrow_info(path) -> dict:
+    """
+    The describe() info (plus "saved_at") of a file written by save_arrow().
+    An Arrow IPC file is the 8-byte magic followed by an IPC stream whose
+    first message is the schema, so only the start of the file is read.
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(path, "r") as source:
+        source.seek(8)
+        schema = pa.ipc.open_stream(source).schema
+    return json.loads(schema.metadata[ARROW_METADATA_KEY])
+
+
+def list_stored_datasets(store_dir=None) -> list:
+    """Info of every dataset saved in store_dir (default STORE_DIR), most recent first."""
+    store_dir = store_dir or STORE_DIR
+    if not os.path.isdir(store_dir):
+        return []
+
+    datasets = []
+    for file_name in os.listdir(store_dir):
+        if not file_name.endswith(".arrow"):
+            continue
+        try:
+            datasets.append(read_arrow_info(os.path.join(store_dir, file_name)))
+        except Exception as e:
+            logger.warning(f"Skipping unreadable dataset file {file_name}: {e}")
+    return sorted(datasets, key=lambda info: info.get("saved_at", ""), reverse=True)
+
+
+def open_stored_dataset(dataset_id, store_dir=None, warm=True) -> Dataset:
+    """
+    Reopen a dataset listed by list_stored_datasets(). With warm=False the
+    indexes that were not saved are left to be built on first use (or by
+    precompute.start_precompute()).
+    """
+    dataset = load_arrow(arrow_path(dataset_id, store_dir or STORE_DIR))
+    if warm:
+        dataset.warm()
+    return dataset
+
+
+def load_dataset(source, name=None, dataset_id=None, arrow_dir=None, warm=True) -> Dataset:
+    """
+    Read and format an Excel export into a Dataset.
+
+    If arrow_dir (or INSIGHT_ARROW_DIR) is set, the formatted result and
+    its indexes are persisted as an Arrow IPC file on first load and
+    memory-mapped on every later load of the same file, skipping the Excel
+    parse and the index builds. Passing a known dataset_id avoids reading
+    the source at all when the Arrow file exists.
+
+    With warm=False the indexes are not built here but on first use, or in
+    the background by precompute.start_precompute(), which also saves them.
+    """
+    if name is None:
+        name = os.path.basename(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+
+    arrow_dir = arrow_dir or ARROW_DIR
+    if arrow_dir and dataset_id and os.path.exists(arrow_path(dataset_id, arrow_dir)):
+        dataset = load_arrow(arrow_path(dataset_id, arrow_dir), name=name)
+        if warm:
+            dataset.warm()
+        return dataset
+
+    raw = read_source_bytes(source)
+    dataset_id = dataset_id_for(raw)
+    if arrow_dir and os.path.exists(arrow_path(dataset_id, arrow_dir)):
+        dataset = load_arrow(arrow_path(dataset_id, arrow_dir), name=name)
+        if warm:
+            dataset.warm()
+        return dataset
+
+    df = loaddata(io.BytesIO(raw))
+    df, interaction_found, labels1_found = format_social_listening_data(df)
+    dataset = Dataset(df, interaction_found, labels1_found, name=name, dataset_id=dataset_id, store_dir=arrow_dir)
+
+    # Build the derived indexes (full-text search, ...) at load time, so
+    # they are persisted with the dataset
+    if warm:
+        dataset.warm()
+    dataset.persist()
+    return dataset
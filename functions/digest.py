@@ -0,0 +1,91 @@
+# functions/digest.py
+#
+# Compact digest of a dataset (brand totals, sentiment split, top channels
+# and sites, date range, label coverage), built with the other indexes when
+# the dataset is loaded and given to the chat models as system context, so
+# the usual opening questions are answered without a tool round-trip.
+
+import json
+
+import pandas as pd
+
+DIGEST_TOP = 5   # channels, sites and labels listed
+
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+
+DIGEST_INSTRUCTION = """
+    Below is a digest precomputed from the whole dataset. Answer questions about overall volume, share of voice, engagement, sentiment split, top channels or sites, the date range and labels from it directly, without calling tools. Call tools for anything filtered or more detailed (specific dates, channels, posts, comments)
+    """
+
+
+def _share(part, total):
+    return round(100 * float(part) / float(total), 1) if total else 0.0
+
+
+def _top(series, total, name, top):
+    counts = series.value_counts().head(top)
+    return [{name: str(k), "Mentions": int(n), "Share%": _share(n, total)} for k, n in counts.items()]
+
+
+def _sentiment_split(counts):
+    """Percentages of Positive/Neutral/Negative among known sentiments, and net sentiment."""
+    counts = counts.reindex(SENTIMENTS, fill_value=0)
+    known = counts.sum()
+    split = {f"{s}%": _share(counts[s], known) for s in SENTIMENTS}
+    split["NetSentiment%"] = round(split["Positive%"] - split["Negative%"], 1)
+    return split
+
+
+def build_digest(df, top=DIGEST_TOP) -> dict:
+    """Digest of the formatted DataFrame; only the columns present are summarized."""
+    total = len(df)
+    digest = {"Rows": int(total)}
+
+    if "FormattedDate" in df.columns:
+        dates = df["FormattedDate"].dropna()
+        if len(dates):
+            first, last = dates.min(), dates.max()
+            digest["DateRange"] = {"First": str(first), "Last": str(last), "Days": (last - first).days + 1}
+
+    engagement = df["Engagement"] if "Engagement" in df.columns else None
+    if engagement is not None:
+        digest["Engagement"] = int(round(engagement.sum()))
+
+    if "Sentiment" in df.columns:
+        digest["Sentiment"] = _sentiment_split(df["Sentiment"].value_counts())
+
+    if "Topic" in df.columns:
+        mentions = df["Topic"].value_counts()
+        by_brand = engagement.groupby(df["Topic"]).sum() if engagement is not None else None
+        sentiment = pd.crosstab(df["Topic"], df["Sentiment"]) if "Sentiment" in df.columns else None
+        top_channel = (
+            pd.crosstab(df["Topic"], df["ChannelDeep"]).idxmax(axis=1) if "ChannelDeep" in df.columns else None
+        )
+        brands = []
+        for brand, n in mentions.items():
+            row = {"Brand": str(brand), "Mentions": int(n), "ShareOfVoice%": _share(n, mentions.sum())}
+            if by_brand is not None:
+                row["Engagement"] = int(round(by_brand.get(brand, 0)))
+            if sentiment is not None and brand in sentiment.index:
+                row.update(_sentiment_split(sentiment.loc[brand]))
+            if top_channel is not None and brand in top_channel.index:
+                row["TopChannel"] = str(top_channel[brand])
+            brands.append(row)
+        digest["Brands"] = brands
+
+    if "ChannelDeep" in df.columns:
+        digest["TopChannels"] = _top(df["ChannelDeep"], total, "Channel", top)
+    if "SiteName" in df.columns:
+        digest["TopSites"] = _top(df["SiteName"], total, "Site", top)
+    if "Labels1" in df.columns:
+        labelled = df["Labels1"].notnull()
+        digest["Labels"] = {
+            "Coverage%": _share(labelled.sum(), total),
+            "Top": _top(df.loc[labelled, "Labels1"], labelled.sum(), "Label", top),
+        }
+    return digest
+
+
+def digest_instruction(digest) -> str:
+    """System instruction carrying the digest as compact JSON."""
+    return DIGEST_INSTRUCTION + json.dumps(digest, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,256 @@
+# functions/diskcache.py
+#
+# Optional on-disk cache that survives process restarts and redeploys
+# (INSIGHT_CACHE_DIR, e.g. a mounted volume). It holds:
+#   - tool results, as zlib-compressed pickles under results/, keyed by the
+#     dataset id (a hash of its content), the tool, the canonical params and
+#     the code version, so a code change never serves a stale result;
+#   - formatted datasets, as the Arrow files of dataset.py under datasets/
+#     (when INSIGHT_ARROW_DIR is not set), left uncompressed so they can
+#     still be memory-mapped.
+# The whole directory is kept under INSIGHT_CACHE_MAX_BYTES by removing the
+# least recently used files; reading a file marks it as used (mtime). Its
+# size is tracked as files are written, and the directory is only scanned
+# when that goes over the cap, or every INSIGHT_CACHE_RESCAN_SECONDS to see
+# the files other processes wrote.
+# Result files are signed (see signing.py) and only unpickled once their
+# signature matches.
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import zlib
+
+from .signing import sign, verify
+
+logger = logging.getLogger(__name__)
+
+# Unset: no disk cache
+CACHE_DIR = os.environ.get("INSIGHT_CACHE_DIR")
+CACHE_MAX_BYTES = int(os.environ.get("INSIGHT_CACHE_MAX_BYTES", 1024 ** 3))
+CACHE_RESCAN_SECONDS = float(os.environ.get("INSIGHT_CACHE_RESCAN_SECONDS", 300))
+# Part of every key; by default a hash of this package's source, set it
+# (e.g. to the deployed commit) to share a cache between installs
+CODE_VERSION = os.environ.get("INSIGHT_CODE_VERSION")
+
+COMPRESS_LEVEL = 6
+RESULTS_SUBDIR = "results"
+DATASETS_SUBDIR = "datasets"
+
+_code_version = None
+
+
+def code_version() -> str:
+    """CODE_VERSION, or a hash of the functions package's .py files."""
+    global _code_version
+    if CODE_VERSION:
+        return CODE_VERSION
+    if _code_version is None:
+        digest = hashlib.sha1()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for file_name in sorted(os.listdir(package_dir)):
+            if file_name.endswith(".py"):
+                with open(os.path.join(package_dir, file_name), "rb") as fh:
+                    digest.update(file_name.encode() + b"\0" + fh.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def result_key(dataset_id, tool, params) -> str:
+    """Cache key of a tool result; params are canonicalized (sorted keys)."""
+    canonical = json.dumps(
+        [code_version(), dataset_id, tool, params or {}], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Signed compressed pickles under `directory`, at most `max_bytes` in total (LRU)."""
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES, rescan_seconds=CACHE_RESCAN_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "scans": 0, "writes": 0, "evictions": 0, "errors": 0}
+        # Bytes in the directory as of the last scan plus this process's
+        # writes since (None: not scanned yet)
+        self._bytes = None
+        self._scanned_at = 0.0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def _path(self, key):
+        return os.path.join(self.directory, RESULTS_SUBDIR, key[:2], f"{key}.pkl.z")
+
+    def touch(self, path):
+        """Mark a file of the cache directory as just used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            self._count("misses")
+            return default
+        try:
+            value = pickle.loads(zlib.decompress(verify(data)))
+        except Exception as e:
+            logger.warning(f"Removing unreadable cache entry {path}: {e}")
+            self._count("errors")
+            self._remove(path)
+            return default
+        self.touch(path)
+        self._count("hits")
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        try:
+            data = sign(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), COMPRESS_LEVEL))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            replaced = _file_size(path)
+            # Written next to the destination and renamed into place, so
+            # other processes never read a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+            self._count("errors")
+            return
+        self._count("writes")
+        self.record_write(path, replaced)
+
+    def record_write(self, path, replaced=0):
+        """
+        Account for the file just written at path (replacing a file of
+        `replaced` bytes), and evict if the directory is over max_bytes or
+        has not been scanned for rescan_seconds.
+        """
+        size = _file_size(path)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size - replaced
+            scan = (
+                self._bytes is None
+                or self._bytes > self.max_bytes
+                or time.monotonic() - self._scanned_at >= self.rescan_seconds
+            )
+        if scan:
+            self.evict(keep=path)
+
+    def get_or_compute(self, key, compute):
+        """The cached value of key, or compute() stored under it."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remove(self, path):
+        size = _file_size(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes -= size
+        return True
+
+    def _files(self):
+        """(mtime, size, path) of every file in the directory, temporary files excluded."""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for file_name in names:
+                if file_name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def size(self) -> int:
+        """Bytes in the directory (as tracked since the last scan; scanned if never)."""
+        with self._lock:
+            tracked = self._bytes
+        if tracked is None:
+            self.evict()
+            with self._lock:
+                tracked = self._bytes
+        return tracked
+
+    def evict(self, keep=None) -> int:
+        """
+        Scan the directory and remove least recently used files until it
+        fits max_bytes; returns how many.
+        """
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # A removed Arrow file stays readable by processes mapping it
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+            self._scanned_at = time.monotonic()
+            self._counts["scans"] += 1
+        if removed:
+            self._count("evictions", removed)
+            logger.info("Evicted %d cache file(s) from %s", removed, self.directory)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts)
+        stats["bytes"] = self.size()
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+def _file_size(path) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+# Shared by every dataset of the process (None when INSIGHT_CACHE_DIR is unset)
+DISK_CACHE = DiskCache(CACHE_DIR) if CACHE_DIR else None
+
+
+def cached_tool_result(dataset_id, tool, params, compute, cache=None):
+    """
+    compute() through the disk cache (default DISK_CACHE); just compute()
+    when there is no cache or the dataset has no id.
+    """
+    cache = cache or DISK_CACHE
+    if cache is None or not dataset_id:
+        return compute()
+    return cache.get_or_compute(result_key(dataset_id, tool, params), compute)
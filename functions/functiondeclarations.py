@@ -1,6 +1,17 @@
 from vertexai.generative_models import (
     FunctionDeclaration,
 )
+
+# Output field listing how often each returned comment was posted; the same
+# in every tool that returns comments
+CONTENT_COUNT_SCHEMA = {
+    "type": "array",
+    "description": "Number of mentions repeating each comment in Content, or a near-identical variant of it (same order).",
+    "items": {
+        "type": "integer"
+    }
+}
+
 brand_health_overview = FunctionDeclaration(
     name="brand_health_overview",
     description=(
@@ -10,6 +21,25 @@ brand_health_overview = FunctionDeclaration(
     parameters={
         "type": "object",
         "properties": {
+            "granularity": {
+                "type": "string",
+                "enum": ["auto", "day", "week", "month"],
+                "description": "Optional input: granularity of the date arrays. 'auto' (default) uses days, or weeks or months for long date ranges."
+            },
+            "max_date_points": {
+                "type": "integer",
+                "description": "Optional input: maximum number of date points per date array when granularity is 'auto' (default 90)."
+            },
+            "start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Optional input: first day of MentionsByDate (YYYY-MM-DD); 'auto' granularity is chosen from this range. Defaults to the first day in the data. The other figures cover all the data."
+            },
+            "end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Optional input: last day of MentionsByDate (YYYY-MM-DD). Defaults to the last day in the data."
+            },
             "Topics": {
                 "type": "object",
                 "description": "An object containing a list of brands with their health details.",
@@ -43,9 +73,25 @@ brand_health_overview = FunctionDeclaration(
                                     },
                                     "required": ["Positive", "Neutral", "Negative"]
                                 },
+                                "DateGranularity": {
+                                    "type": "string",
+                                    "description": "Bucket size of MentionsByDate: day, week or month, chosen from the length of DateRange."
+                                },
+                                "DateRange": {
+                                    "type": "object",
+                                    "description": "First and last day covered by MentionsByDate.",
+                                    "properties": {
+                                        "StartDate": {"type": "string", "format": "date"},
+                                        "EndDate": {"type": "string", "format": "date"}
+                                    }
+                                },
+                                "MentionsWithoutDate": {
+                                    "type": "integer",
+                                    "description": "Mentions of the brand without a valid date, which are in no MentionsByDate bucket."
+                                },
                                 "MentionsByDate": {
                                     "type": "array",
-                                    "description": "Total mentions of the brand grouped by date.",
+                                    "description": "Total mentions of the brand grouped by date, week or month (see DateGranularity); weeks and months are labelled with their first day.",
                                     "items": {
                                         "type": "object",
                                         "properties": {
@@ -186,6 +232,14 @@ get_top_post_details = FunctionDeclaration(
         "type": "object",
         "description": "An object containing a list of topics with their respective top posts.",
         "properties": {
+            "top_n": {
+                "type": "integer",
+                "description": "Optional input: number of top posts (by mentions) to return per Topic (default 20)."
+            },
+            "max_comments": {
+                "type": "integer",
+                "description": "Optional input: maximum number of sampled comments per post (default 30)."
+            },
             "Topics": {  # Encapsulate topics within a single object property
                 "type": "array",
                 "description": "A list of objects, each containing a Topic name and its list of top posts.",
@@ -264,6 +318,7 @@ get_top_post_details = FunctionDeclaration(
                                         },
                                         "maxItems": 100  # Optional: limit the number of comments
                                     },
+                                    "ContentCount": CONTENT_COUNT_SCHEMA,
                                     "Date": {
                                         "type": "string",
                                         "format": "date",
@@ -302,6 +357,14 @@ get_channel_detail = FunctionDeclaration(
     parameters={
         "type": "object",
         "properties": {
+            "max_sites": {
+                "type": "integer",
+                "description": "Optional input: number of top sites (by mentions) to return per channel (default all)."
+            },
+            "max_posts_per_site": {
+                "type": "integer",
+                "description": "Optional input: number of top posts (by mentions) to return per site (default all)."
+            },
             "Topics": {
                 "type": "array",
                 "description": "A list of brands with their respective channel details.",
@@ -359,6 +422,7 @@ get_channel_detail = FunctionDeclaration(
                                                     },
                                                     "maxItems": 100  # Optional: limit the number of comments
                                                 },
+                                                "ContentCount": CONTENT_COUNT_SCHEMA,
                                                 "Engagement": {
                                                     "type": "number",
                                                     "description": "Total engagement (likes, shares, comments) on the top post.",
@@ -527,6 +591,7 @@ get_brand_sentiment_detail = FunctionDeclaration(
                                                             },
                                                             "maxItems": 100  # Optional: limit the number of comments
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -599,6 +664,7 @@ get_brand_sentiment_detail = FunctionDeclaration(
                                                             },
                                                             "maxItems": 100  # Optional: limit the number of comments
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -671,6 +737,7 @@ get_brand_sentiment_detail = FunctionDeclaration(
                                                             },
                                                             "maxItems": 100  # Optional: limit the number of comments
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -726,11 +793,28 @@ get_brand_sentiment_detail = FunctionDeclaration(
 
 get_label_details = FunctionDeclaration(
     name="get_label_details",
-    description="Return details about each Topic and its list of Labels (main topics of brands), including sentiment breakdown, mentions, channel, and top post, grouped by multiple UrlTopics.",
+    description="Return details about each Topic and its list of Labels (main topics of brands), including sentiment breakdown, mentions, channel, and top post, grouped by multiple UrlTopics. Large results come back as a summary with cursors; use fetch_more for the left-out detail.",
     parameters={
         "type": "object",
         "description": "A list of Topics, each with a 'Topic' name and a list of Labels, including sentiment breakdown, mentions, channel, and top post details.",
         "properties": {
+            "granularity": {
+                "type": "string",
+                "enum": ["auto", "day", "week", "month"],
+                "description": "Optional input: granularity of the date arrays. 'auto' (default) uses days, or weeks or months for long date ranges."
+            },
+            "max_date_points": {
+                "type": "integer",
+                "description": "Optional input: maximum number of date points per date array when granularity is 'auto' (default 90)."
+            },
+            "max_posts_per_sentiment": {
+                "type": "integer",
+                "description": "Optional input: number of top posts (by mentions) to return per label and sentiment (default 20)."
+            },
+            "max_comments_in_post": {
+                "type": "integer",
+                "description": "Optional input: maximum number of sampled comments per post (default 20)."
+            },
             "Topics": {
                 "type": "array",
                 "description": "A list of Topics.",
@@ -761,9 +845,13 @@ get_label_details = FunctionDeclaration(
                                         "type": "string",
                                         "description": "Channel associated at the label level."
                                     },
+                                    "DateGranularity": {
+                                        "type": "string",
+                                        "description": "Granularity of Date: day, week or month."
+                                    },
                                     "Date": {
                                         "type": "object",
-                                        "description": "Dates of the label.",
+                                        "description": "Dates of the label, by day, week or month (see DateGranularity); weeks and months are labelled with their first day.",
                                         "properties": {
                                             "DateofMetions": {
                                                 "type": "string",
@@ -806,6 +894,7 @@ get_label_details = FunctionDeclaration(
                                                                 "description": "A single user comment."
                                                             }
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -839,6 +928,7 @@ get_label_details = FunctionDeclaration(
                                                                 "description": "A single user comment."
                                                             }
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -872,6 +962,7 @@ get_label_details = FunctionDeclaration(
                                                                 "description": "A single user comment."
                                                             }
                                                         },
+                                                        "ContentCount": CONTENT_COUNT_SCHEMA,
                                                         "ChannelDeep": {
                                                             "type": "string",
                                                             "description": "Channel associated with this UrlTopic."
@@ -930,7 +1021,8 @@ get_label_details = FunctionDeclaration(
                                                     "type": "string",
                                                     "description": "A single user comment."
                                                 }
-                                            }
+                                            },
+                                            "ContentCount": CONTENT_COUNT_SCHEMA
                                         }
                                     }
                                 }
@@ -945,10 +1037,22 @@ get_label_details = FunctionDeclaration(
 
 get_daily_detail = FunctionDeclaration(
     name="get_daily_detail",
-    description="Get brand-level daily detail insights across all dates from the daily_data structure.",
+    description="Get brand-level daily detail insights across all dates from the daily_data structure. Large results come back as a summary with cursors; use fetch_more for the left-out detail.",
     parameters={
         "type": "object",
         "properties": {
+            "top_posts": {
+                "type": "integer",
+                "description": "Optional input: number of top posts (by mentions) to return per brand and date (default 5)."
+            },
+            "top_sites": {
+                "type": "integer",
+                "description": "Optional input: number of top sites (by mentions) to return per brand and date (default all)."
+            },
+            "top_channels": {
+                "type": "integer",
+                "description": "Optional input: number of top channels (by mentions) to return per brand and date (default all)."
+            },
             "daily": {
                 "type": "array",
                 "description": "Array of daily mentions, sentiment, top posts, and engagement for a brand.",
@@ -1090,3 +1194,276 @@ get_daily_detail = FunctionDeclaration(
         }
     }
 )
+
+
+search_mentions = FunctionDeclaration(
+    name="search_mentions",
+    description=(
+        "Full-text search over the title and content of every mention, e.g. to find what people say about "
+        "'delivery delays'. All query words must appear; matching ignores case and Vietnamese diacritics. "
+        "Returns the number of matching mentions by brand and sentiment, plus the most recent matching mentions."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "Words to search for in the mention title and content."
+            },
+            "brand": {
+                "type": "string",
+                "description": "Only return mentions of this brand (Topic)."
+            },
+            "sentiment": {
+                "type": "string",
+                "description": "Only return mentions with this sentiment: Positive, Neutral or Negative."
+            },
+            "start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only return mentions published on or after this date (YYYY-MM-DD)."
+            },
+            "end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only return mentions published on or before this date (YYYY-MM-DD)."
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of matching mentions to return (default 20, max 100)."
+            }
+        },
+        "required": ["query"]
+    }
+)
+
+
+compare_periods = FunctionDeclaration(
+    name="compare_periods",
+    description=(
+        "Compare two date ranges, e.g. 'last week vs the week before' or 'March vs February'. "
+        "Returns for each brand the mentions and engagement in both periods with the absolute and "
+        "percentage change, and the share of voice (share of all brands' mentions) in each period. "
+        "Optionally breaks each brand down by sentiment or by channel. Fast; prefer it over the "
+        "daily detail for period totals and comparisons."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "First day of the period of interest (YYYY-MM-DD). Defaults to 7 days before end_date."
+            },
+            "end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Last day of the period of interest (YYYY-MM-DD). Defaults to the last day in the data."
+            },
+            "compare_start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "First day of the period to compare with. Defaults to the period of the same length right before."
+            },
+            "compare_end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Last day of the period to compare with. Defaults to the day before start_date."
+            },
+            "brand": {
+                "type": "string",
+                "description": "Only report this brand (Topic). Share of voice is still computed against all brands."
+            },
+            "breakdown": {
+                "type": "string",
+                "enum": ["sentiment", "channel"],
+                "description": "Add a per-brand breakdown of the comparison by sentiment or by channel."
+            }
+        }
+    }
+)
+
+
+detect_spikes = FunctionDeclaration(
+    name="detect_spikes",
+    description=(
+        "Find the days on which mentions of a brand, or of a brand on one channel, spiked (or dropped) "
+        "compared with their usual level, e.g. to answer 'why did mentions spike on day X' or 'were there "
+        "any unusual days'. Each day is compared with the previous 14 days (z-score). Returns only the "
+        "anomalous days, strongest first, each with its mentions, baseline, z-score, sentiment counts, "
+        "top sites and top posts."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "brand": {
+                "type": "string",
+                "description": "Only look at this brand (Topic)."
+            },
+            "start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only report anomalies on or after this date (YYYY-MM-DD)."
+            },
+            "end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only report anomalies on or before this date (YYYY-MM-DD)."
+            },
+            "level": {
+                "type": "string",
+                "enum": ["brand", "channel", "both"],
+                "description": "Look for anomalies in the brand totals, per brand and channel, or both (default)."
+            },
+            "direction": {
+                "type": "string",
+                "enum": ["up", "down", "both"],
+                "description": "Report spikes (up, default), drops (down) or both."
+            },
+            "threshold": {
+                "type": "number",
+                "description": "Minimum absolute z-score for a day to be reported (default 3)."
+            },
+            "window": {
+                "type": "integer",
+                "description": "Number of previous days used as the baseline (default 14)."
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of anomalous days to return (default 10)."
+            }
+        }
+    }
+)
+
+
+fetch_more = FunctionDeclaration(
+    name="fetch_more",
+    description=(
+        "Get detail that was left out of a large tool result. get_label_details and get_daily_detail return a "
+        "summary in which long lists are replaced by a Count and a Cursor (or a More count and a Cursor for the "
+        "rest of a list); pass one of those cursors to receive that part, e.g. the dates or posts of one brand "
+        "and label. Pages can contain further cursors."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "cursor": {
+                "type": "string",
+                "description": "A Cursor value from a summary or from a previous fetch_more page."
+            }
+        },
+        "required": ["cursor"]
+    }
+)
+
+
+aggregate = FunctionDeclaration(
+    name="aggregate",
+    description=(
+        "Answer a single-number or small-table question, e.g. 'negative mentions on TikTok for brand A in March' "
+        "or 'engagement by brand and channel', by counting and summing mentions grouped by up to 3 dimensions "
+        "with optional filters. Returns a small table of rows (largest first) instead of a full report; "
+        "prefer it over the detail tools when a few numbers are enough."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "group_by": {
+                "type": "array",
+                "description": "Dimensions to group by (at most 3). Omit for a single total row.",
+                "items": {
+                    "type": "string",
+                    "enum": ["brand", "sentiment", "channel", "site", "label", "type", "date"]
+                }
+            },
+            "metrics": {
+                "type": "array",
+                "description": (
+                    "Metrics per group (default mentions). engagement = reactions + shares + comments + views; "
+                    "sites and posts count distinct sites and posts."
+                ),
+                "items": {
+                    "type": "string",
+                    "enum": ["mentions", "engagement", "reactions", "comments", "shares", "views", "sites", "posts"]
+                }
+            },
+            "filters": {
+                "type": "array",
+                "description": "Conditions every counted mention must meet.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "dimension": {
+                            "type": "string",
+                            "enum": ["brand", "sentiment", "channel", "site", "label", "type"]
+                        },
+                        "op": {
+                            "type": "string",
+                            "enum": ["==", "!=", "in", "not in", "contains"],
+                            "description": "Comparison (default ==). Values are matched ignoring case."
+                        },
+                        "value": {
+                            "type": "string",
+                            "description": "Value for ==, != and contains."
+                        },
+                        "values": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Values for in and not in."
+                        }
+                    },
+                    "required": ["dimension"]
+                }
+            },
+            "start_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only count mentions published on or after this date (YYYY-MM-DD)."
+            },
+            "end_date": {
+                "type": "string",
+                "format": "date",
+                "description": "Only count mentions published on or before this date (YYYY-MM-DD)."
+            },
+            "sort": {
+                "type": "string",
+                "description": "Metric to sort the rows by, largest first (default: the first metric)."
+            },
+            "limit": {
+                "type": "integer",
+                "description": "Maximum number of rows to return (default 20, max 100)."
+            }
+        }
+    }
+)
+
+
+compare_datasets = FunctionDeclaration(
+    name="compare_datasets",
+    description=(
+        "Compare this dataset with the other datasets loaded for comparison, e.g. 'this campaign vs the "
+        "last campaign'. Returns for each brand (or channel, or sentiment) the mentions and engagement in "
+        "this dataset (Current) and in the other one (Previous) with the absolute and percentage change, "
+        "the share of mentions in each, and the net sentiment (% positive minus % negative) in each. "
+        "Only available when other datasets are loaded."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "by": {
+                "type": "string",
+                "enum": ["brand", "channel", "sentiment"],
+                "description": "Compare per brand (default), per channel or per sentiment."
+            },
+            "brand": {
+                "type": "string",
+                "description": "Only count this brand's mentions (Topic), e.g. to compare its channels."
+            },
+            "dataset": {
+                "type": "string",
+                "description": "Name of the other dataset to compare with (default: every loaded one)."
+            }
+        }
+    }
+)
@@ -1,8 +1,144 @@
 import pandas as pd
 import pandas as pd
+import numpy as np
 import random
 import math
+import logging
+from collections import defaultdict
 from typing import Dict, Any
+
+from .backends import PandasBackend
+from .counts import parse_counts
+from .timeseries import DEFAULT_DATE_POINT_BUDGET, ENGAGEMENT_COLS, build_daily_series, series_granularity, series_range
+
+logger = logging.getLogger(__name__)
+
+
+def has_labels1_coverage(labels1_count):
+    """
+    Whether enough rows are labelled (Labels1) for label insights to be
+    representative.
+    """
+    # Calculate required sample size
+    confidence_level = 99  # Confidence level in percentage
+    margin_of_error = 0.03  # Margin of error in decimal
+
+    Z = 2.576  # Z-score for 99% confidence level
+    p = 0.5  # Proportion (use 0.5 for maximum variability)
+    e = margin_of_error
+
+    required_sample_size = math.ceil((Z**2 * p * (1 - p)) / (e**2))
+
+    # Check if Labels1 meets or exceeds required sample size
+    return bool(labels1_count >= required_sample_size)
+
+
+def _int_param(params, key, default):
+    """
+    Read an optional non-negative integer tool argument. The model sends
+    numbers as floats, and may omit the argument or send an empty value.
+    """
+    value = (params or {}).get(key)
+    if value is None or value == "":
+        return default
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def _top_k_per_group(frame, group_cols, value_col, k=None):
+    """
+    Keep the rows with the k largest `value_col` within each group of
+    `group_cols` (all rows if k is None), ordered by group and then by value
+    descending. Selection uses a per-group rank, so only the kept rows get
+    sorted; ties keep their original order.
+    """
+    if not group_cols:
+        if k is not None:
+            return frame.nlargest(k, value_col, keep="first")
+        return frame.sort_values(value_col, ascending=False, kind="stable")
+
+    if k is not None:
+        rank = (
+            frame
+            .groupby(group_cols, sort=False, dropna=False)[value_col]
+            .rank(method="first", ascending=False)
+        )
+        frame = frame[rank <= k]
+    return frame.sort_values(
+        group_cols + [value_col],
+        ascending=[True] * len(group_cols) + [False],
+        kind="stable",
+    )
+
+
+def hash_content(contents):
+    """64-bit hash of each comment, so duplicates can be found with integer ops."""
+    return pd.util.hash_pandas_object(contents.fillna(""), index=False).to_numpy().view(np.int64)
+
+
+def _content_keys(frame, content_col='Content', hash_col='ContentHash', clusters=None):
+    """
+    Per-row de-duplication key: the content hash, or with a
+    NearDuplicateIndex (`clusters`) the id of the comment's near-duplicate
+    cluster.
+    """
+    if hash_col in frame.columns:
+        keys = frame[hash_col].to_numpy()
+    else:
+        keys = hash_content(frame[content_col])
+    if clusters is not None:
+        keys = clusters.cluster_of(keys)
+    return keys
+
+
+def _distinct_contents(frame, max_items=None, sample=True, content_col='Content', hash_col='ContentHash',
+                       clusters=None, return_keys=False):
+    """
+    Distinct non-empty comments of `frame`, in order of first appearance,
+    with the number of rows repeating each one. With `clusters`, near-
+    identical variants count as one comment, represented by the first one
+    seen. With more than max_items distinct comments, a random sample of
+    them is kept (or the first max_items if sample is False).
+    Returns (comments, counts), plus their keys if return_keys.
+    """
+    contents = frame[content_col]
+    valid = contents.notna().to_numpy()
+    keys = _content_keys(frame, content_col, hash_col, clusters)[valid]
+    codes, uniques = pd.factorize(keys)
+    _, first = np.unique(codes, return_index=True)
+    texts = contents[valid].iloc[first].tolist()
+    counts = np.bincount(codes, minlength=len(uniques)).tolist()
+
+    keep = list(range(len(texts)))
+    if max_items is not None and len(keep) > max_items:
+        keep = random.sample(keep, max_items) if sample else keep[:max_items]
+    result = ([texts[i] for i in keep], [counts[i] for i in keep])
+    if return_keys:
+        result += (uniques[keep],)
+    return result
+
+
+def add_derived_columns(df):
+    """
+    Add the columns the tools read instead of recomputing them:
+      - Engagement: Reactions + Shares + Comments + Views (missing columns
+        and values count as 0)
+      - IsNews / IsPost / IsComment: whether 'Type' (e.g. 'newsTopic',
+        'fbPageTopic', 'forumComment') names a news item, a post or a comment
+    """
+    engagement_cols = [col for col in ENGAGEMENT_COLS if col in df.columns]
+    df['Engagement'] = df[engagement_cols].sum(axis=1) if engagement_cols else 0
+    if 'Type' in df.columns:
+        types = df['Type'].astype('string').str.lower()
+    else:
+        types = pd.Series(pd.NA, index=df.index, dtype='string')
+    for col, word in (('IsNews', 'news'), ('IsPost', 'topic'), ('IsComment', 'comment')):
+        df[col] = types.str.contains(word, regex=False).fillna(False).astype(bool)
+    return df
+
+
 def format_social_listening_data(df):
     # Interaction columns mapping
     interaction_columns = {
@@ -20,14 +156,22 @@ def format_social_listening_data(df):
             if variation in df.columns:
                 df.rename(columns={variation: standard_col}, inplace=True)
                 interaction_found = True  # Mark that at least one interaction column exists
-    # Ensure all interaction columns are numeric
+    # Ensure all interaction columns are numeric: plain numbers, thousands
+    # separators ("1,234") and abbreviations ("1.2K", "3,4 N") are parsed,
+    # anything else becomes NaN and is reported
     for standard_col in interaction_columns.keys():
         if standard_col in df.columns:
-            # Trim whitespace
-            df[standard_col] = df[standard_col].astype(str).str.strip()
-    
-            # Convert to numeric, coercing invalid values to NaN
-            df[standard_col] = pd.to_numeric(df[standard_col], errors='coerce')
+            df[standard_col], unparsable = parse_counts(df[standard_col])
+            if unparsable:
+                logger.warning(f"{unparsable} of {len(df)} values of '{standard_col}' are not counts; they are left empty")
+        else:
+            # Missing interaction columns count as 0 in every tool
+            df[standard_col] = 0
+
+    # Rows without a sentiment are kept (null): they count as mentions but
+    # in no sentiment, in every tool and on every backend
+    if 'Sentiment' not in df.columns:
+        df['Sentiment'] = pd.Series(None, index=df.index, dtype='str')
     
     # Create ChannelDeep column without removing or renaming 'Type'
     def generate_channel_deep(row):
@@ -52,6 +196,9 @@ def format_social_listening_data(df):
     
     df['ChannelDeep'] = df.apply(generate_channel_deep, axis=1)
 
+    # Engagement and the post-type flags, computed once for every tool
+    add_derived_columns(df)
+
     # Format PublishedDate to FormattedDate
     if 'PublishedDate' in df.columns:
         df['FormattedDate'] = pd.to_datetime(df['PublishedDate'], errors='coerce').dt.date
@@ -59,22 +206,7 @@ def format_social_listening_data(df):
     # Example detection if 'Labels1' is found
     labels1_coverage = False
     if 'Labels1' in df.columns:
-        total_ids = df['Id'].notnull().count()
-        labels1_count = df['Labels1'].notnull().sum()
-
-        # Calculate required sample size
-        confidence_level = 99  # Confidence level in percentage
-        margin_of_error = 0.03  # Margin of error in decimal
-
-        Z = 2.576  # Z-score for 99% confidence level
-        p = 0.5  # Proportion (use 0.5 for maximum variability)
-        e = margin_of_error
-
-        required_sample_size = math.ceil((Z**2 * p * (1 - p)) / (e**2))
-
-        # Check if Labels1 meets or exceeds required sample size
-        if labels1_count >= required_sample_size:
-            labels1_coverage = True
+        labels1_coverage = has_labels1_coverage(df['Labels1'].notnull().sum())
 
     # Clean 'Content' and 'Title' columns
     def remove_special_chars(text):
@@ -88,6 +220,8 @@ def format_social_listening_data(df):
         df['Title'] = df['Title'].apply(remove_special_chars)
     if 'Content' in df.columns:
         df['Content'] = df['Content'].apply(remove_special_chars)
+        # Hash each comment once so the tools can de-duplicate with integers
+        df['ContentHash'] = hash_content(df['Content'])
 
     # Return the DataFrame plus any flags
     return df, interaction_found, labels1_coverage
@@ -101,11 +235,16 @@ def generate_brand_health_overview(
     date_col: str = "FormattedDate",
     channel_col: str = "ChannelDeep",
     sentiment_col: str = "Sentiment",
-    type_col: str = "Type",
     reactions_col: str = "Reactions",
     shares_col: str = "Shares",
     comments_col: str = "Comments",
-    views_col: str = "Views"
+    views_col: str = "Views",
+    engagement_col: str = "Engagement",
+    is_news_col: str = "IsNews",
+    is_post_col: str = "IsPost",
+    is_comment_col: str = "IsComment",
+    series=None,
+    backend=None,
 ) -> dict:
 
     # Prepare the final output structure
@@ -114,20 +253,55 @@ def generate_brand_health_overview(
     # Identify all unique brands in the dataset
     brands = df[brand_col].dropna().unique().tolist()
 
+    # The per-brand group-bys run on `backend` (see backends.py; pandas by default)
+    if backend is None:
+        backend = PandasBackend(df)
+
+    # Interaction totals for every brand in one pass
+    totals = backend.group_aggregate(
+        [brand_col],
+        {col: ('sum', col) for col in [reactions_col, shares_col, comments_col, views_col, engagement_col]},
+    ).set_index(brand_col)
+    # Post / comment counts (news excluded), from the columns added by
+    # format_social_listening_data
+    for name, flag_col in (("posts", is_post_col), ("comments", is_comment_col)):
+        counts = backend.group_aggregate(
+            [brand_col],
+            {name: ('size', None)},
+            filters=[(is_news_col, "==", False), (flag_col, "==", True)],
+        ).set_index(brand_col)[name]
+        totals[name] = counts.reindex(totals.index, fill_value=0)
+
+    # Mentions per sentiment and per channel for every brand
+    sentiments = backend.sentiment_breakdown([brand_col], sentiment_col).set_index(brand_col)
+    channels = backend.group_aggregate([brand_col, channel_col], {"Mention": ('size', None)}, dropna=False)
+
+    # Daily mention counts come from the dataset's DailySeries, rolled up to
+    # weeks or months when the requested date range (start_date / end_date,
+    # default: all the data) is too long for one point per day
+    if series is None:
+        series = build_daily_series(df)
+    start, end = series_range(series, params)
+    granularity = series_granularity(series, params, n_series=len(brands), budget=DEFAULT_DATE_POINT_BUDGET)
+    # Mentions without a (valid) date are in no MentionsByDate bucket
+    if date_col in df.columns:
+        undated = df.loc[df[date_col].isna(), brand_col].value_counts()
+    else:
+        undated = df[brand_col].value_counts()
+
     for b in brands:
-        # Filter DataFrame for this brand
-        brand_df = df[df[brand_col] == b].copy()
-        if brand_df.empty:
+        if b not in totals.index:
             continue
 
-        # 1) Sentiment Percentages
-        total_rows = len(brand_df)
+        # 1) Sentiment Percentages (of all the brand's rows)
+        brand_sentiment = sentiments.loc[b]
+        total_rows = int(brand_sentiment["mention_count"])
         if total_rows == 0:
             pos_pct = neu_pct = neg_pct = 0.0
         else:
-            pos_count = len(brand_df[brand_df[sentiment_col] == "Positive"])
-            neu_count = len(brand_df[brand_df[sentiment_col] == "Neutral"])
-            neg_count = len(brand_df[brand_df[sentiment_col] == "Negative"])
+            pos_count = int(brand_sentiment["Positive"])
+            neu_count = int(brand_sentiment["Neutral"])
+            neg_count = int(brand_sentiment["Negative"])
 
             pos_pct = 100.0 * pos_count / total_rows
             neu_pct = 100.0 * neu_count / total_rows
@@ -139,31 +313,18 @@ def generate_brand_health_overview(
             "Negative": round(neg_pct, 2)
         }
 
-        # 2) Mentions By Date
-        # We'll group by date and count rows
-        mentions_by_date = (
-            brand_df
-            .groupby(date_col, dropna=False)
-            .size()
-            .reset_index(name="Mention")
-        )
+        # 2) Mentions By Date (by day, week or month; each bucket is
+        # labelled with its first day)
         mentions_by_date_arr = []
-        for _, row in mentions_by_date.iterrows():
-            date_str = str(row[date_col]) if pd.notnull(row[date_col]) else ""
-            mention_count = int(row["Mention"])
+        for bucket_date, mention_count in series.buckets("brand", b, granularity, start, end):
             mentions_by_date_arr.append({
-                "Date": date_str,
+                "Date": str(bucket_date),
                 "Mention": mention_count
             })
 
         # 3) Mentions By Channel
-        # Group by channel to count rows
-        mentions_by_channel = (
-            brand_df
-            .groupby(channel_col, dropna=False)
-            .size()
-            .reset_index(name="Mention")
-        )
+        # Rows per channel, counted above
+        mentions_by_channel = channels[channels[brand_col] == b]
         mentions_by_channel_arr = []
         for _, row in mentions_by_channel.iterrows():
             ch_value = row[channel_col]
@@ -175,16 +336,13 @@ def generate_brand_health_overview(
             })
 
         # 4) SocialPostOverview
-        #   - Filter out rows where type contains "news"
-        #   - Count how many posts => rows where Type contains "Topic"
-        #   - Count how many comments => rows where Type contains "Comment"
+        #   - Leave out news items (IsNews)
+        #   - Count how many posts => rows where Type contains "Topic" (IsPost)
+        #   - Count how many comments => rows where Type contains "Comment" (IsComment)
         #   - Ratio => comments / posts (avoid dividing by zero)
-        non_news_df = brand_df[~brand_df[type_col].str.contains("news", case=False, na=False)].copy()
-
-        # Number of posts -> rows where Type contains "Topic"
-        number_of_posts = len(non_news_df[non_news_df[type_col].str.contains("Topic", case=False, na=False)])
-        # Number of comments -> rows where Type contains "Comment"
-        number_of_comments = len(non_news_df[non_news_df[type_col].str.contains("Comment", case=False, na=False)])
+        brand_totals = totals.loc[b]
+        number_of_posts = int(brand_totals["posts"])
+        number_of_comments = int(brand_totals["comments"])
 
         if number_of_posts > 0:
             comment_post_ratio = number_of_comments / number_of_posts
@@ -198,21 +356,13 @@ def generate_brand_health_overview(
         }]
 
         # 5) Engagement
-        # We'll sum Reactions, Shares, Comments, Views => total_engagement
+        # Totals of Reactions, Shares, Comments, Views and Engagement (their sum)
         # Then compute rates per 'NumberofPost' (the non-news "Topic" count).
-        # List of columns to process
-        columns_to_clean = ['reactions_col', 'shares_col', 'comments_col', 'views_col']
-        
-        # Convert each column to numeric, coercing errors to NaN
-        for col in columns_to_clean:
-            brand_df[col] = pd.to_numeric(brand_df[col], errors='coerce')
-            
-        total_reactions = brand_df[reactions_col].sum(skipna=True)
-        total_shares    = brand_df[shares_col].sum(skipna=True)
-        total_comments  = brand_df[comments_col].sum(skipna=True)
-        total_views     = brand_df[views_col].sum(skipna=True)
-
-        total_engagement = total_reactions + total_shares + total_comments + total_views
+        total_reactions = brand_totals[reactions_col]
+        total_shares    = brand_totals[shares_col]
+        total_comments  = brand_totals[comments_col]
+        total_views     = brand_totals[views_col]
+        total_engagement = brand_totals[engagement_col]
 
         if number_of_posts > 0:
             reactions_rate  = total_reactions / number_of_posts
@@ -245,7 +395,10 @@ def generate_brand_health_overview(
         brand_obj = {
             "Topic": str(b),
             "Sentiment": sentiment_dict,
+            "DateGranularity": granularity,
+            "DateRange": {"StartDate": str(start or ""), "EndDate": str(end or "")},
             "MentionsByDate": mentions_by_date_arr,
+            "MentionsWithoutDate": int(undated.get(b, 0)),
             "MentionsByChannel": mentions_by_channel_arr,
             "SocialPostOverview": social_post_overview_arr,
             "Engagement": engagement_arr
@@ -271,8 +424,11 @@ def generate_top_post_details(
     comments_col: str = "Comments",
     shares_col: str = "Shares",
     views_col: str = "Views",
+    engagement_col: str = "Engagement",
     top_n: int = 20,
     max_comments: int = 30,
+    clusters=None,
+    backend=None,
 ) -> list:
     """
     Returns a list of dictionaries.
@@ -298,12 +454,30 @@ def generate_top_post_details(
       ]
     }
     """
+    top_n = _int_param(params, "top_n", top_n)
+    max_comments = _int_param(params, "max_comments", max_comments)
+
     # Prepare the list that will hold per-topic details
     output = []
 
     # Get unique topics from the DataFrame
     topics = df[topic_col].dropna().unique().tolist()
 
+    # Aggregate data at the post level for every topic at once, on `backend`
+    # (see backends.py; pandas by default). Posts without a url, title or
+    # date are kept, grouped together.
+    if backend is None:
+        backend = PandasBackend(df)
+    post_level = backend.group_aggregate(
+        [topic_col, url_col, title_col, date_col],
+        {
+            "Mentions": ('count', id_col),  # We'll treat each row as 1 mention
+            **{col: ('sum', col) for col in [reactions_col, comments_col, shares_col, views_col]},
+            engagement_col: ('sum', engagement_col),  # Reactions + Comments + Shares + Views
+        },
+        dropna=False,
+    )
+
     for t in topics:
         # Filter the DataFrame for the current topic
         topic_df = df[df[topic_col] == t]
@@ -312,34 +486,10 @@ def generate_top_post_details(
             output.append({"Topic": t, "TopPost": []})
             continue
 
-        # Aggregate data at the post level
-        aggregated = (
-            topic_df
-            .groupby([url_col, title_col, date_col], dropna=False)
-            .agg({
-                id_col: "count",  # We'll treat each row as 1 mention
-                reactions_col: "sum",
-                comments_col: "sum",
-                shares_col: "sum",
-                views_col: "sum"
-            })
-            .reset_index()
-            .rename(columns={id_col: "Mentions"})
-        )
+        aggregated = post_level[post_level[topic_col] == t]
 
-        # Compute total engagement = Reactions + Comments + Shares + Views
-        aggregated["EngagementSum"] = (
-            aggregated[reactions_col]
-            + aggregated[comments_col]
-            + aggregated[shares_col]
-            + aggregated[views_col]
-        )
-
-        # Sort by "Mentions" descending
-        aggregated.sort_values(by="Mentions", ascending=False, inplace=True)
-
-        # Select top N posts
-        top_posts_df = aggregated.head(top_n)
+        # Select top N posts by "Mentions" (partial selection, no full sort)
+        top_posts_df = aggregated.nlargest(top_n, "Mentions", keep="first")
 
         # Build the list of post objects for the topic
         topic_top_posts = []
@@ -351,10 +501,10 @@ def generate_top_post_details(
                 (topic_df[date_col] == row[date_col])
             ]
 
-            # Gather up to max_comments unique user comments
-            all_comments = matching_df[content_col].dropna().unique().tolist()
-            if len(all_comments) > max_comments:
-                all_comments = random.sample(all_comments, max_comments)
+            # Gather up to max_comments unique user comments (with how often each was posted)
+            all_comments, comment_counts = _distinct_contents(
+                matching_df, max_comments, content_col=content_col, clusters=clusters
+            )
 
             # Construct the post object
             post_obj = {
@@ -366,9 +516,10 @@ def generate_top_post_details(
                     "Comments": int(row[comments_col]),
                     "Shares": int(row[shares_col]),
                     "Views": int(row[views_col]),
-                    "Engagement": int(row["EngagementSum"]),
+                    "Engagement": int(row[engagement_col]),
                 },
                 "Content": all_comments,
+                "ContentCount": comment_counts,
                 "Date": str(row[date_col]) if pd.notnull(row[date_col]) else "",
             }
 
@@ -400,7 +551,12 @@ def generate_channel_details(
     # For the "Mention" count, we simply use row counts. 
     # If your dataset has a separate "Mentions" column, 
     # you can adapt it here.
+    max_sites: int = None,            # None => all sites per channel
+    max_posts_per_site: int = None,   # None => all posts per site
+    clusters=None,
 ) -> dict:
+    max_sites = _int_param(params, "max_sites", max_sites)
+    max_posts_per_site = _int_param(params, "max_posts_per_site", max_posts_per_site)
     
     # 1) Identify the single brand name in the dataset.
     #    If you have multiple, pick the first or adapt as needed.
@@ -442,6 +598,7 @@ def generate_channel_details(
         #   We define "top post" as the one with the highest row count or 
         #   highest total (Reactions + Comments + Shares). 
         #   Let's pick by greatest total engagement for demonstration.
+        #   (Views are left out here, unlike the Engagement column.)
         
         # Group by (UrlTopic, Title, SiteName) 
         # Summation of Reactions, Comments, Shares => total engagement
@@ -453,7 +610,6 @@ def generate_channel_details(
                 reactions_col: "sum",
                 comments_col: "sum",
                 shares_col: "sum",
-                # If you have 'Views', add it as well
                 "Id": "count"  # or any unique column for counting mentions
             })
             .rename(columns={"Id": "Mentions"})
@@ -467,8 +623,8 @@ def generate_channel_details(
             + group_top_post[shares_col]
         )
         
-        # Sort by engagement descending
-        group_top_post = group_top_post.sort_values("Engagement", ascending=False)
+        # Keep only the highest-engagement post
+        group_top_post = group_top_post.nlargest(1, "Engagement", keep="first")
         
         if not group_top_post.empty:
             top_post_row = group_top_post.iloc[0]
@@ -483,20 +639,17 @@ def generate_channel_details(
             matching_top_df = channel_df[
                 (channel_df[url_col] == top_post_url) & (channel_df[title_col] == top_post_title)
             ]
-            top_post_contents = (
-                matching_top_df[content_col]
-                .dropna()
-                .unique()
-                .tolist()
-            )
             # If you want to limit the number of comments (e.g., 30 max):
-            top_post_contents = top_post_contents[:30]
+            top_post_contents, top_post_content_counts = _distinct_contents(
+                matching_top_df, 30, sample=False, content_col=content_col, clusters=clusters
+            )
             
             top_post_dict = {
                 "UrlTopic": str(top_post_url) if pd.notnull(top_post_url) else "",
                 "Title": str(top_post_title) if pd.notnull(top_post_title) else "",
                 "Mentions": top_post_mentions,
                 "Content": top_post_contents,
+                "ContentCount": top_post_content_counts,
                 "Engagement": top_post_engagement,
                 "SiteName": str(top_post_site) if pd.notnull(top_post_site) else "",
             }
@@ -507,61 +660,55 @@ def generate_channel_details(
                 "Title": "",
                 "Mentions": 0,
                 "Content": [],
+                "ContentCount": [],
                 "Engagement": 0,
                 "SiteName": "",
             }
 
         # ----- 2d) top_sites: List of site names sorted by mention in descending order -----
-        # Group by SiteName => get mention count => sort
+        # Group by SiteName => get mention count => keep the top max_sites
         site_groups = (
             channel_df
             .groupby(site_col, dropna=False)[url_col]
             .count()  # count how many rows/URL references
             .reset_index(name="mentions")
-            .sort_values("mentions", ascending=False)
         )
+        site_groups = _top_k_per_group(site_groups, [], "mentions", max_sites)
+
+        # For each site, a list of top posts (UrlTopic & Title) sorted by
+        # mention, computed for all sites of the channel in one groupby.
+        site_posts = (
+            channel_df
+            .groupby([site_col, url_col, title_col], dropna=False)
+            .agg({
+                reactions_col: "sum",
+                comments_col: "sum",
+                shares_col: "sum",
+                "Id": "count"
+            })
+            .rename(columns={"Id": "Mentions"})
+            .reset_index()
+        )
+        site_posts = _top_k_per_group(site_posts, [site_col], "Mentions", max_posts_per_site)
+        titles_by_site = {}
+        for post_site, post_url, post_title, post_mention_count in zip(
+            site_posts[site_col], site_posts[url_col], site_posts[title_col], site_posts["Mentions"]
+        ):
+            # Build a "Title" entry
+            titles_by_site.setdefault(None if pd.isna(post_site) else post_site, []).append({
+                "UrlTopic": str(post_url) if pd.notnull(post_url) else "",
+                "Title": str(post_title) if pd.notnull(post_title) else "",
+                "Mentions": int(post_mention_count)
+            })
         
         site_list = []
         for _, site_row in site_groups.iterrows():
             site_name_val = site_row[site_col]
+            titles = titles_by_site.get(None if pd.isna(site_name_val) else site_name_val, [])
             if pd.isna(site_name_val):
                 site_name_val = "UnknownSite"
             mention_val = int(site_row["mentions"])
             
-            # For each site, gather a list of top posts (UrlTopic & Title)  
-            # sorted by mention. 
-            site_df = channel_df[channel_df[site_col] == site_row[site_col]]
-            site_posts = (
-                site_df
-                .groupby([url_col, title_col], dropna=False)[
-                    [reactions_col, comments_col, shares_col, "Id"]
-                ]
-                .agg({
-                    reactions_col: "sum",
-                    comments_col: "sum",
-                    shares_col: "sum",
-                    "Id": "count"
-                })
-                .rename(columns={"Id": "Mentions"})
-                .reset_index()
-            )
-
-            # Sort by Mentions or Engagement, depending on your requirement
-            site_posts = site_posts.sort_values("Mentions", ascending=False)
-            
-            titles = []
-            for __, post_row in site_posts.iterrows():
-                post_url   = post_row[url_col]
-                post_title = post_row[title_col]
-                post_mention_count = int(post_row["Mentions"])
-                
-                # Build a "Title" entry
-                titles.append({
-                    "UrlTopic": str(post_url) if pd.notnull(post_url) else "",
-                    "Title": str(post_title) if pd.notnull(post_title) else "",
-                    "Mentions": post_mention_count
-                })
-            
             site_list.append({
                 "SiteName": str(site_name_val),
                 "mentions": mention_val,
@@ -602,6 +749,7 @@ def generate_brand_sentiment_details(
     site_col: str = "SiteName",
     content_col: str = "Content",
     max_comments_per_sentiment: int = 100,  # max random comments per brand+sentiment
+    clusters=None,
 ) -> Dict[str, Any]:
     """
     Processes the DataFrame to extract sentiment details per brand by sampling comments first.
@@ -613,6 +761,8 @@ def generate_brand_sentiment_details(
     Returns:
         dict: A dictionary containing sentiment details structured by brand.
     """
+    max_comments_per_sentiment = _int_param(params, "max_comments_per_sentiment", max_comments_per_sentiment)
+
     # Final output
     output = {
         "Topic": []
@@ -648,14 +798,18 @@ def generate_brand_sentiment_details(
             # Total number of mentions for this brand+sentiment############ thêm 1 for cho mỗi sentiment
             total_senti_mentions = len(senti_df)
 
-            # Sample up to max_comments_per_sentiment comments
-            sampled_comments = senti_df[content_col].dropna().unique().tolist()
-            if len(sampled_comments) > max_comments_per_sentiment:
-                sampled_comments = random.sample(sampled_comments, max_comments_per_sentiment)
+            # Sample up to max_comments_per_sentiment distinct comments
+            # (near-identical comments count as one when clusters are given)
+            _, _, sampled_keys = _distinct_contents(
+                senti_df, max_comments_per_sentiment, content_col=content_col, clusters=clusters, return_keys=True
+            )
 
-            # Get the rows corresponding to the sampled comments
+            # Get the rows corresponding to the sampled comments (matched on their key)
             # To ensure we get unique posts, we need to retrieve the posts containing these comments
-            sampled_rows = senti_df[senti_df[content_col].isin(sampled_comments)]
+            sampled_rows = senti_df[
+                np.isin(_content_keys(senti_df, content_col, clusters=clusters), sampled_keys)
+                & senti_df[content_col].notna().to_numpy()
+            ]
 
             # Group the sampled rows by UrlTopic to reconstruct posts
             grouped = sampled_rows.groupby(url_col, dropna=False)
@@ -672,13 +826,14 @@ def generate_brand_sentiment_details(
                     (brand_df[sentiment_col] == sentiment_type)
                 ].shape[0]
 
-                # Gather unique comments from the sampled group
-                contents = group[content_col].dropna().unique().tolist()
+                # Gather unique comments from the sampled group, with their repeat counts
+                contents, content_counts = _distinct_contents(group, content_col=content_col, clusters=clusters)
 
                 post_groups.append({
                     "UrlTopic":  str(urlv) if pd.notnull(urlv) else "",
                     "Title":     str(first_row[title_col]) if pd.notnull(first_row[title_col]) else "",
                     "Content":   contents,
+                    "ContentCount": content_counts,
                     "ChannelDeep": str(first_row[channel_col]) if pd.notnull(first_row[channel_col]) else "",
                     "Date":      str(first_row[date_col]) if pd.notnull(first_row[date_col]) else "",
                     "SiteName":  str(first_row[site_col]) if pd.notnull(first_row[site_col]) else "",
@@ -723,24 +878,38 @@ def generate_label_details(
     comments_col: str = "Comments",
     shares_col: str = "Shares",
     views_col: str = "Views",
+    engagement_col: str = "Engagement",
     id_col: str = "Id",
     max_posts_per_sentiment: int = 20,  # Limit to 20 posts per sentiment
-    max_comments_in_post: int = 20      # Limit random sampling of comments within each post
+    max_comments_in_post: int = 20,     # Limit random sampling of comments within each post
+    series=None,
+    clusters=None
 ) -> list:
     """
     Returns a list of Topics, each with a "Label" list. 
     For each label:
-      - 'Date': a list of all (date, mention_count)
+      - 'Date': a list of all (date, mention_count), by day, week or month
+        ('DateGranularity') depending on the date range and the number of labels
       - 'SentimentDetails': up to 20 posts for each sentiment (Positive, Neutral, Negative).
         The first post in each sentiment includes the 'mentions' key (total for that sentiment).
       - 'TopPost': a single post (highest Mentions) with up to max_comments_in_post comments.
     """
+    max_posts_per_sentiment = _int_param(params, "max_posts_per_sentiment", max_posts_per_sentiment)
+    max_comments_in_post = _int_param(params, "max_comments_in_post", max_comments_in_post)
 
     output = []
 
     # 1) Unique Topics
     topics = df[topic_col].dropna().unique().tolist()
 
+    # One date granularity for every label, chosen so that all the 'Date'
+    # arrays together stay within the date point budget
+    if series is None:
+        series = build_daily_series(df)
+    n_labels = int(df[[topic_col, label_col]].dropna().drop_duplicates().shape[0])
+    start, end = series_range(series, params)
+    granularity = series_granularity(series, params, n_series=n_labels, budget=DEFAULT_DATE_POINT_BUDGET)
+
     for t in topics:
         # Subset for this Topic
         topic_df = df[df[topic_col] == t]
@@ -768,17 +937,12 @@ def generate_label_details(
             channel_val = label_df[channel_col].dropna().unique()
             channel_str = str(channel_val[0]) if len(channel_val) > 0 else ""
 
-            # 3) Build the "Date" array
-            date_agg = (
-                label_df
-                .groupby(date_col).size()
-                .reset_index(name="mention_count")
-            )
+            # 3) Build the "Date" array from the precomputed label series
             date_list = []
-            for _, row_d in date_agg.iterrows():
+            for bucket_date, mention_count in series.buckets("label", (t, l), granularity, start, end):
                 date_list.append({
-                    "DateofMetions": str(row_d[date_col]),
-                    "mentions": int(row_d["mention_count"])
+                    "DateofMetions": str(bucket_date),
+                    "mentions": mention_count
                 })
 
             # 4) SentimentDetails: up to 20 posts per sentiment
@@ -809,9 +973,8 @@ def generate_label_details(
                     .rename(columns={id_col: "Mentions"})
                 )
 
-                # Sort by Mentions descending, then take top 20 groups
-                grouped_posts.sort_values(by="Mentions", ascending=False, inplace=True)
-                top_posts_df = grouped_posts.head(max_posts_per_sentiment)
+                # Take the top groups by Mentions (partial selection, no full sort)
+                top_posts_df = grouped_posts.nlargest(max_posts_per_sentiment, "Mentions", keep="first")
 
                 # We’ll build one item per "post" in top_posts_df
                 items = []
@@ -823,9 +986,9 @@ def generate_label_details(
                         (sub_df[channel_col] == grow[channel_col])
                     ]
                     # Gather all content from these rows (randomly sampling if > max_comments_in_post)
-                    content_list = post_match[content_col].dropna().unique().tolist()
-                    if len(content_list) > max_comments_in_post:
-                        content_list = random.sample(content_list, max_comments_in_post)
+                    content_list, content_counts = _distinct_contents(
+                        post_match, max_comments_in_post, content_col=content_col, clusters=clusters
+                    )
 
                     # For the very first item in this sentiment, include 'mentions'
                     if idx == top_posts_df.index[0]:
@@ -836,14 +999,16 @@ def generate_label_details(
                             "UrlTopic":  str(grow[url_col]) if pd.notnull(grow[url_col]) else "",
                             "Title":     str(grow[title_col]) if pd.notnull(grow[title_col]) else "",
                             "ChannelDeep": str(grow[channel_col]) if pd.notnull(grow[channel_col]) else "",
-                            "Content":   content_list
+                            "Content":   content_list,
+                            "ContentCount": content_counts
                         }
                     else:
                         item_obj = {
                             "UrlTopic":  str(grow[url_col]) if pd.notnull(grow[url_col]) else "",
                             "Title":     str(grow[title_col]) if pd.notnull(grow[title_col]) else "",
                             "ChannelDeep": str(grow[channel_col]) if pd.notnull(grow[channel_col]) else "",
-                            "Content":   content_list
+                            "Content":   content_list,
+                            "ContentCount": content_counts
                         }
 
                     items.append(item_obj)
@@ -859,18 +1024,13 @@ def generate_label_details(
                     reactions_col: "sum",
                     comments_col: "sum",
                     shares_col:   "sum",
-                    views_col:    "sum"
+                    views_col:    "sum",
+                    engagement_col: "sum"
                 })
                 .reset_index()
                 .rename(columns={id_col: "Mentions"})
             )
-            grouped_posts_top["EngagementSum"] = (
-                grouped_posts_top[reactions_col]
-                + grouped_posts_top[comments_col]
-                + grouped_posts_top[shares_col]
-                + grouped_posts_top[views_col]
-            )
-            grouped_posts_top.sort_values(by="Mentions", ascending=False, inplace=True)
+            grouped_posts_top = grouped_posts_top.nlargest(1, "Mentions", keep="first")
 
             if grouped_posts_top.empty:
                 top_post = {
@@ -884,7 +1044,8 @@ def generate_label_details(
                         "Views": 0,
                         "Engagement": 0
                     },
-                    "Content": []
+                    "Content": [],
+                    "ContentCount": []
                 }
             else:
                 best_row = grouped_posts_top.iloc[0]
@@ -892,10 +1053,10 @@ def generate_label_details(
                     (label_df[url_col] == best_row[url_col]) &
                     (label_df[title_col] == best_row[title_col])
                 ]
-                post_comments = best_match[content_col].dropna().unique().tolist()
-                # Randomly limit post comments
-                if len(post_comments) > max_comments_in_post:
-                    post_comments = random.sample(post_comments, max_comments_in_post)
+                # Distinct comments, randomly limited to max_comments_in_post
+                post_comments, post_comment_counts = _distinct_contents(
+                    best_match, max_comments_in_post, content_col=content_col, clusters=clusters
+                )
 
                 top_post = {
                     "UrlTopic": str(best_row[url_col]) if pd.notnull(best_row[url_col]) else "",
@@ -906,9 +1067,10 @@ def generate_label_details(
                         "Comments":    int(best_row[comments_col]),
                         "Shares":      int(best_row[shares_col]),
                         "Views":       int(best_row[views_col]),
-                        "Engagement":  int(best_row["EngagementSum"])
+                        "Engagement":  int(best_row[engagement_col])
                     },
-                    "Content": post_comments
+                    "Content": post_comments,
+                    "ContentCount": post_comment_counts
                 }
 
             # 6) Build the final label dictionary
@@ -916,6 +1078,7 @@ def generate_label_details(
                 "Value":       str(l),
                 "Mentions":    label_mentions,
                 "ChannelDeep": channel_str,
+                "DateGranularity": granularity,
                 "Date":        date_list,
                 "SentimentDetails": sentiment_details,
                 "TopPost":     top_post
@@ -929,7 +1092,16 @@ def generate_label_details(
 
 #########################################################################################
 
-def get_daily_detail_data(df, params, brand_col='Topic', date_col='FormattedDate'):
+def get_daily_detail_data(
+    df,
+    params,
+    brand_col='Topic',
+    date_col='FormattedDate',
+    top_sites=None,      # None => all sites per day
+    top_channels=None,   # None => all channels per day
+    top_posts=5,
+    backend=None,
+):
     """
     Build a dictionary with key "daily" containing a list of daily insights 
     for each (brand, date), including:
@@ -940,69 +1112,45 @@ def get_daily_detail_data(df, params, brand_col='Topic', date_col='FormattedDate
       - top channels (with sentiment breakdown)
       - top posts (with sentiment breakdown)
 
+    top_sites, top_channels and top_posts can be overridden from the tool
+    params and are selected per (brand, date) without sorting every group.
+    The group-by aggregations run on `backend` (see backends.py; pandas by
+    default).
+
     Return structure matches the JSON schema given in get_daily_detail function declaration.
     """
-
-    # 1) Ensure numeric columns exist; fill missing with 0
-    for col in ['Reactions', 'Comments', 'Shares', 'Views']:
-        if col not in df.columns:
-            df[col] = 0
-        df[col] = df[col].fillna(0)
-
-    # 2) Ensure 'Sentiment' exists & fill NA
-    if 'Sentiment' not in df.columns:
-        df['Sentiment'] = 'NA'
-    df['Sentiment'] = df['Sentiment'].fillna('NA')
-
-    # 3) Convert date_col to datetime.date if present
-    if date_col in df.columns:
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce').dt.date
-    else:
-        # If date_col is missing, just store None
-        df[date_col] = None
+    top_sites = _int_param(params, "top_sites", top_sites)
+    top_channels = _int_param(params, "top_channels", top_channels)
+    top_posts = _int_param(params, "top_posts", top_posts)
+
+    # The frame is shared with the other tools (and may be read by several
+    # threads), so it is only read here. format_social_listening_data has
+    # already made date_col datetime.date and added Engagement; rows without
+    # a sentiment count as mentions in no sentiment.
+    if date_col not in df.columns:
+        # No dates, no daily items
+        return {"daily": []}
+
+    if backend is None:
+        backend = PandasBackend(df)
+
+    # Per-group engagement (Reactions + Comments + Shares + Views)
+    interaction_sums = {
+        'Engagement': ('sum', 'Engagement'),
+    }
 
     # ------------------------------------------------------------------
     # A) AGGREGATE brand+date-level data (mentions, engagement, sentiment)
     # ------------------------------------------------------------------
     # A1) brand+date main aggregator
-    agg_main = (
-        df
-        .groupby([brand_col, date_col], dropna=True)
-        .agg({
-            'Id':        'count',    # = number of rows => mentions
-            'Reactions': 'sum',
-            'Comments':  'sum',
-            'Shares':    'sum',
-            'Views':     'sum'
-        })
-        .reset_index()
-        .rename(columns={'Id': 'mentions'})
-    )
-    agg_main['engagement'] = (
-        agg_main['Reactions'] +
-        agg_main['Comments'] +
-        agg_main['Shares']   +
-        agg_main['Views']
+    agg_main = backend.group_aggregate(
+        [brand_col, date_col],
+        {'mentions': ('count', 'Id'), **interaction_sums},  # mentions = number of rows
     )
+    agg_main['engagement'] = agg_main['Engagement']
 
-    # A2) brand+date+sentiment aggregator
-    agg_sentiment = (
-        df
-        .groupby([brand_col, date_col, 'Sentiment'])
-        .size()
-        .reset_index(name='Count')
-    )
-    pivot_sentiment = agg_sentiment.pivot_table(
-        index=[brand_col, date_col],
-        columns='Sentiment',
-        values='Count',
-        fill_value=0
-    ).reset_index()
-
-    # Ensure Negative / Neutral / Positive columns exist
-    for needed_col in ['Negative','Neutral','Positive']:
-        if needed_col not in pivot_sentiment.columns:
-            pivot_sentiment[needed_col] = 0
+    # A2) brand+date+sentiment aggregator (Negative / Neutral / Positive columns)
+    pivot_sentiment = backend.sentiment_breakdown([brand_col, date_col]).drop(columns='mention_count')
 
     # Merge main aggregator + sentiment pivot
     merged_main = pd.merge(
@@ -1013,163 +1161,88 @@ def get_daily_detail_data(df, params, brand_col='Topic', date_col='FormattedDate
     )
 
     # ------------------------------------------------------------------
-    # B) For site-level sentiment, we do brand+date+site+sentiment
+    # B) Site-level mentions + sentiment: brand+date+site => counts
     # ------------------------------------------------------------------
-    site_agg = (
-        df
-        .groupby([brand_col, date_col, 'SiteName', 'Sentiment'])
-        .size()
-        .reset_index(name='Count')
-    )
-    # We'll store it in a dict-of-dicts so we can quickly look up 
-    # sentiment counts by (brand, date, site).
-    # e.g. site_sentiment_dict[(brand_val, date_val, siteName)] = {"Positive": x, "Neutral": y, "Negative": z}
-    site_sentiment_dict = {}
-    for _, row in site_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        s = row['SiteName']
-        sent = row['Sentiment']
-        c   = row['Count']
-
-        key = (b, d, s)
-        if key not in site_sentiment_dict:
-            site_sentiment_dict[key] = {"Positive": 0, "Neutral": 0, "Negative": 0}
-        if sent in ["Positive","Neutral","Negative"]:
-            site_sentiment_dict[key][sent] = c
-
-    # For site mention count (regardless of sentiment), just group brand+date+site => size
-    site_mentions_agg = (
-        df
-        .groupby([brand_col, date_col, 'SiteName'])
-        .size()
-        .reset_index(name='mention_count')
-    )
-    # We'll build a dictionary of site => mention_count
-    site_mentions_dict = {}
-    for _, row in site_mentions_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        s = row['SiteName']
-        cnt = row['mention_count']
-        site_mentions_dict[(b,d,s)] = cnt
+    site_agg = backend.sentiment_breakdown([brand_col, date_col, 'SiteName'])
+    site_agg = _top_k_per_group(site_agg, [brand_col, date_col], 'mention_count', top_sites)
+
+    # sub_sites_dict[(brand, date)] = [site item, ...] in descending order of mentions
+    sub_sites_dict = defaultdict(list)
+    for b, d, s_name, mention_count, sent_pos, sent_neu, sent_neg in zip(
+        site_agg[brand_col], site_agg[date_col], site_agg['SiteName'], site_agg['mention_count'],
+        site_agg['Positive'], site_agg['Neutral'], site_agg['Negative']
+    ):
+        sub_sites_dict[(b, d)].append({
+            "siteName":       s_name,
+            "mentions":       int(mention_count),
+            "sentiment_pos":  str(sent_pos),
+            "sentiment_neu":  str(sent_neu),
+            "sentiment_neg":  str(sent_neg),
+        })
 
     # ------------------------------------------------------------------
-    # C) For channel-level sentiment, brand+date+ChannelDeep+sentiment
+    # C) Channel-level mentions + sentiment: brand+date+ChannelDeep => counts
     # ------------------------------------------------------------------
-    channel_agg = (
-        df
-        .groupby([brand_col, date_col, 'ChannelDeep', 'Sentiment'])
-        .size()
-        .reset_index(name='Count')
-    )
-    channel_sentiment_dict = {}
-    for _, row in channel_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        c = row['ChannelDeep']
-        s = row['Sentiment']
-        cnt = row['Count']
-
-        key = (b, d, c)
-        if key not in channel_sentiment_dict:
-            channel_sentiment_dict[key] = {"Positive": 0, "Neutral": 0, "Negative": 0}
-        if s in ["Positive","Neutral","Negative"]:
-            channel_sentiment_dict[key][s] = cnt
-
-    # brand+date+channel => mention_count
-    channel_mentions_agg = (
-        df
-        .groupby([brand_col, date_col, 'ChannelDeep'])
-        .size()
-        .reset_index(name='mention_count')
-    )
-    channel_mentions_dict = {}
-    for _, row in channel_mentions_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        c = row['ChannelDeep']
-        mention_ct = row['mention_count']
-        channel_mentions_dict[(b,d,c)] = mention_ct
+    channel_agg = backend.sentiment_breakdown([brand_col, date_col, 'ChannelDeep'])
+    channel_agg = _top_k_per_group(channel_agg, [brand_col, date_col], 'mention_count', top_channels)
+
+    sub_channels_dict = defaultdict(list)
+    for b, d, ch_name, mention_count, sent_pos, sent_neu, sent_neg in zip(
+        channel_agg[brand_col], channel_agg[date_col], channel_agg['ChannelDeep'], channel_agg['mention_count'],
+        channel_agg['Positive'], channel_agg['Neutral'], channel_agg['Negative']
+    ):
+        sub_channels_dict[(b, d)].append({
+            "channelDeep":    ch_name,
+            "mentions":       int(mention_count),
+            "sentiment_pos":  str(sent_pos),
+            "sentiment_neu":  str(sent_neu),
+            "sentiment_neg":  str(sent_neg),
+        })
 
     # ------------------------------------------------------------------
-    # D) For top posts (with sentiment breakdown), brand+date+ParentId+sentiment
+    # D) For top posts (with sentiment breakdown), brand+date+ParentId
     # ------------------------------------------------------------------
-    post_agg = (
-        df
-        .groupby([brand_col, date_col, 'ParentId', 'Sentiment'])
-        .size()
-        .reset_index(name='Count')
-    )
-    post_sentiment_dict = {}
-    for _, row in post_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        pid = row['ParentId']
-        s = row['Sentiment']
-        cnt = row['Count']
-
-        key = (b, d, pid)
-        if key not in post_sentiment_dict:
-            post_sentiment_dict[key] = {"Positive": 0, "Neutral": 0, "Negative": 0}
-        if s in ["Positive","Neutral","Negative"]:
-            post_sentiment_dict[key][s] = cnt
-
     # For post mentions + engagement, brand+date+ParentId => sum
-    post_main_agg = (
-        df
-        .groupby([brand_col, date_col, 'ParentId'])
-        .agg({
-            'Id':        'count',
-            'Reactions': 'sum',
-            'Comments':  'sum',
-            'Shares':    'sum',
-            'Views':     'sum'
-        })
-        .reset_index()
-        .rename(columns={'Id': 'mention_count'})
+    post_main_agg = backend.group_aggregate(
+        [brand_col, date_col, 'ParentId'],
+        {'mention_count': ('count', 'Id'), **interaction_sums},
     )
-    post_main_agg['engagement_sum'] = (
-        post_main_agg['Reactions']
-        + post_main_agg['Comments']
-        + post_main_agg['Shares']
-        + post_main_agg['Views']
+    post_main_agg['engagement_sum'] = post_main_agg['Engagement']
+    # Keep the top posts per (brand, date) by mention count before joining
+    # their sentiment breakdown
+    post_main_agg = _top_k_per_group(post_main_agg, [brand_col, date_col], 'mention_count', top_posts)
+    post_main_agg = pd.merge(
+        post_main_agg,
+        backend.sentiment_breakdown([brand_col, date_col, 'ParentId']).drop(columns='mention_count'),
+        on=[brand_col, date_col, 'ParentId'],
+        how='left'
     )
 
     # We'll need Title and UrlTopic from the first row with that ParentId
-    # Let's keep them in a dictionary for quick lookup.
-    title_lookup = {}
-    url_lookup   = {}
-    # Because we might have multiple rows with the same ParentId, pick the first
-    # row (or any row).
-    df_sorted = df.sort_values(by=['ParentId','Id'])  # just to ensure a stable order
-    for _, row in df_sorted.iterrows():
-        pid = row.get('ParentId', None)
-        if pid not in title_lookup:
-            title_lookup[pid] = row.get('Title', None)
-            url_lookup[pid]   = row.get('UrlTopic', None)
+    # (in ParentId, Id order, just to ensure a stable choice).
+    first_rows = (
+        df
+        .sort_values(by=['ParentId', 'Id'])
+        .drop_duplicates(subset='ParentId')
+    )
+    title_lookup = dict(zip(first_rows['ParentId'], first_rows['Title'] if 'Title' in df.columns else [None] * len(first_rows)))
+    url_lookup   = dict(zip(first_rows['ParentId'], first_rows['UrlTopic'] if 'UrlTopic' in df.columns else [None] * len(first_rows)))
 
     # Convert post_main_agg to a dictionary keyed by (brand, date)
     # with a list of posts
-    from collections import defaultdict
     post_data_dict = defaultdict(list)
-    for _, row in post_main_agg.iterrows():
-        b = row[brand_col]
-        d = row[date_col]
-        pid   = row['ParentId']
-        m_cnt = int(row['mention_count'])
-        e_sum = int(row['engagement_sum'])
-
-        # get sentiment breakdown from post_sentiment_dict
-        pos_ct = post_sentiment_dict.get((b,d,pid), {}).get("Positive", 0)
-        neu_ct = post_sentiment_dict.get((b,d,pid), {}).get("Neutral", 0)
-        neg_ct = post_sentiment_dict.get((b,d,pid), {}).get("Negative", 0)
-
-        post_data_dict[(b,d)].append({
+    for b, d, pid, m_cnt, e_sum, pos_ct, neu_ct, neg_ct in zip(
+        post_main_agg[brand_col], post_main_agg[date_col], post_main_agg['ParentId'],
+        post_main_agg['mention_count'], post_main_agg['engagement_sum'],
+        post_main_agg['Positive'].fillna(0).astype(int),
+        post_main_agg['Neutral'].fillna(0).astype(int),
+        post_main_agg['Negative'].fillna(0).astype(int)
+    ):
+        post_data_dict[(b, d)].append({
             "parentId":     str(pid),  # cast to string for schema
             "title":        title_lookup.get(pid, None) or "",
-            "engagement":   e_sum,
-            "mentions":     m_cnt,
+            "engagement":   int(e_sum),
+            "mentions":     int(m_cnt),
             "urlTopic":     url_lookup.get(pid, None) or "",
             "sentiment_pos": str(pos_ct),
             "sentiment_neu": str(neu_ct),
@@ -1190,54 +1263,8 @@ def get_daily_detail_data(df, params, brand_col='Topic', date_col='FormattedDate
         neu_ct = int(row['Neutral'])
         neg_ct = int(row['Negative'])
 
-        # 1) Gather top_sites: we need siteName + mention_count + sentiment
-        #    We'll use site_mentions_dict & site_sentiment_dict for brand/date
-        #    Then we'll sort in descending order of mention_count
-        sub_sites = []
-        # collect all sites for (b,d,*)
-        for (bb,dd,s_name) in site_mentions_dict.keys():
-            if bb == b and dd == d:
-                mention_count = site_mentions_dict[(bb,dd,s_name)]
-                sent_pos = site_sentiment_dict.get((bb,dd,s_name),{}).get("Positive", 0)
-                sent_neu = site_sentiment_dict.get((bb,dd,s_name),{}).get("Neutral", 0)
-                sent_neg = site_sentiment_dict.get((bb,dd,s_name),{}).get("Negative", 0)
-
-                sub_sites.append({
-                    "siteName":       s_name,
-                    "mentions":       mention_count,
-                    "sentiment_pos":  str(sent_pos),
-                    "sentiment_neu":  str(sent_neu),
-                    "sentiment_neg":  str(sent_neg),
-                })
-        # sort sub_sites descending by "mentions"
-        sub_sites.sort(key=lambda x: x['mentions'], reverse=True)
-
-        # 2) Gather top_channels
-        sub_channels = []
-        for (bb,dd,ch_name) in channel_mentions_dict.keys():
-            if bb == b and dd == d:
-                mention_count = channel_mentions_dict[(bb,dd,ch_name)]
-                sent_pos = channel_sentiment_dict.get((bb,dd,ch_name),{}).get("Positive", 0)
-                sent_neu = channel_sentiment_dict.get((bb,dd,ch_name),{}).get("Neutral", 0)
-                sent_neg = channel_sentiment_dict.get((bb,dd,ch_name),{}).get("Negative", 0)
-
-                sub_channels.append({
-                    "channelDeep":    ch_name,
-                    "mentions":       mention_count,
-                    "sentiment_pos":  str(sent_pos),
-                    "sentiment_neu":  str(sent_neu),
-                    "sentiment_neg":  str(sent_neg),
-                })
-        sub_channels.sort(key=lambda x: x['mentions'], reverse=True)
-
-        # 3) Gather top_posts
-        #    post_data_dict[(b,d)] is a list of all posts => we can pick top 5 by mention or engagement
-        all_posts = post_data_dict.get((b,d), [])
-        # let's pick top 5 by mention_count (or choose another metric if desired)
-        all_posts.sort(key=lambda x: x['mentions'], reverse=True)
-        top_posts = all_posts[:5]
-
-        # 4) Build daily item
+        # Build daily item; top_sites / top_channels / top_posts are already
+        # in descending order of mentions and cut to the requested size
         daily_item = {
             "datetime.date":  d.isoformat() if d else None,  # store as YYYY-MM-DD string
             "Topic":          b,
@@ -1247,9 +1274,9 @@ def get_daily_detail_data(df, params, brand_col='Topic', date_col='FormattedDate
             "sentiment_pos":  str(pos_ct),
             "sentiment_neu":  str(neu_ct),
             "sentiment_neg":  str(neg_ct),
-            "top_sites":      sub_sites,
-            "top_channels":   sub_channels,
-            "top_posts":      top_posts
+            "top_sites":      sub_sites_dict.get((b, d), []),
+            "top_channels":   sub_channels_dict.get((b, d), []),
+            "top_posts":      post_data_dict.get((b, d), [])
         }
 
         daily_list.append(daily_item)
@@ -0,0 +1,126 @@
+# functions/limiter.py
+#
+# Process-wide limit on concurrent LLM requests. Every request sent to the
+# model (each attempt of the call policy, hedges included) holds a slot
+# until it returns; when all slots are busy, requests wait in a
+# first-come first-served queue, so a burst of users neither exceeds the
+# Vertex AI quota nor starves anyone.
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Concurrent LLM requests per process (Streamlit server or API server)
+LLM_CONCURRENCY = int(os.environ.get("INSIGHT_LLM_CONCURRENCY", 4))
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders of a slot at a time. Waiters are admitted
+    strictly in arrival order and can be told their queue position while
+    they wait. Recent queue wait times are kept for stats().
+    """
+
+    def __init__(self, limit, history=1000):
+        self.limit = max(int(limit), 1)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queue = deque()
+        self._waits = deque(maxlen=history)
+        self._requests = 0
+
+    def _admit(self, ticket):
+        if self._queue[0] is ticket and self._active < self.limit:
+            self._queue.popleft()
+            self._active += 1
+            # The next waiter may fit as well, and everyone moved up
+            self._cond.notify_all()
+            return True
+        return False
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free and nobody is waiting, without waiting; release() it."""
+        with self._cond:
+            if self._queue or self._active >= self.limit:
+                return False
+            self._active += 1
+            self._waits.append(0.0)
+            self._requests += 1
+            return True
+
+    def acquire(self, on_wait=None, poll=0.5) -> float:
+        """
+        Wait for a slot and take it; returns the seconds spent waiting.
+        on_wait(position), if given, is called whenever the position in the
+        queue (1 = next) changes while waiting. The slot must be release()d.
+        """
+        ticket = object()
+        started = time.perf_counter()
+        last_position = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._admit(ticket):
+                        break
+                    position = self._queue.index(ticket) + 1
+                    if position == last_position:
+                        self._cond.wait(poll)
+                        continue
+                last_position = position
+                if on_wait:
+                    on_wait(position)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._cond:
+            self._waits.append(waited)
+            self._requests += 1
+        if waited >= 1:
+            logger.info("LLM request waited %.1fs in the queue", waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, on_wait=None, poll=0.5):
+        """Hold a slot for the duration of the block; yields the seconds spent waiting (see acquire())."""
+        waited = self.acquire(on_wait, poll)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Current load and queue wait times (seconds) of recent requests."""
+        with self._cond:
+            waits = np.array(self._waits, dtype=float)
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": len(self._queue),
+                "requests": self._requests,
+                "wait_p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "wait_p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                "wait_max": float(waits.max()) if len(waits) else 0.0,
+            }
+
+
+# Shared by every chat session of the process
+LLM_LIMITER = ConcurrencyLimiter(LLM_CONCURRENCY)
@@ -0,0 +1,208 @@
+# functions/neardup.py
+
+import numpy as np
+import pandas as pd
+
+from .functions import hash_content
+from .search import TOKEN_PATTERN, fold_series
+
+# MinHash signature length and LSH banding: with 16 bands of 4 rows, two
+# comments become candidates with probability ~64% at Jaccard similarity
+# 0.5 and ~98% at 0.7 (over character 4-grams of the folded words, so
+# case, diacritics, punctuation and emoji are ignored)
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4
+SHINGLE_SIZE = 4
+# Candidates are kept in a cluster only if their signatures agree with the
+# cluster's first member on at least this share of positions (estimated
+# Jaccard similarity)
+MIN_SIMILARITY = 0.6
+
+_rng = np.random.default_rng(20240101)
+_PERM_A = _rng.integers(1, 2**63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, NUM_PERMUTATIONS, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2**63, BAND_ROWS, dtype=np.uint64) | np.uint64(1)
+_SHINGLE_BASE = np.uint64(1000003)
+
+
+def minhash_signatures(texts, shingle_size=SHINGLE_SIZE):
+    """
+    MinHash signatures (len(texts) x NUM_PERMUTATIONS, uint32) of the
+    character shingles of each text, computed with numpy over all texts at
+    once. Texts shorter than shingle_size are a single shingle.
+    """
+    pad = np.zeros(shingle_size - 1, dtype=np.uint32)
+    codes = [np.frombuffer(t.encode("utf-32-le"), dtype=np.uint32) for t in texts]
+    lengths = np.array([len(c) for c in codes], dtype=np.int64)
+    chars = np.concatenate([np.concatenate([c, pad]) for c in codes] + [pad]).astype(np.uint64)
+
+    # Rolling polynomial hash of every shingle; each text is followed by
+    # padding, so a text of length L has exactly L shingles
+    n = len(chars) - shingle_size + 1
+    shingles = np.zeros(n, dtype=np.uint64)
+    for j in range(shingle_size):
+        shingles = shingles * _SHINGLE_BASE + chars[j:j + n]
+    starts = np.concatenate([[0], np.cumsum(lengths + shingle_size - 1)[:-1]])
+    keep = np.repeat(starts, lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+    shingles = shingles[keep]
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint32)
+    for k in range(NUM_PERMUTATIONS):
+        permuted = ((shingles * _PERM_A[k] + _PERM_B[k]) >> np.uint64(32)).astype(np.uint32)
+        signatures[:, k] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def _band_keys(signatures, start, band_rows):
+    """One bucket key (uint64) per row for the band of columns start:start + band_rows."""
+    band = signatures[:, start:start + band_rows].astype(np.uint64)
+    return (band * _BAND_MIX[:band.shape[1]]).sum(axis=1)
+
+
+def lsh_buckets(signatures, band_rows=BAND_ROWS) -> list:
+    """Per band, a Series mapping each bucket key to the smallest row in that bucket."""
+    rows = np.arange(len(signatures))
+    buckets = []
+    for start in range(0, signatures.shape[1], band_rows):
+        codes, keys = pd.factorize(_band_keys(signatures, start, band_rows))
+        smallest = np.full(len(keys), len(signatures))
+        np.minimum.at(smallest, codes, rows)
+        buckets.append(pd.Series(smallest, index=keys))
+    return buckets
+
+
+def lsh_assign(signatures, first, leaders, buckets, band_rows=BAND_ROWS, min_similarity=MIN_SIMILARITY):
+    """
+    Cluster the rows first: of signatures against every row (see
+    lsh_clusters()). `leaders` (the leader of each row before first) and
+    `buckets` (lsh_buckets() of those rows) come from clustering them; the
+    earlier rows keep their leaders, since a row only ever joins a smaller
+    one. Returns the representative of each new row, the leaders of all
+    rows, and the buckets of all rows.
+    """
+    n = len(signatures)
+    rows = np.arange(first, n)
+    new = signatures[first:]
+
+    def similar(other):
+        return (new == signatures[other]).mean(axis=1) >= min_similarity
+
+    leader = rows.copy()
+    buckets = list(buckets)
+    for band, start in enumerate(range(0, signatures.shape[1], band_rows)):
+        codes, keys = pd.factorize(_band_keys(new, start, band_rows))
+        smallest = np.full(len(keys), n)
+        np.minimum.at(smallest, codes, rows)
+        # A bucket that already has rows keeps its (smaller) first row
+        known = buckets[band] if band < len(buckets) else pd.Series([], dtype=np.int64)
+        pos = known.index.get_indexer(keys)
+        # (pos -1, a new bucket, picks the trailing n)
+        smallest = np.minimum(smallest, np.append(known.to_numpy(), n)[pos])
+        added = pd.Series(smallest[pos < 0], index=keys[pos < 0])
+        if band < len(buckets):
+            buckets[band] = pd.concat([known, added])
+        else:
+            buckets.append(added)
+
+        candidate = smallest[codes]
+        better = candidate < leader
+        better[better] = similar(candidate)[better]
+        leader = np.where(better, candidate, leader)
+
+    leaders = np.concatenate([leaders, leader])
+    root = leader.copy()
+    while True:
+        parent = leaders[root]
+        if (parent == root).all():
+            break
+        root = parent
+    return np.where(similar(root), root, leader), leaders, buckets
+
+
+def lsh_clusters(signatures, band_rows=BAND_ROWS, min_similarity=MIN_SIMILARITY):
+    """
+    Cluster signatures whose LSH bands collide. Each row joins the smallest
+    row index it shares a band bucket with and is similar to (its leader);
+    chains of leaders are followed as long as the end of the chain is still
+    similar, so loosely connected comments do not all merge. Returns, for
+    each row, the row index of its cluster's representative.
+    """
+    representatives, _, _ = lsh_assign(
+        signatures, 0, np.empty(0, dtype=np.int64), [], band_rows, min_similarity
+    )
+    return representatives
+
+
+class NearDuplicateIndex:
+    """
+    Near-duplicate clusters of the distinct comments of a dataset. Every
+    ContentHash maps to a cluster id, which is the ContentHash of the
+    cluster's first member, so unclustered comments keep their own hash.
+    Appended comments are banded and clustered against the existing
+    buckets; the clusters of the comments already indexed do not change.
+    """
+
+    def __init__(self, content_col="Content", hash_col="ContentHash"):
+        self.content_col = content_col
+        self.hash_col = hash_col
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.signatures = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint32)
+        self.cluster_ids = np.empty(0, dtype=np.int64)
+        self.leaders = np.empty(0, dtype=np.int64)
+        self._lookup = pd.Index(self.hashes)
+        # LSH buckets of the signatures (see lsh_buckets()); not saved with
+        # the index, rebuilt from the signatures on the next add()
+        self._buckets = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_buckets"] = None
+        return state
+
+    def add(self, df, start=0):
+        if self.content_col not in df.columns:
+            return self
+        rows = df.iloc[start:]
+        contents = rows[self.content_col]
+        hashes = rows[self.hash_col].to_numpy() if self.hash_col in rows.columns else hash_content(contents)
+        valid = contents.notna().to_numpy()
+
+        # Only distinct comments not seen before get a signature
+        new = pd.DataFrame({"hash": hashes[valid], "text": contents[valid].to_numpy()})
+        new = new.drop_duplicates("hash")
+        new = new[self._lookup.get_indexer(new["hash"].to_numpy()) < 0]
+        folded = fold_series(new["text"]).str.findall(TOKEN_PATTERN).str.join(" ")
+        new = new[folded.str.len().to_numpy() > 0]
+        if new.empty:
+            return self
+
+        if self._buckets is None:
+            self._buckets = lsh_buckets(self.signatures)
+        first = len(self.hashes)
+        self.hashes = np.concatenate([self.hashes, new["hash"].to_numpy(dtype=np.int64)])
+        self.signatures = np.vstack([self.signatures, minhash_signatures(folded[folded.str.len() > 0].tolist())])
+        representatives, self.leaders, self._buckets = lsh_assign(self.signatures, first, self.leaders, self._buckets)
+        self.cluster_ids = np.concatenate([self.cluster_ids, self.hashes[representatives]])
+        self._lookup = pd.Index(self.hashes)
+        return self
+
+    def cluster_of(self, hashes):
+        """Cluster id of each content hash (the hash itself if it is not indexed)."""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        pos = self._lookup.get_indexer(hashes)
+        return np.where(pos >= 0, self.cluster_ids[pos], hashes)
+
+    def describe(self) -> dict:
+        return {
+            "DistinctComments": int(len(self.hashes)),
+            "Clusters": int(len(np.unique(self.cluster_ids))),
+        }
+
+
+def build_near_duplicates(df):
+    return NearDuplicateIndex().add(df)
+
+
+def update_near_duplicates(index, df, start):
+    return index.add(df, start)
@@ -0,0 +1,214 @@
+# functions/pagination.py
+#
+# Drill-down paging of large tool results for the chat loop. A paged tool's
+# full result is kept in a ResultCache and the model gets a summary: the
+# result expanded level by level while it fits a size budget, with every
+# deeper list replaced by {"Count", "Cursor"}. The fetch_more tool returns
+# the subtree behind a cursor the same way, so the model only receives the
+# brand / label / date detail it asks for.
+
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+SUMMARY_BUDGET = 8000   # characters of JSON per summary or page
+PAGE_SIZE = 25          # list items per page
+INLINE_ITEMS = 8        # flat lists/dicts of at most this many items ...
+INLINE_CHARS = 300      # ... and this many characters are never collapsed
+MAX_DEPTH = 6
+
+# Fields used to name list items in the readable path of a page
+ITEM_NAME_FIELDS = ["Topic", "Value", "datetime.date", "DateofMetions", "Title", "siteName", "channelDeep"]
+
+
+def _daily_by_brand(result):
+    """
+    Regroup get_daily_detail's flat (date, brand) rows by brand, with brand
+    totals, so the summary lists brands and a cursor pages one brand's dates.
+    """
+    brands = OrderedDict()
+    for row in result.get("daily", []):
+        brand = brands.setdefault(row.get("Topic"), {
+            "Topic": row.get("Topic"), "Mention": 0, "engagement": 0, "FirstDate": None, "LastDate": None, "Dates": [],
+        })
+        brand["Mention"] += row.get("Mention") or 0
+        brand["engagement"] += row.get("engagement") or 0
+        date = row.get("datetime.date")
+        brand["FirstDate"] = brand["FirstDate"] or date
+        brand["LastDate"] = date
+        brand["Dates"].append({k: v for k, v in row.items() if k != "Topic"})
+    return {"daily": list(brands.values())}
+
+
+# Tools whose results are summarized with cursors -> optional function
+# reshaping the full result before it is cached
+PAGED_TOOLS = {
+    "get_label_details": None,
+    "get_daily_detail": _daily_by_brand,
+}
+
+
+class CachedResult:
+    """A full tool result and the cursors handed out into it."""
+
+    def __init__(self, result_id, tool_name, result):
+        self.result_id = result_id
+        self.tool_name = tool_name
+        self.result = result
+        self._locations = []   # cursor number -> (path, offset)
+        self._numbers = {}     # (path, offset) -> cursor number
+        self._lock = threading.Lock()
+
+    def cursor(self, path, offset=0) -> str:
+        key = (tuple(path), offset)
+        with self._lock:
+            if key not in self._numbers:
+                self._numbers[key] = len(self._locations)
+                self._locations.append(key)
+            return f"{self.result_id}.{self._numbers[key]}"
+
+    def location(self, number):
+        """(path, offset) of a cursor number, or None."""
+        with self._lock:
+            return self._locations[number] if 0 <= number < len(self._locations) else None
+
+
+class ResultCache:
+    """Least recently used full tool results, by result id."""
+
+    def __init__(self, max_results=32):
+        self.max_results = max_results
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, tool_name, result) -> CachedResult:
+        entry = CachedResult(uuid.uuid4().hex[:8], tool_name, result)
+        with self._lock:
+            self._results[entry.result_id] = entry
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return entry
+
+    def resolve(self, cursor):
+        """(entry, path, offset) of an opaque cursor, or None if unknown or expired."""
+        result_id, _, number = str(cursor or "").partition(".")
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is not None:
+                self._results.move_to_end(result_id)
+        location = entry.location(int(number)) if entry is not None and number.isdigit() else None
+        return None if location is None else (entry, list(location[0]), location[1])
+
+
+def _is_inline(value):
+    """Scalars and short flat lists/dicts are shown as they are."""
+    if isinstance(value, (dict, list)):
+        values = value.values() if isinstance(value, dict) else value
+        return (
+            len(value) <= INLINE_ITEMS
+            and not any(isinstance(v, (dict, list)) for v in values)
+            and len(json.dumps(value, ensure_ascii=False, default=str)) <= INLINE_CHARS
+        )
+    return True
+
+
+def _render(value, entry, path, depth, offset=0):
+    """
+    `value` with lists expanded down to `depth` levels (dicts do not count
+    as a level); deeper lists become {"Count", "Cursor"} stubs and longer
+    lists are cut to PAGE_SIZE items followed by a {"More", "Cursor"} item.
+    """
+    if _is_inline(value):
+        return value
+    if isinstance(value, dict):
+        return {k: _render(v, entry, path + [k], depth) for k, v in value.items()}
+    if depth == 0:
+        return {"Count": len(value), "Cursor": entry.cursor(path)}
+
+    page = [
+        _render(v, entry, path + [offset + i], depth - 1)
+        for i, v in enumerate(value[offset:offset + PAGE_SIZE])
+    ]
+    if offset + PAGE_SIZE < len(value):
+        page.append({"More": len(value) - offset - PAGE_SIZE, "Cursor": entry.cursor(path, offset + PAGE_SIZE)})
+    return page
+
+
+def render_within_budget(value, entry, path=(), offset=0, budget=SUMMARY_BUDGET):
+    """The deepest rendering of value whose JSON fits the budget (at least one level)."""
+    path = list(path)
+    best = _render(value, entry, path, 1, offset)
+    for depth in range(2, MAX_DEPTH + 1):
+        rendered = _render(value, entry, path, depth, offset)
+        if len(json.dumps(rendered, ensure_ascii=False, default=str)) > budget:
+            break
+        best = rendered
+        if rendered == value:
+            break
+    return best
+
+
+def summarize_result(tool_name, result, cache, budget=SUMMARY_BUDGET):
+    """
+    The result itself if it fits the budget, otherwise a summary with
+    cursors into the full result, which is kept in the cache.
+    """
+    if len(json.dumps(result, ensure_ascii=False, default=str)) <= budget:
+        return result
+    reshape = PAGED_TOOLS.get(tool_name)
+    entry = cache.put(tool_name, reshape(result) if reshape else result)
+    return {
+        "Summary": render_within_budget(entry.result, entry, budget=budget),
+        "Note": "Lists shown as Count/Cursor (or More/Cursor) were left out; call fetch_more with a cursor for that detail.",
+    }
+
+
+def _path_name(result, path):
+    """Readable location of a subtree, e.g. 'C > Label: Delivery > Date'."""
+    names = []
+    node = result
+    for key in path:
+        node = node[key]
+        if isinstance(key, int):
+            fields = [f for f in ITEM_NAME_FIELDS if isinstance(node, dict) and f in node][:2]
+            name = " ".join(str(node[f]) for f in fields) if fields else f"#{key}"
+            names[-1:] = [f"{names[-1]}: {name}" if names else name]
+        else:
+            names.append(str(key))
+    return " > ".join(names)
+
+
+def fetch_more_data(params, cache, budget=SUMMARY_BUDGET) -> dict:
+    """
+    Page into a cached result. params:
+      - cursor (required): a Cursor from a summary or from a previous page
+    """
+    resolved = cache.resolve(params.get("cursor"))
+    if resolved is None:
+        return {"Error": "Unknown or expired cursor; call the original tool again."}
+
+    entry, path, offset = resolved
+    node = entry.result
+    for key in path:
+        node = node[key]
+
+    page = {"Tool": entry.tool_name, "Path": _path_name(entry.result, path)}
+    if isinstance(node, list):
+        page.update(Total=len(node), Offset=offset)
+    page["Items"] = render_within_budget(node, entry, path, offset, budget)
+    return page
+
+
+def paginate_handler(function_handler, cache) -> dict:
+    """
+    Wrap a chat function handler (tool name -> callable(params)) so the
+    paged tools return summaries, and add fetch_more.
+    """
+    handler = dict(function_handler)
+    for name in PAGED_TOOLS:
+        if name in handler:
+            handler[name] = (lambda p, name=name, call=handler[name]: summarize_result(name, call(p), cache))
+    if any(name in function_handler for name in PAGED_TOOLS):
+        handler["fetch_more"] = lambda p: fetch_more_data(p, cache)
+    return handler
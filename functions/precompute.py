@@ -0,0 +1,114 @@
+# functions/precompute.py
+#
+# Background preparation of a freshly loaded dataset: the derived indexes
+# and the results of the tools most first questions call, so the first
+# answer does not pay for them.
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .tools import available_tools, run_tool
+
+logger = logging.getLogger(__name__)
+
+# Tools run with their default params right after a dataset is loaded
+PRECOMPUTE_TOOLS = ["brand_health_overview", "get_channel_detail", "get_daily_detail"]
+
+# pandas and numpy release the GIL for most of the work, and the results
+# must end up in this process's Dataset, so threads rather than processes
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="precompute")
+
+
+class Precomputation:
+    """One background preparation of a dataset and its progress."""
+
+    def __init__(self, dataset, tools=None):
+        self.dataset = dataset
+        self.indexes = dataset.missing_indexes()
+        self.tools = [t for t in (PRECOMPUTE_TOOLS if tools is None else tools) if t in available_tools(dataset)]
+        self.done = 0
+        self.current = None
+        self.failed = []
+        self.seconds = None
+        self._started = time.perf_counter()
+        self._finished = threading.Event()
+        self._cancelled = threading.Event()
+        self._future = None
+
+    @property
+    def total(self):
+        return len(self.indexes) + len(self.tools)
+
+    def run(self):
+        try:
+            for name in self.indexes:
+                if self._cancelled.is_set():
+                    return
+                self.current = name
+                try:
+                    self.dataset.index(name)
+                except Exception as e:
+                    logger.error(f"Precomputing index {name} of {self.dataset.name} failed: {e}")
+                    self.failed.append(name)
+                self.done += 1
+            # Save the new indexes with the dataset so a reopen skips them
+            if self.indexes and not self._cancelled.is_set():
+                self.dataset.persist()
+
+            for name in self.tools:
+                if self._cancelled.is_set():
+                    return
+                self.current = name
+                future = self.dataset.reserve_result(name, {})
+                if future is not None:
+                    try:
+                        future.set_result(run_tool(self.dataset, name, {}, use_cache=False))
+                    except Exception as e:
+                        logger.error(f"Precomputing {name} for {self.dataset.name} failed: {e}")
+                        future.set_exception(e)
+                        self.failed.append(name)
+                self.done += 1
+        finally:
+            self.current = None
+            self.seconds = time.perf_counter() - self._started
+            self._finished.set()
+            if self._cancelled.is_set():
+                logger.info("Stopped precomputing %s after %.1fs", self.dataset.name, self.seconds)
+            else:
+                logger.info("Precomputed %s in %.1fs", self.dataset.name, self.seconds)
+
+    def cancel(self):
+        """Stop before the next step (a job still queued does not start)."""
+        self._cancelled.set()
+        if self._future is not None and self._future.cancel():
+            self.seconds = time.perf_counter() - self._started
+            self._finished.set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._finished.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "Ready": self._finished.is_set(),
+            "Cancelled": self._cancelled.is_set(),
+            "Done": self.done,
+            "Total": self.total,
+            "Current": self.current,
+            "Failed": list(self.failed),
+            "Seconds": self.seconds if self.seconds is not None else time.perf_counter() - self._started,
+        }
+
+
+def start_precompute(dataset, tools=None) -> Precomputation:
+    """
+    Start preparing `dataset` on the background pool and return the job. A
+    job still running for the dataset is stopped first.
+    """
+    if dataset.precomputation is not None:
+        dataset.precomputation.cancel()
+    job = Precomputation(dataset, tools)
+    dataset.precomputation = job
+    job._future = _executor.submit(job.run)
+    return job
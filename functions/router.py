@@ -0,0 +1,201 @@
+# functions/router.py
+#
+# Sends each question to the model it needs. Simple lookups ("how many
+# mentions did brand A get yesterday") go to the fast model with a short
+# answer instruction, and when the one tool they need already has a
+# precomputed result, that result is sent with the question so the answer
+# takes a single round-trip. Questions asking for analysis,
+# recommendations or many tools go to the pro model. The models share the
+# conversation history, and every decision is logged (optionally as JSON
+# lines in INSIGHT_ROUTING_LOG) to tune the rules below.
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from .budget import TurnBudget
+from .chat import FAST_MODEL_NAME, INSIGHT_INSTRUCTION, LOOKUP_INSTRUCTION, MODEL_NAME, create_chat_model, run_chat_turn
+from .search import fold_text
+
+logger = logging.getLogger(__name__)
+
+# "0" sends every question to the pro model
+ROUTING_ENABLED = os.environ.get("INSIGHT_ROUTING", "1") != "0"
+# JSON-lines file receiving one record per routed question
+ROUTING_LOG = os.environ.get("INSIGHT_ROUTING_LOG")
+
+# Keywords are matched as whole words (plus -s/-es/-ed/-ing) on folded text
+# (lower case, no diacritics), so 'phân tích' matches 'phan tich' and
+# 'mention' matches 'mentions'
+DEEP_KEYWORDS = [
+    "insight", "why", "recommend", "suggest", "strategy", "strategic", "explain", "analysis", "analyze",
+    "analyse", "reason", "cause", "driver", "impact", "improve", "evaluate", "assess", "summary",
+    "summarize", "report", "implication", "should", "evolve", "evolution",
+    "tai sao", "vi sao", "phan tich", "de xuat", "goi y", "chien luoc", "giai thich", "danh gia",
+    "nhan dinh", "tom tat", "bao cao", "nen lam",
+]
+SIMPLE_KEYWORDS = [
+    "how many", "how much", "count", "number of", "total", "top", "which", "list", "what is", "what was",
+    "bao nhieu", "tong", "liet ke", "la gi",
+]
+# Tool -> keywords showing the question needs it
+TOOL_KEYWORDS = {
+    "brand_health_overview": [
+        "mention", "engagement", "buzz", "share of voice", "sov", "overview", "sentiment",
+        "thao luan", "tuong tac", "cam xuc", "tong quan",
+    ],
+    "get_channel_detail": [
+        "channel", "platform", "facebook", "tiktok", "youtube", "instagram", "forum", "news site",
+        "kenh", "nen tang",
+    ],
+    "get_daily_detail": [
+        "daily", "per day", "each day", "yesterday", "today", "date", "over time", "timeline", "trend",
+        "hom qua", "hom nay", "moi ngay", "theo ngay", "xu huong",
+    ],
+    "get_top_post_details": ["top post", "viral", "most engaged", "best performing", "bai dang", "bai viet"],
+    "get_brand_sentiment_detail": ["positive", "negative", "complain", "complaint", "praise", "tich cuc", "tieu cuc", "phan nan"],
+    "get_label_details": ["label", "topic", "theme", "attribute", "chu de"],
+    "search_mentions": ["search", "containing", "mentions of", "quote", "tim kiem"],
+    "compare_periods": ["compare", "versus", "vs", "week over week", "month over month", "previous", "so voi", "so sanh"],
+    "detect_spikes": ["spike", "peak", "surge", "anomaly", "anomalies", "unusual", "dot bien", "tang vot"],
+    "compare_datasets": ["campaign", "dataset", "last campaign", "other file", "chien dich"],
+}
+SHORT_QUESTION_WORDS = 8    # questions this short are lookups unless they ask for analysis
+LONG_QUESTION_WORDS = 30    # questions this long always go to the pro model
+MAX_FAST_TOOLS = 2          # questions needing more tools go to the pro model
+
+
+def _matches(text, keywords):
+    return [k for k in keywords if re.search(r"\b" + re.escape(k) + r"(?:s|es|ed|ing)?\b", text)]
+
+
+def classify_question(prompt, tool_names=None) -> dict:
+    """
+    Route a question: "fast" for lookups, "deep" for insight writing.
+    Returns the route, the reason, the question's word count and the tools
+    it appears to need (among tool_names, if given).
+    """
+    text = fold_text(prompt)
+    words = len(text.split())
+    tools = [
+        name for name, keywords in TOOL_KEYWORDS.items()
+        if (tool_names is None or name in tool_names) and _matches(text, keywords)
+    ]
+    decision = {"words": words, "tools": tools}
+
+    deep = _matches(text, DEEP_KEYWORDS)
+    simple = _matches(text, SIMPLE_KEYWORDS)
+    if not ROUTING_ENABLED:
+        return dict(decision, route="deep", reason="routing disabled")
+    if deep:
+        return dict(decision, route="deep", reason=f"asks for analysis ({deep[0]!r})")
+    if words > LONG_QUESTION_WORDS:
+        return dict(decision, route="deep", reason=f"long question ({words} words)")
+    if len(tools) > MAX_FAST_TOOLS:
+        return dict(decision, route="deep", reason=f"needs {len(tools)} tools")
+    if simple:
+        return dict(decision, route="fast", reason=f"lookup ({simple[0]!r})")
+    if words <= SHORT_QUESTION_WORDS:
+        return dict(decision, route="fast", reason=f"short question ({words} words)")
+    return dict(decision, route="deep", reason="no lookup pattern")
+
+
+class ChatRouter:
+    """
+    A conversation whose questions are routed between `models` ("fast" and
+    "deep" chat models). Only tool_names, if given, count as tool needs.
+    answer_models, if given, are the same models with tool calling
+    disabled, for answers past the turn budget (see run_chat_turn).
+    """
+
+    def __init__(self, models, tool_names=None, log_path=ROUTING_LOG, answer_models=None):
+        self.models = models
+        self.answer_models = answer_models or {}
+        self.tool_names = list(tool_names) if tool_names is not None else None
+        self.log_path = log_path
+        # Content of the whole conversation, whichever model answered
+        self.history = []
+        self._log_lock = threading.Lock()
+
+    def _log(self, record):
+        logger.info(
+            "Routed question to %s (%s), %d tool call(s), %.1fs",
+            record["route"], record["reason"], len(record["tool_calls"]), record["seconds"],
+        )
+        if not self.log_path:
+            return
+        try:
+            with self._log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write routing log {self.log_path}: {e}")
+
+    def send(self, prompt, function_handler, is_cached=None, **kwargs) -> str:
+        """
+        Answer the prompt on the routed model; kwargs are passed to
+        run_chat_turn. is_cached(tool_name), if given, tells whether a tool's
+        result for default params is ready to be sent with a lookup.
+        """
+        decision = classify_question(prompt, self.tool_names)
+        route, model = decision["route"], decision["route"]
+        record = dict(decision, question=prompt[:200])
+
+        prefetched = None
+        tools = decision["tools"]
+        if route == "fast" and len(tools) == 1 and tools[0] in function_handler and is_cached and is_cached(tools[0]):
+            prefetched = tools[0]
+            route = "direct"
+            result = function_handler[prefetched]({})
+            prompt += (
+                f"\n\nResult of {prefetched} for the whole dataset (already retrieved; call a tool only "
+                f"if the question needs other data):\n{json.dumps(result, ensure_ascii=False, default=str)}"
+            )
+
+        tool_calls = []
+
+        def counted(name, call):
+            def handler(params):
+                tool_calls.append(name)
+                return call(params)
+            return handler
+
+        handler = {name: counted(name, call) for name, call in function_handler.items()}
+        budget = kwargs.pop("budget", None) or TurnBudget()
+        session = self.models[model].start_chat(history=list(self.history))
+        record.update(route=route, prefetched=prefetched)
+        started = time.perf_counter()
+        try:
+            text = run_chat_turn(
+                self.models[model], session, prompt, handler,
+                instruction=INSIGHT_INSTRUCTION if model == "deep" else LOOKUP_INSTRUCTION,
+                budget=budget,
+                answer_model=self.answer_models.get(model),
+                **kwargs,
+            )
+        except Exception as e:
+            record.update(tool_calls=tool_calls, seconds=time.perf_counter() - started, budget=budget.status(), error=type(e).__name__)
+            self._log(record)
+            raise
+        self.history = session.history
+        record.update(tool_calls=tool_calls, seconds=time.perf_counter() - started, budget=budget.status(), answer_chars=len(text))
+        self._log(record)
+        return text
+
+
+def create_chat_router(function_declarations, tool_names=None, system_instruction=None) -> ChatRouter:
+    """A ChatRouter over the pro and the fast Gemini models, with the same tools and system instruction."""
+    model_names = {"deep": MODEL_NAME, "fast": FAST_MODEL_NAME}
+    return ChatRouter(
+        {
+            route: create_chat_model(function_declarations, name, system_instruction)
+            for route, name in model_names.items()
+        },
+        tool_names,
+        answer_models={
+            route: create_chat_model(function_declarations, name, system_instruction, tool_calling=False)
+            for route, name in model_names.items()
+        },
+    )
@@ -0,0 +1,173 @@
+# functions/search.py
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Combining marks left after NFD normalization (Vietnamese tones and vowel marks)
+COMBINING_MARKS = "[\u0300-\u036f]"
+TOKEN_PATTERN = r"\w+"
+
+
+def fold_text(text):
+    """Lower-case a string and strip diacritics, e.g. 'Giao hàng Đẹp' -> 'giao hang dep'."""
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def fold_series(series):
+    """Vectorized fold_text() over a Series of strings."""
+    return (
+        series.fillna("").astype(str)
+        .str.lower()
+        .str.replace("đ", "d", regex=False)
+        .str.normalize("NFD")
+        .str.replace(COMBINING_MARKS, "", regex=True)
+    )
+
+
+def tokenize(text):
+    return re.findall(TOKEN_PATTERN, fold_text(text))
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over the folded Title and Content of every row.
+    Postings are kept as lists of sorted row-position chunks so appended
+    rows only add a chunk; chunks are merged lazily on lookup.
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> [np.ndarray of row positions, ...]
+
+    def add(self, df, start=0, text_cols=("Title", "Content")):
+        rows = df.iloc[start:]
+        text = pd.Series("", index=rows.index)
+        for col in text_cols:
+            if col in rows.columns:
+                text = text + " " + fold_series(rows[col])
+
+        tokens = text.str.findall(TOKEN_PATTERN).explode().dropna()
+        if tokens.empty:
+            return self
+
+        # Encode (token, row) pairs as one integer; np.unique both removes
+        # repeated tokens within a row and sorts by token, then row.
+        n_rows = len(rows)
+        codes, vocab = pd.factorize(tokens.to_numpy())
+        keys = np.unique(codes.astype(np.int64) * n_rows + rows.index.get_indexer(tokens.index))
+        codes, positions = np.divmod(keys, n_rows)
+        split_at = np.flatnonzero(np.diff(codes)) + 1
+        for code, chunk in zip(codes[np.r_[0, split_at]], np.split(positions + start, split_at)):
+            self.postings.setdefault(vocab[code], []).append(chunk)
+        return self
+
+    def lookup(self, token):
+        chunks = self.postings.get(token)
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def search(self, query):
+        """Row positions containing every token of the query (diacritics-insensitive)."""
+        terms = tokenize(query)
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        result = None
+        for term in sorted(set(terms), key=lambda t: len(self.lookup(t))):
+            postings = self.lookup(term)
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+
+def build_search_index(df):
+    return SearchIndex().add(df)
+
+
+def update_search_index(index, df, start):
+    return index.add(df, start)
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    parsed = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(parsed) else parsed.date()
+
+
+def search_mentions_data(
+    df,
+    params,
+    index=None,
+    brand_col: str = "Topic",
+    sentiment_col: str = "Sentiment",
+    date_col: str = "FormattedDate",
+    url_col: str = "UrlTopic",
+    title_col: str = "Title",
+    content_col: str = "Content",
+    channel_col: str = "ChannelDeep",
+    site_col: str = "SiteName",
+    default_limit: int = 20,
+    max_limit: int = 100,
+) -> dict:
+    """
+    Full-text search over Title and Content. params:
+      - query (required): words that must all appear, matched ignoring case
+        and Vietnamese diacritics
+      - brand, sentiment, start_date, end_date: optional filters
+      - limit: number of matching mentions returned (most recent first)
+
+    Returns the match counts by brand and sentiment plus the matching mentions.
+    """
+    # Imported here: functions.py imports this module (through timeseries.py)
+    from .functions import _int_param
+
+    if index is None:
+        index = build_search_index(df)
+
+    query = str(params.get("query") or "")
+    positions = index.search(query)
+    matches = df.iloc[positions]
+
+    brand = params.get("brand")
+    if brand:
+        matches = matches[fold_series(matches[brand_col]) == fold_text(brand)]
+    sentiment = params.get("sentiment")
+    if sentiment:
+        matches = matches[matches[sentiment_col].str.lower() == str(sentiment).lower()]
+    start_date = _parse_date(params.get("start_date"))
+    if start_date:
+        matches = matches[pd.to_datetime(matches[date_col], errors="coerce") >= pd.Timestamp(start_date)]
+    end_date = _parse_date(params.get("end_date"))
+    if end_date:
+        matches = matches[pd.to_datetime(matches[date_col], errors="coerce") <= pd.Timestamp(end_date)]
+
+    limit = min(max(_int_param(params, "limit", default_limit), 1), max_limit)
+    latest = matches.sort_values(date_col, ascending=False, kind="stable").head(limit)
+
+    mentions = []
+    for _, row in latest.iterrows():
+        mentions.append({
+            "Topic":       str(row[brand_col]),
+            "Date":        str(row[date_col]) if pd.notnull(row[date_col]) else "",
+            "Sentiment":   str(row[sentiment_col]) if pd.notnull(row[sentiment_col]) else "",
+            "ChannelDeep": str(row[channel_col]) if pd.notnull(row[channel_col]) else "",
+            "SiteName":    str(row[site_col]) if pd.notnull(row[site_col]) else "",
+            "UrlTopic":    str(row[url_col]) if pd.notnull(row[url_col]) else "",
+            "Title":       str(row[title_col]) if pd.notnull(row[title_col]) else "",
+            "Content":     str(row[content_col]) if pd.notnull(row[content_col]) else "",
+        })
+
+    return {
+        "Query": query,
+        "TotalMatches": int(len(matches)),
+        "MentionsByTopic": {str(k): int(v) for k, v in matches[brand_col].value_counts().items()},
+        "MentionsBySentiment": {str(k): int(v) for k, v in matches[sentiment_col].value_counts().items()},
+        "Mentions": mentions,
+    }
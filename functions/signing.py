@@ -0,0 +1,95 @@
+# functions/signing.py
+#
+# Signatures of the pickles this package reads back from disk: the indexes
+# in the footer of the Arrow files (dataset.py) and the tool results of the
+# disk cache (diskcache.py). Unpickling runs code, so data is only unpickled
+# after its HMAC-SHA256 matches; a file dropped into a shared store or cache
+# directory by anyone without the key is treated as unreadable.
+#
+# The key is INSIGHT_SIGNING_KEY, or else a random key created on first use
+# in INSIGHT_SIGNING_KEY_FILE (readable by its owner only). Processes that
+# share a store or cache directory must share the key.
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+SIGNING_KEY = os.environ.get("INSIGHT_SIGNING_KEY")
+SIGNING_KEY_FILE = os.environ.get(
+    "INSIGHT_SIGNING_KEY_FILE", os.path.join(os.path.expanduser("~"), ".insightchatbot", "signing.key")
+)
+
+SIGNATURE_BYTES = hashlib.sha256().digest_size
+# How long a process that lost the race to create the key file waits for the
+# winner to write the key into it
+KEY_FILE_WAIT_SECONDS = 2.0
+
+_key = None
+_key_lock = threading.Lock()
+
+
+class SignatureError(ValueError):
+    """Data whose signature is missing or does not match."""
+
+
+def _read_key_file(path, wait=KEY_FILE_WAIT_SECONDS) -> bytes:
+    """
+    The key in path. The file is empty between its creation and the write
+    of the key by the process that created it, so an empty file is read
+    again for up to `wait` seconds.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        with open(path, "rb") as fh:
+            key = fh.read().strip()
+        if key:
+            return key
+        if time.monotonic() >= deadline:
+            raise ValueError(f"Signing key file {path} is empty")
+        time.sleep(0.01)
+
+
+def _read_or_create_key_file(path) -> bytes:
+    try:
+        return _read_key_file(path)
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    key = secrets.token_hex(32).encode()
+    # Only one of the processes starting together creates the file; the
+    # others read the key it writes
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _read_key_file(path)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(key)
+    return key
+
+
+def signing_key() -> bytes:
+    """SIGNING_KEY, or the key of SIGNING_KEY_FILE (created if missing)."""
+    global _key
+    if SIGNING_KEY:
+        return SIGNING_KEY.encode()
+    with _key_lock:
+        if _key is None:
+            _key = _read_or_create_key_file(SIGNING_KEY_FILE)
+        return _key
+
+
+def sign(payload: bytes) -> bytes:
+    """payload preceded by its signature."""
+    return hmac.new(signing_key(), payload, hashlib.sha256).digest() + payload
+
+
+def verify(data: bytes) -> bytes:
+    """The payload of data written by sign(); SignatureError if it was not signed with this key."""
+    signature, payload = data[:SIGNATURE_BYTES], data[SIGNATURE_BYTES:]
+    expected = hmac.new(signing_key(), payload, hashlib.sha256).digest()
+    if len(signature) != SIGNATURE_BYTES or not hmac.compare_digest(signature, expected):
+        raise SignatureError("Signature missing or invalid")
+    return payload
@@ -0,0 +1,371 @@
+# functions/timeseries.py
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .search import _parse_date
+
+# Interaction columns summed into "Engagement" (same definition as the
+# brand health overview)
+ENGAGEMENT_COLS = ["Reactions", "Shares", "Comments", "Views"]
+
+# Breakdowns kept next to the per-brand totals: name -> extra key column
+SERIES_BREAKDOWNS = {
+    "brand": None,
+    "sentiment": "Sentiment",
+    "channel": "ChannelDeep",
+    "label": "Labels1",
+}
+
+# Date granularities, finest first, and the pandas period each rolls up to
+GRANULARITIES = {"day": "D", "week": "W-SUN", "month": "M"}
+
+# Default number of date points per series (one brand, one label, ...)
+# before the tools switch to a coarser granularity, and the default total
+# for all the date series of one tool result
+DEFAULT_MAX_DATE_POINTS = 90
+DEFAULT_DATE_POINT_BUDGET = 2000
+
+
+class DailySeries:
+    """
+    Cumulative daily mention counts and engagement per brand, brand x
+    sentiment and brand x channel, over every calendar day between the first
+    and last date of the dataset. The total over any date range is the
+    difference of two prefix-sum columns, so range totals and period
+    comparisons never touch the rows again.
+    """
+
+    def __init__(self, brand_col="Topic", date_col="FormattedDate"):
+        self.brand_col = brand_col
+        self.date_col = date_col
+        self.daily = {}    # breakdown -> daily Mentions/Engagement indexed by (key..., Date)
+        self.first_day = None
+        self.last_day = None
+        self.keys = {}     # breakdown -> {key: row}
+        self.mentions = {} # breakdown -> (n_keys, n_days + 1) prefix sums
+        self.engagement = {}
+        # Per-row brand code and day number (days since 1970-01-01), used to
+        # find the rows of one brand and day without scanning the frame
+        self.brand_codes = {}
+        self.row_brand = np.empty(0, dtype=np.int32)
+        self.row_day = np.empty(0, dtype=np.int32)
+
+    def add(self, df, start=0):
+        rows = df.iloc[start:]
+        if "Engagement" in rows.columns:
+            # Added by format_social_listening_data
+            engagement = rows["Engagement"].astype(float)
+        else:
+            engagement = pd.Series(0.0, index=rows.index)
+            for col in ENGAGEMENT_COLS:
+                if col in rows.columns:
+                    engagement = engagement + pd.to_numeric(rows[col], errors="coerce").fillna(0)
+
+        frame = pd.DataFrame({
+            "Brand": rows[self.brand_col],
+            "Date": pd.to_datetime(rows[self.date_col], errors="coerce").dt.normalize(),
+            "Engagement": engagement,
+        })
+
+        for brand in frame["Brand"].dropna().unique():
+            self.brand_codes.setdefault(brand, len(self.brand_codes))
+        row_brand = frame["Brand"].map(self.brand_codes).fillna(-1).to_numpy(dtype=np.int32)
+        row_day = ((frame["Date"] - pd.Timestamp(0)).dt.days).fillna(-1).to_numpy(dtype=np.int32)
+        self.row_brand = np.concatenate([self.row_brand, row_brand])
+        self.row_day = np.concatenate([self.row_day, row_day])
+        for breakdown, col in SERIES_BREAKDOWNS.items():
+            if col:
+                frame[breakdown] = rows[col] if col in rows.columns else np.nan
+        frame = frame.dropna(subset=["Brand", "Date"])
+
+        for breakdown, col in SERIES_BREAKDOWNS.items():
+            keys = ["Brand"] + ([breakdown] if col else []) + ["Date"]
+            agg = frame.groupby(keys).agg(
+                Mentions=("Engagement", "size"),
+                Engagement=("Engagement", "sum"),
+            )
+            if breakdown in self.daily:
+                agg = pd.concat([self.daily[breakdown], agg]).groupby(level=keys).sum()
+            self.daily[breakdown] = agg
+
+        self._accumulate()
+        return self
+
+    def _accumulate(self):
+        """Rebuild the prefix sums from the daily totals (keys x days, not rows)."""
+        dates = [agg.index.get_level_values("Date") for agg in self.daily.values() if len(agg)]
+        if not dates:
+            return
+        self.first_day = min(d.min() for d in dates)
+        self.last_day = max(d.max() for d in dates)
+        n_days = (self.last_day - self.first_day).days + 1
+
+        for breakdown, agg in self.daily.items():
+            key_index = agg.index.droplevel("Date")
+            codes, uniques = pd.factorize(key_index)
+            days = (agg.index.get_level_values("Date") - self.first_day).days.to_numpy()
+
+            mentions = np.zeros((len(uniques), n_days + 1), dtype=np.int64)
+            engagement = np.zeros((len(uniques), n_days + 1), dtype=np.float64)
+            mentions[codes, days + 1] = agg["Mentions"].to_numpy()
+            engagement[codes, days + 1] = agg["Engagement"].to_numpy()
+
+            self.keys[breakdown] = {key: row for row, key in enumerate(uniques)}
+            self.mentions[breakdown] = mentions.cumsum(axis=1)
+            self.engagement[breakdown] = engagement.cumsum(axis=1)
+
+    def _columns(self, start, end):
+        """Prefix-sum columns bounding [start, end], clipped to the data range."""
+        n_days = (self.last_day - self.first_day).days + 1
+        i = (pd.Timestamp(start) - self.first_day).days if start else 0
+        j = (pd.Timestamp(end) - self.first_day).days + 1 if end else n_days
+        return min(max(i, 0), n_days), min(max(j, 0), n_days)
+
+    def daily_counts(self, breakdown):
+        """(keys, (n_keys, n_days) daily mention counts) of a breakdown."""
+        return list(self.keys.get(breakdown, {})), np.diff(self.mentions.get(breakdown, np.zeros((0, 1))), axis=1)
+
+    def day_of(self, date):
+        """Position of a date in the daily arrays."""
+        return (pd.Timestamp(date) - self.first_day).days
+
+    def rows_of(self, brand, date):
+        """Row positions of the given brand on the given date."""
+        code = self.brand_codes.get(brand)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        day = (pd.Timestamp(date) - pd.Timestamp(0)).days
+        return np.flatnonzero((self.row_day == day) & (self.row_brand == code))
+
+    def _edges(self, granularity, i, j):
+        """Prefix-sum columns where the buckets of the given granularity start, plus j."""
+        days = self.first_day + pd.to_timedelta(np.arange(i, j), unit="D")
+        if granularity == "week":
+            starts = np.flatnonzero(days.dayofweek == 0)
+        elif granularity == "month":
+            starts = np.flatnonzero(days.day == 1)
+        else:
+            starts = np.arange(len(days))
+        return np.unique(np.r_[i, starts + i, j])
+
+    def buckets(self, breakdown, key, granularity="day", start=None, end=None) -> list:
+        """
+        [(bucket start date, mentions)] of one key over [start, end] rolled
+        up to the granularity, non-empty buckets only. Weeks start on Monday.
+        """
+        row = self.keys.get(breakdown, {}).get(key)
+        if row is None or self.first_day is None:
+            return []
+        i, j = self._columns(start, end)
+        if j <= i:
+            return []
+        edges = self._edges(granularity, i, j)
+        counts = np.diff(self.mentions[breakdown][row, edges])
+        labels = (self.first_day + pd.to_timedelta(edges[:-1], unit="D")).to_period(GRANULARITIES[granularity]).start_time
+        return [(label.date(), int(count)) for label, count in zip(labels, counts) if count]
+
+    def totals(self, breakdown, start=None, end=None) -> dict:
+        """{key: (mentions, engagement)} over [start, end] for every key of the breakdown."""
+        if self.first_day is None:
+            return {}
+        i, j = self._columns(start, end)
+        j = max(i, j)
+        mentions = self.mentions[breakdown][:, j] - self.mentions[breakdown][:, i]
+        engagement = self.engagement[breakdown][:, j] - self.engagement[breakdown][:, i]
+        return {
+            key: (int(mentions[row]), int(round(engagement[row])))
+            for key, row in self.keys[breakdown].items()
+        }
+
+    def total(self, breakdown, key, start=None, end=None):
+        """(mentions, engagement) of one key over [start, end]."""
+        row = self.keys.get(breakdown, {}).get(key)
+        if row is None or self.first_day is None:
+            return 0, 0
+        i, j = self._columns(start, end)
+        j = max(i, j)
+        return (
+            int(self.mentions[breakdown][row, j] - self.mentions[breakdown][row, i]),
+            int(round(self.engagement[breakdown][row, j] - self.engagement[breakdown][row, i])),
+        )
+
+
+def build_daily_series(df):
+    return DailySeries().add(df)
+
+
+def update_daily_series(series, df, start):
+    return series.add(df, start)
+
+
+def choose_granularity(first_day, last_day, max_points=DEFAULT_MAX_DATE_POINTS, requested=None):
+    """
+    Granularity for a date series over [first_day, last_day]: the requested
+    one if given, otherwise the finest one that needs at most max_points
+    buckets.
+    """
+    if requested in GRANULARITIES:
+        return requested
+    if first_day is None or last_day is None:
+        return "day"
+    for granularity, freq in GRANULARITIES.items():
+        n_buckets = pd.Period(last_day, freq).ordinal - pd.Period(first_day, freq).ordinal + 1
+        if n_buckets <= max_points:
+            return granularity
+    return "month"
+
+
+def series_range(series, params) -> tuple:
+    """
+    (start, end) dates of the date arrays of a tool: its start_date and
+    end_date params cut to the data range, by default the whole range
+    ((None, None) without dated rows).
+    """
+    if series.first_day is None:
+        return None, None
+    first, last = series.first_day.date(), series.last_day.date()
+    start, end = _period_params(params, "start_date", "end_date")
+    start = min(max(start or first, first), last)
+    end = max(min(end or last, last), start)
+    return start, end
+
+
+def series_granularity(series, params, n_series=1, max_points=DEFAULT_MAX_DATE_POINTS, budget=None):
+    """
+    Granularity for the date arrays of a tool returning n_series of them
+    over series_range(), from the tool params ("granularity",
+    "max_date_points") or else from max_points and an optional total budget
+    of date points shared by all series.
+    """
+    requested = str(params.get("granularity") or "auto").lower()
+    try:
+        max_points = max(int(params["max_date_points"]), 1)
+    except (KeyError, TypeError, ValueError):
+        if budget and n_series:
+            max_points = min(max_points, max(budget // n_series, 1))
+    start, end = series_range(series, params)
+    return choose_granularity(start, end, max_points, requested)
+
+
+def _change(current, previous):
+    return {
+        "Current": current,
+        "Previous": previous,
+        "Change": current - previous,
+        "ChangePct": round(100.0 * (current - previous) / previous, 2) if previous else None,
+    }
+
+
+def _clamp_period(start, end, first, last):
+    """[start, end] cut to the data range [first, last]; None if they do not overlap."""
+    if start > last or end < first:
+        return None
+    return max(start, first), min(end, last)
+
+
+def _period_params(params, start_key, end_key):
+    """The two dates of a period; a period given end first is swapped."""
+    start, end = _parse_date(params.get(start_key)), _parse_date(params.get(end_key))
+    if start and end and start > end:
+        start, end = end, start
+    return start, end
+
+
+def compare_periods_data(
+    df,
+    params,
+    index=None,
+    default_days: int = 7,
+) -> dict:
+    """
+    Compare mentions, engagement and share of voice between two date ranges,
+    answered from the DailySeries prefix sums. params:
+      - start_date, end_date: the period of interest (default: the last
+        `default_days` days of data)
+      - compare_start_date, compare_end_date: the period to compare with
+        (default: the period of the same length right before it)
+      - brand: only report this brand (share of voice still uses all brands)
+      - breakdown: "sentiment" or "channel" to add a per-brand breakdown
+    Both periods are cut to the range of the data; a period outside it
+    returns {"Error": ..., "DataRange": ...}.
+    """
+    series = index if index is not None else build_daily_series(df)
+    if series.first_day is None:
+        return {"Topics": []}
+    first, last = series.first_day.date(), series.last_day.date()
+    data_range = {"StartDate": str(first), "EndDate": str(last)}
+
+    start, end = _period_params(params, "start_date", "end_date")
+    end = end or last
+    start = start or end - datetime.timedelta(days=default_days - 1)
+    period = _clamp_period(start, end, first, last)
+    if period is None:
+        return {"Error": f"The period {start} to {end} is outside the data ({first} to {last}).", "DataRange": data_range}
+    start, end = period
+
+    length = (end - start).days + 1
+    compare_start, compare_end = _period_params(params, "compare_start_date", "compare_end_date")
+    compare_end = compare_end or start - datetime.timedelta(days=1)
+    compare_start = compare_start or compare_end - datetime.timedelta(days=length - 1)
+    period = _clamp_period(compare_start, compare_end, first, last)
+    if period is None:
+        return {
+            "Error": f"The period to compare with, {compare_start} to {compare_end}, is outside the data ({first} to {last}).",
+            "DataRange": data_range,
+        }
+    compare_start, compare_end = period
+
+    current = series.totals("brand", start, end)
+    previous = series.totals("brand", compare_start, compare_end)
+    current_total = sum(m for m, _ in current.values())
+    previous_total = sum(m for m, _ in previous.values())
+
+    brand = params.get("brand")
+    brands = list(current)
+    if brand:
+        brands = [b for b in brands if str(b).lower() == str(brand).lower()]
+
+    breakdown = str(params.get("breakdown") or "").lower()
+    if breakdown not in ("sentiment", "channel"):
+        breakdown = None
+    if breakdown:
+        current_detail = series.totals(breakdown, start, end)
+        previous_detail = series.totals(breakdown, compare_start, compare_end)
+
+    topics = []
+    for b in brands:
+        mentions, engagement = current[b]
+        prev_mentions, prev_engagement = previous[b]
+        topic = {
+            "Topic": str(b),
+            "Mentions": _change(mentions, prev_mentions),
+            "Engagement": _change(engagement, prev_engagement),
+            "ShareOfVoice": {
+                "Current": round(100.0 * mentions / current_total, 2) if current_total else 0.0,
+                "Previous": round(100.0 * prev_mentions / previous_total, 2) if previous_total else 0.0,
+            },
+        }
+        if breakdown:
+            label = "Sentiment" if breakdown == "sentiment" else "ChannelDeep"
+            rows = []
+            for key in current_detail:
+                if key[0] != b:
+                    continue
+                m, e = current_detail[key]
+                pm, pe = previous_detail[key]
+                if m or pm:
+                    rows.append({label: str(key[1]), "Mentions": _change(m, pm), "Engagement": _change(e, pe)})
+            rows.sort(key=lambda r: r["Mentions"]["Current"], reverse=True)
+            topic["By" + ("Sentiment" if breakdown == "sentiment" else "Channel")] = rows
+        topics.append(topic)
+
+    topics.sort(key=lambda t: t["Mentions"]["Current"], reverse=True)
+    return {
+        "Period": {"StartDate": str(start), "EndDate": str(end)},
+        "ComparePeriod": {"StartDate": str(compare_start), "EndDate": str(compare_end)},
+        "DataRange": data_range,
+        "Topics": topics,
+    }
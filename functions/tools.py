@@ -0,0 +1,148 @@
+# functions/tools.py
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .functions import (
+    get_daily_detail_data,
+    generate_brand_health_overview,
+    generate_top_post_details,
+    generate_channel_details,
+    generate_brand_sentiment_details,
+    generate_label_details,
+)
+from .search import search_mentions_data
+from .timeseries import compare_periods_data
+from .anomaly import detect_spikes_data
+from .aggregate import aggregate_data
+from .comparison import compare_datasets_data, dataset_summaries
+from .diskcache import cached_tool_result
+from .pagination import PAGED_TOOLS, ResultCache, paginate_handler
+
+# Tool name (as declared to the model) -> handler(df, params)
+TOOL_HANDLERS = {
+    "get_daily_detail": get_daily_detail_data,
+    "brand_health_overview": generate_brand_health_overview,
+    "get_top_post_details": generate_top_post_details,
+    "get_channel_detail": generate_channel_details,
+    "get_brand_sentiment_detail": generate_brand_sentiment_details,
+    "get_label_details": generate_label_details,
+    "search_mentions": search_mentions_data,
+    "compare_periods": compare_periods_data,
+    "detect_spikes": detect_spikes_data,
+    "aggregate": aggregate_data,
+    "compare_datasets": compare_datasets_data,
+}
+
+# Dataset indexes passed to handlers as keyword arguments: tool -> {kwarg: index name}
+TOOL_INDEXES = {
+    "get_daily_detail": {"backend": "backend"},
+    "brand_health_overview": {"series": "daily_series", "backend": "backend"},
+    "get_top_post_details": {"clusters": "near_duplicates", "backend": "backend"},
+    "get_channel_detail": {"clusters": "near_duplicates"},
+    "get_brand_sentiment_detail": {"clusters": "near_duplicates"},
+    "get_label_details": {"series": "daily_series", "clusters": "near_duplicates"},
+    "search_mentions": {"index": "search"},
+    "compare_periods": {"index": "daily_series"},
+    "detect_spikes": {"index": "daily_series"},
+    "aggregate": {"backend": "backend", "dimension_values": "dimension_values"},
+    "compare_datasets": {"index": "summary"},
+}
+
+# Tools that are only offered when interaction columns were found
+INTERACTION_TOOLS = ["get_label_details"]
+# Tools that are only offered when other datasets are loaded for comparison
+COMPARISON_TOOLS = ["compare_datasets"]
+
+
+def available_tools(dataset, compare_with=()) -> list:
+    """Names of the tools that can be offered for this dataset (compared with the datasets compare_with)."""
+    return [
+        name for name in TOOL_HANDLERS
+        if (name not in INTERACTION_TOOLS or dataset.interaction_found)
+        and (name not in COMPARISON_TOOLS or compare_with)
+    ]
+
+
+def function_declarations(tool_names) -> list:
+    """
+    FunctionDeclarations for the given tool names, plus fetch_more when a
+    paged tool is among them (see build_function_handler()).
+    """
+    from . import functiondeclarations
+
+    names = list(tool_names)
+    if any(name in PAGED_TOOLS for name in names):
+        names.append("fetch_more")
+    return [getattr(functiondeclarations, name) for name in names]
+
+
+def run_tool(dataset, name, params, use_cache=True, compare_with=()):
+    """
+    Execute a single tool handler against the dataset. A result precomputed
+    for the same params (see precompute.py) is returned instead, waiting
+    for it if it is still being computed. Results are also kept in the disk
+    cache, when there is one (see diskcache.py). Comparison tools also get
+    the datasets compare_with.
+    """
+    if name not in available_tools(dataset, compare_with):
+        raise KeyError(f"Unknown tool: {name}")
+    if name in COMPARISON_TOOLS:
+        datasets = [dataset, *compare_with]
+
+        def compare():
+            summary, *summaries = dataset_summaries(datasets)
+            others = [(other.name, s) for other, s in zip(compare_with, summaries)]
+            return TOOL_HANDLERS[name](dataset.df, dict(params or {}), index=summary, others=others, name=dataset.name)
+
+        # Cached under the ids of all the datasets compared
+        dataset_ids = "+".join(d.dataset_id for d in datasets) if all(d.dataset_id for d in datasets) else None
+        return cached_tool_result(dataset_ids, name, params, compare)
+    if use_cache:
+        cached = dataset.cached_result(name, params)
+        if cached is not None:
+            return cached
+
+    def compute():
+        indexes = {kwarg: dataset.index(index_name) for kwarg, index_name in TOOL_INDEXES.get(name, {}).items()}
+        return TOOL_HANDLERS[name](dataset.df, dict(params or {}), **indexes)
+
+    return cached_tool_result(dataset.dataset_id, name, params, compute)
+
+
+def build_function_handler(dataset, result_cache=None, compare_with=()) -> dict:
+    """
+    Map each available tool name to a callable taking the model's params,
+    as used by the chat loop. Large results of the paged tools are kept in
+    result_cache and summarized with cursors for fetch_more; pass the same
+    cache across turns so earlier cursors stay valid. compare_with are the
+    other datasets the comparison tools see.
+    """
+    handler = {
+        name: (lambda p, name=name: run_tool(dataset, name, p, compare_with=compare_with))
+        for name in available_tools(dataset, compare_with)
+    }
+    return paginate_handler(handler, result_cache if result_cache is not None else ResultCache())
+
+
+def to_jsonable(obj):
+    """Recursively convert numpy / pandas / date values into plain JSON types."""
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v) for v in obj]
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return None if np.isnan(obj) else float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (datetime.date, pd.Timestamp)):
+        return obj.isoformat()
+    if isinstance(obj, float) and obj != obj:
+        return None
+    return obj
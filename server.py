@@ -0,0 +1,380 @@
+# server.py
+#
+# Headless HTTP API for the insight tools and the chat loop.
+#
+#   uvicorn server:app --host 0.0.0.0 --port 8000
+#
+# Handlers run on a process pool (INSIGHT_API_WORKERS); each worker keeps an
+# LRU cache of formatted datasets (INSIGHT_API_DATASET_CACHE) so repeated
+# calls on the same dataset do not re-parse the Excel file. With
+# INSIGHT_ARROW_DIR set, the first load writes an Arrow IPC file (columns and
+# derived indexes) that every other worker memory-maps instead of parsing.
+# With INSIGHT_CACHE_DIR set, those files and the tool results are kept on
+# disk across restarts (see functions/diskcache.py).
+#
+# Datasets are uploaded (POST /datasets). Files already on the server can be
+# registered by path only from INSIGHT_REGISTER_DIR; without it, registering
+# by path is disabled.
+#
+# A session (POST /sessions) or a tool call can name other registered
+# datasets in `compare_with`; the compare_datasets tool then compares the
+# dataset with them.
+
+import functools
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import Body, FastAPI, File, HTTPException, Query, UploadFile
+from pydantic import BaseModel
+
+from functions.callpolicy import LLM_POLICY, ModelCallTimeout, retryable_errors
+from functions.chat import init_vertexai, PROJECT_ID
+from functions.comparison import comparison_instruction
+from functions.dataset import (
+    ARROW_DIR,
+    appended_dataset_id,
+    arrow_path,
+    dataset_id_for,
+    load_arrow,
+    load_dataset,
+    read_source_bytes,
+)
+from functions.diskcache import DISK_CACHE
+from functions.limiter import LLM_LIMITER
+from functions.digest import digest_instruction
+from functions.pagination import ResultCache, paginate_handler
+from functions.router import create_chat_router
+from functions.tools import COMPARISON_TOOLS, available_tools, function_declarations, run_tool, to_jsonable
+
+logging.basicConfig(level=os.environ.get("INSIGHT_LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("INSIGHT_DATA_DIR", os.path.join(tempfile.gettempdir(), "insightchatbot"))
+WORKERS = int(os.environ.get("INSIGHT_API_WORKERS", os.cpu_count() or 2))
+DATASET_CACHE_SIZE = int(os.environ.get("INSIGHT_API_DATASET_CACHE", 4))
+# Directory whose files POST /datasets/register may read (unset: disabled)
+REGISTER_DIR = os.environ.get("INSIGHT_REGISTER_DIR")
+
+
+# ============================
+# Worker side (runs in the process pool)
+# ============================
+
+_worker_cache = OrderedDict()  # dataset_id -> Dataset, least recently used first
+
+
+def _worker_dataset(dataset_id, path, name, appends=()):
+    """
+    Return the dataset from this worker's cache, loading it if needed.
+    `appends` is the chain of (parent_id, file_path) appends that produced
+    dataset_id; an appended version is built by appending the last file to
+    its parent in place, so only the new rows are processed.
+    """
+    dataset = _worker_cache.pop(dataset_id, None)
+    if dataset is None:
+        if ARROW_DIR and os.path.exists(arrow_path(dataset_id)):
+            dataset = load_arrow(arrow_path(dataset_id), name=name)
+        elif appends:
+            *parents, (parent_id, append_path) = appends
+            dataset = _worker_cache.pop(parent_id, None) or _worker_dataset(parent_id, path, name, tuple(parents))
+            _worker_cache.pop(parent_id, None)
+            dataset.append(append_path)
+        else:
+            logger.info("Loading dataset %s (%s) in worker %s", dataset_id, name, os.getpid())
+            dataset = load_dataset(path, name=name, dataset_id=dataset_id)
+
+    _worker_cache[dataset_id] = dataset
+    while len(_worker_cache) > DATASET_CACHE_SIZE:
+        _worker_cache.popitem(last=False)
+    return dataset
+
+
+def _worker_describe(dataset_id, path, name, appends=()):
+    dataset = _worker_dataset(dataset_id, path, name, appends)
+    info = dataset.describe()
+    info["tools"] = available_tools(dataset)
+    info["digest"] = to_jsonable(dataset.index("digest"))
+    return info
+
+
+def _worker_run_tool(dataset_id, path, name, appends, tool_name, params, others=()):
+    """Run a tool; `others` are the (dataset_id, path, name, appends) of the datasets compared with."""
+    dataset = _worker_dataset(dataset_id, path, name, appends)
+    compare_with = [_worker_dataset(*other) for other in others]
+    return to_jsonable(run_tool(dataset, tool_name, params, compare_with=compare_with))
+
+
+# ============================
+# API state
+# ============================
+
+_pool = None
+_datasets = {}   # dataset_id -> info dict (incl. "path" and "appends")
+_sessions = {}   # session_id -> {"dataset_id", "compare_with", "chat", "results"}
+# Held for every read and write of _datasets and _sessions (the handlers run
+# on a thread pool)
+_lock = threading.Lock()
+_vertex_ready = False
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _pool
+    os.makedirs(DATA_DIR, exist_ok=True)
+    _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    yield
+    _pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(title="Insight Chatbot API", lifespan=lifespan)
+
+
+class RegisterRequest(BaseModel):
+    path: str
+    name: Optional[str] = None
+
+
+class SessionRequest(BaseModel):
+    dataset_id: str
+    # Other registered datasets the compare_datasets tool compares it with
+    compare_with: List[str] = []
+
+
+class MessageRequest(BaseModel):
+    prompt: str
+    # Newer version (e.g. after an append) of the session's dataset to answer from
+    dataset_id: Optional[str] = None
+
+
+def _get_dataset(dataset_id):
+    with _lock:
+        info = _datasets.get(dataset_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset: {dataset_id}")
+    return info
+
+
+def _register(dataset_id, path, name, appends=()):
+    with _lock:
+        info = _datasets.get(dataset_id)
+    if info is not None:
+        return info
+    try:
+        info = _pool.submit(_worker_describe, dataset_id, path, name, appends).result()
+    except Exception as e:
+        logger.error(f"Failed to load dataset {name}: {e}")
+        raise HTTPException(status_code=400, detail="Failed to read the Excel file.")
+    info["path"] = path
+    info["appends"] = appends
+    with _lock:
+        # Another request may have registered it meanwhile
+        return _datasets.setdefault(dataset_id, info)
+
+
+def _compared(dataset_id, compare_with):
+    """Infos of the datasets compare_with (the dataset itself left out); 404 if one is unknown."""
+    return [_get_dataset(other_id) for other_id in dict.fromkeys(compare_with or ()) if other_id != dataset_id]
+
+
+def _tool_names(info, others):
+    """The dataset's tools, plus the comparison tools when it is compared with others."""
+    return info["tools"] + (COMPARISON_TOOLS if others else [])
+
+
+def _call_tool(dataset_id, tool_name, params, compare_with=()):
+    info = _get_dataset(dataset_id)
+    others = _compared(dataset_id, compare_with)
+    if tool_name not in _tool_names(info, others):
+        raise HTTPException(status_code=404, detail=f"Unknown tool: {tool_name}")
+    future = _pool.submit(
+        _worker_run_tool, dataset_id, info["path"], info["name"], info["appends"], tool_name, params,
+        tuple((other["dataset_id"], other["path"], other["name"], other["appends"]) for other in others),
+    )
+    return future.result()
+
+
+def _public(info):
+    return {k: v for k, v in info.items() if k not in ("path", "appends")}
+
+
+# ============================
+# Endpoints
+# ============================
+
+@app.get("/health")
+def health():
+    with _lock:
+        datasets, sessions = len(_datasets), len(_sessions)
+    return {
+        "status": "ok",
+        "workers": WORKERS,
+        "datasets": datasets,
+        "sessions": sessions,
+        # Model requests of all sessions share this queue (INSIGHT_LLM_CONCURRENCY)
+        "llm_queue": LLM_LIMITER.stats(),
+        "llm_calls": LLM_POLICY.stats(),
+        # Tools run in the workers, so only the size is meaningful here
+        "disk_cache": {"bytes": DISK_CACHE.size(), "max_bytes": DISK_CACHE.max_bytes} if DISK_CACHE else None,
+    }
+
+
+@app.post("/datasets", status_code=201)
+def upload_dataset(file: UploadFile = File(...)):
+    raw = read_source_bytes(file.file)
+    dataset_id = dataset_id_for(raw)
+    path = os.path.join(DATA_DIR, f"{dataset_id}.xlsx")
+    if not os.path.exists(path):
+        with open(path, "wb") as fh:
+            fh.write(raw)
+    return _public(_register(dataset_id, path, file.filename))
+
+
+@app.post("/datasets/{dataset_id}/append", status_code=201)
+def append_dataset(dataset_id: str, file: UploadFile = File(...)):
+    """
+    Append a new export to a dataset. The result is registered as a new
+    dataset version whose id is returned; the parent stays available.
+    """
+    parent = _get_dataset(dataset_id)
+    raw = read_source_bytes(file.file)
+    path = os.path.join(DATA_DIR, f"{dataset_id_for(raw)}.xlsx")
+    if not os.path.exists(path):
+        with open(path, "wb") as fh:
+            fh.write(raw)
+    appends = tuple(parent["appends"]) + ((dataset_id, path),)
+    info = _register(appended_dataset_id(dataset_id, raw), parent["path"], parent["name"], appends)
+    return dict(_public(info), parent_id=dataset_id, rows_added=info["rows"] - parent["rows"])
+
+
+def _registrable_path(path):
+    """
+    The real path of `path`, a file of REGISTER_DIR given relative to it (or
+    absolute, inside it); HTTPException otherwise. Symbolic links are
+    resolved first, so they cannot lead out of the directory.
+    """
+    if not REGISTER_DIR:
+        raise HTTPException(status_code=403, detail="Registering files by path is disabled; upload the file instead")
+    root = os.path.realpath(REGISTER_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise HTTPException(status_code=403, detail="Only files of the data directory can be registered")
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail=f"File not found: {path}")
+    return resolved
+
+
+@app.post("/datasets/register", status_code=201)
+def register_dataset(body: RegisterRequest):
+    """Register a file of INSIGHT_REGISTER_DIR; body.path is relative to it."""
+    path = _registrable_path(body.path)
+    dataset_id = dataset_id_for(read_source_bytes(path))
+    return _public(_register(dataset_id, path, body.name or os.path.basename(path)))
+
+
+@app.get("/datasets")
+def list_datasets():
+    with _lock:
+        infos = list(_datasets.values())
+    return [_public(info) for info in infos]
+
+
+@app.get("/datasets/{dataset_id}")
+def get_dataset(dataset_id: str):
+    return _public(_get_dataset(dataset_id))
+
+
+@app.post("/datasets/{dataset_id}/tools/{tool_name}")
+def call_tool(
+    dataset_id: str, tool_name: str, params: dict = Body(default={}), compare_with: List[str] = Query(default=[])
+):
+    return _call_tool(dataset_id, tool_name, params, compare_with)
+
+
+def _chat_router(info, others=()):
+    """
+    Chat with the dataset's tools and digest (and the comparison tools when
+    compared with others), routed between the pro and the fast model (see
+    router.py).
+    """
+    tool_names = _tool_names(info, others)
+    instruction = digest_instruction(info["digest"])
+    if others:
+        instruction += comparison_instruction([other["name"] for other in others])
+    return create_chat_router(function_declarations(tool_names), tool_names, instruction)
+
+
+@app.post("/sessions", status_code=201)
+def create_session(body: SessionRequest):
+    global _vertex_ready
+    info = _get_dataset(body.dataset_id)
+    others = _compared(body.dataset_id, body.compare_with)
+
+    with _lock:
+        if not _vertex_ready:
+            init_vertexai(
+                project_id=os.environ.get("INSIGHT_PROJECT_ID", PROJECT_ID),
+                credentials_json=os.environ.get("INSIGHT_GOOGLE_CREDENTIALS"),
+            )
+            _vertex_ready = True
+
+    session_id = uuid.uuid4().hex
+    session = {
+        "dataset_id": body.dataset_id,
+        "compare_with": [other["dataset_id"] for other in others],
+        "chat": _chat_router(info, others),
+        "results": ResultCache(),
+    }
+    with _lock:
+        _sessions[session_id] = session
+    return {"session_id": session_id}
+
+
+@app.post("/sessions/{session_id}/messages")
+def post_message(session_id: str, body: MessageRequest):
+    with _lock:
+        session = _sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+
+    if body.dataset_id and body.dataset_id != session["dataset_id"]:
+        # A newer version of the dataset: new digest, same conversation
+        router = _chat_router(_get_dataset(body.dataset_id), _compared(body.dataset_id, session["compare_with"]))
+        with _lock:
+            router.history = session["chat"].history
+            session.update(dataset_id=body.dataset_id, chat=router)
+    with _lock:
+        dataset_id, chat, compare_with = session["dataset_id"], session["chat"], session["compare_with"]
+    tool_names = _tool_names(_get_dataset(dataset_id), _compared(dataset_id, compare_with))
+    # Large results are kept with the session and paged with fetch_more
+    function_handler = paginate_handler(
+        {name: functools.partial(_call_tool, dataset_id, name, compare_with=compare_with) for name in tool_names},
+        session["results"],
+    )
+    try:
+        text = chat.send(body.prompt, function_handler)
+    except ModelCallTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except retryable_errors() as e:
+        raise HTTPException(status_code=503, detail=f"The model is unavailable: {e}")
+    return {"text": text}
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    with _lock:
+        _sessions.pop(session_id, None)
+    return {"deleted": session_id}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("INSIGHT_API_HOST", "0.0.0.0"), port=int(os.environ.get("INSIGHT_API_PORT", 8000)))
@@ -0,0 +1,106 @@
+# tests/conftest.py
+#
+# Synthetic CMS-like exports shared by the tests and by bench.py (which
+# imports make_synthetic_data and the parity cases from here).
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import format_social_listening_data
+
+# Columns left empty in some rows with make_synthetic_data(null_fraction=...)
+NULLABLE_COLUMNS = ["Id", "ParentId", "Title", "UrlTopic", "SiteName", "Sentiment", "Reactions", "Views"]
+
+
+def make_synthetic_data(rows=200_000, posts=50_000, brands=3, days=90, seed=0, null_fraction=0.0):
+    """
+    A raw export with the columns format_social_listening_data() expects;
+    with null_fraction, that share of the NULLABLE_COLUMNS values is empty
+    (Sentiment: twice that share).
+    """
+    rng = np.random.default_rng(seed)
+    types = np.array(["fbUserTopic", "fbUserComment", "fbGroupComment", "fbPageComment",
+                      "newsTopic", "youtubeComment", "tiktokComment", "forumComment"])
+    post = rng.zipf(1.3, rows) % posts
+    words = np.array("giao hàng chậm sản phẩm tốt giá rẻ khuyến mãi check inbox nhân viên "
+                     "delivery delay great service bad quality đổi trả".split())
+    type_values = rng.choice(types, rows)
+    raw = pd.DataFrame({
+        "Id": np.arange(rows),
+        "ParentId": post,
+        "Topic": rng.choice([f"Brand {chr(65 + i)}" for i in range(brands)], rows),
+        "Title": np.char.add("Post ", post.astype(str)),
+        "Content": [" ".join(rng.choice(words, 6)) for _ in range(rows)],
+        "UrlTopic": np.char.add("https://example.com/p/", post.astype(str)),
+        "PublishedDate": pd.Timestamp(datetime.date(2024, 1, 1)) + pd.to_timedelta(rng.integers(0, days, rows), unit="D"),
+        "Type": type_values,
+        "Channel": np.where(np.char.startswith(type_values, "fbPage"), "Fanpage", "Social"),
+        "SiteName": np.char.add("site ", rng.integers(0, 500, rows).astype(str)),
+        "Sentiment": rng.choice(["Positive", "Neutral", "Negative"], rows, p=[0.3, 0.5, 0.2]),
+        "Labels1": rng.choice(["Price", "Service", "Delivery"], rows),
+        "Reactions": rng.integers(0, 100, rows),
+        "Comments": rng.integers(0, 20, rows),
+        "Shares": rng.integers(0, 10, rows),
+        "Views": rng.integers(0, 1000, rows),
+    })
+    if null_fraction:
+        for col in NULLABLE_COLUMNS:
+            share = null_fraction * (2 if col == "Sentiment" else 1)
+            raw[col] = raw[col].where(rng.random(rows) >= share)
+    return raw
+
+
+# Aggregations compared across backends: (label, keys, metrics, filters)
+PARITY_QUERIES = [
+    ("mentions by brand x channel", ["Topic", "ChannelDeep"],
+     {"Mentions": ("size", None), "Reactions": ("sum", "Reactions"), "Sites": ("nunique", "SiteName")}, None),
+    ("negative TikTok/Facebook mentions by brand", ["Topic"], {"Mentions": ("size", None)},
+     [("Sentiment", "==", "Negative"), ("ChannelDeep", "in", ["Tiktok", "Facebook"])]),
+    ("comments per site since Feb", ["SiteName"], {"Mentions": ("count", "Id")},
+     [("Type", "contains", "comment"), ("FormattedDate", ">=", datetime.date(2024, 2, 1))]),
+    ("total views outside brand A", [], {"Mentions": ("size", None), "Views": ("sum", "Views")},
+     [("Topic", "!=", "Brand A")]),
+    ("mentions by brand x date x post", ["Topic", "FormattedDate", "ParentId"],
+     {"Mentions": ("count", "Id"), "Shares": ("sum", "Shares")}, None),
+]
+
+
+# Handlers compared across backends: (tool, params); no sampled comments, so
+# the output is deterministic
+PARITY_HANDLERS = [
+    ("get_daily_detail", {}),
+    ("brand_health_overview", {}),
+    ("get_top_post_details", {"max_comments": 0}),
+]
+
+
+@pytest.fixture(scope="session")
+def make_frame():
+    """
+    make_frame(**kwargs): the formatted frame of make_synthetic_data(**kwargs)
+    (with its interaction_found and labels1_found), built once per kwargs
+    for the whole session. The frames are shared, so tests must not modify
+    them.
+    """
+    frames = {}
+
+    def make(**kwargs):
+        key = tuple(sorted(kwargs.items()))
+        if key not in frames:
+            frames[key] = format_social_listening_data(make_synthetic_data(**kwargs))
+        return frames[key]
+
+    return make
+
+
+@pytest.fixture(params=PARITY_QUERIES, ids=[query[0] for query in PARITY_QUERIES])
+def parity_query(request):
+    return request.param
+
+
+@pytest.fixture(params=PARITY_HANDLERS, ids=[tool for tool, _ in PARITY_HANDLERS])
+def parity_handler(request):
+    return request.param
@@ -0,0 +1,102 @@
+# tests/fakemodel.py
+#
+# Offline stand-in for the Gemini chat model: the parts of GenerativeModel
+# and ChatSession the chat loop uses, with injectable latency and failures.
+# No network or credentials are needed; `python bench.py policy` runs chat
+# turns against it to exercise the call policy.
+
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+def _unavailable_error(message):
+    """The 503 the Vertex AI SDK raises when the service is overloaded."""
+    try:
+        from google.api_core.exceptions import ServiceUnavailable
+    except ImportError:
+        return ConnectionError(message)
+    return ServiceUnavailable(message)
+
+
+class FakeResponse:
+    """A GenerationResponse with one candidate: a function call or text."""
+
+    def __init__(self, text=None, function_call=None):
+        self._text = text
+        part = SimpleNamespace(function_call=function_call, text=text)
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(role="model", parts=[part]))]
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("The response has no text, only a function call.")
+        return self._text
+
+
+class FakeChatSession:
+    """Same history semantics as ChatSession: a turn is added once it succeeds."""
+
+    def __init__(self, model, history=None):
+        self._model = model
+        self._history = list(history or [])
+
+    @property
+    def history(self):
+        return self._history
+
+    def send_message(self, content):
+        request = {"role": "user", "content": content}
+        response = self._model.generate(self._history + [request])
+        self._history += [request, {"role": "model", "content": response}]
+        return response
+
+
+class FakeModel:
+    """
+    Answers a prompt by calling `tool_calls` ([(name, params), ...]) one
+    after the other, then with a text that lists the results it got.
+
+    Every request takes `latency` seconds (+-50%), or `slow_latency` with
+    probability `slow_rate` (a latency tail), and fails with a retryable
+    503 with probability `failure_rate`. `calls` counts the requests. With
+    tool_calling=False it answers with text whatever the calls left.
+    """
+
+    def __init__(self, latency=0.05, slow_rate=0.0, slow_latency=1.0, failure_rate=0.0, tool_calls=(), seed=None,
+                 tool_calling=True):
+        self.latency = latency
+        self.tool_calling = tool_calling
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.tool_calls = list(tool_calls)
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    def generate(self, contents):
+        with self._lock:
+            self.calls += 1
+            slow = self._random.random() < self.slow_rate
+            failed = self._random.random() < self.failure_rate
+            jitter = self._random.uniform(0.5, 1.5)
+        time.sleep(self.slow_latency if slow else self.latency * jitter)
+        if failed:
+            raise _unavailable_error("Injected failure")
+
+        # Function responses sent since the user's last text prompt
+        results = []
+        for message in reversed(contents):
+            if isinstance(message["content"], str):
+                break
+            if message["role"] == "user":
+                results.append(message["content"])
+        if self.tool_calling and len(results) < len(self.tool_calls):
+            name, params = self.tool_calls[len(results)]
+            return FakeResponse(function_call=SimpleNamespace(name=name, args=dict(params)))
+        return FakeResponse(text=f"Offline answer based on {len(results)} tool result(s).")
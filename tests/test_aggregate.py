@@ -0,0 +1,73 @@
+# tests/test_aggregate.py
+
+import importlib
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from functions.aggregate import aggregate_data, build_dimension_values, update_dimension_values
+from functions.backends import PandasBackend
+
+# (functions.aggregate is also the name of the tool's FunctionDeclaration)
+aggregate = importlib.import_module("functions.aggregate")
+
+
+@pytest.fixture(scope="module")
+def df(make_frame):
+    df, _, _ = make_frame(rows=5_000, posts=500)
+    return df
+
+
+class SlowBackend(PandasBackend):
+    """A backend whose queries run until released, and cannot be interrupted."""
+
+    def __init__(self, df):
+        super().__init__(df)
+        self.release = threading.Event()
+
+    def group_aggregate(self, *args, **kwargs):
+        self.release.wait(5)
+        return super().group_aggregate(*args, **kwargs)
+
+
+def test_filter_values_match_ignoring_case_and_diacritics(df):
+    result = aggregate_data(df, {"group_by": ["channel"], "filters": [{"dimension": "channel", "value": "TIKTOK"}]})
+    assert [row["channel"] for row in result["Rows"]] == ["Tiktok"]
+    assert result["Rows"][0]["mentions"] == int((df["ChannelDeep"] == "Tiktok").sum())
+
+
+def test_too_many_groups_are_refused_before_running(df):
+    params = {"group_by": ["site", "date", "brand"]}
+    assert "Error" in aggregate_data(df, params, max_groups=1_000)
+    # Filters on the grouped dimensions narrow the estimate
+    narrowed = dict(params, filters=[{"dimension": "brand", "value": "Brand A"}],
+                    start_date="2024-01-01", end_date="2024-01-01")
+    result = aggregate_data(df, narrowed, max_groups=1_000)
+    assert "Error" not in result and result["TotalGroups"] > 0
+
+
+def test_timed_out_queries_hold_their_worker(df, monkeypatch):
+    monkeypatch.setattr(aggregate, "_workers", threading.BoundedSemaphore(2))
+    backend = SlowBackend(df)
+    try:
+        for _ in range(2):
+            assert "longer than" in aggregate_data(df, {}, backend=backend, timeout=0.05)["Error"]
+        # Both workers are still busy: refused after the time limit, not queued
+        start = time.monotonic()
+        assert "still running" in aggregate_data(df, {}, backend=backend, timeout=0.2)["Error"]
+        assert time.monotonic() - start < 1
+    finally:
+        backend.release.set()
+    time.sleep(0.2)
+    assert "Error" not in aggregate_data(df, {}, backend=backend, timeout=5)
+
+
+def test_dimension_values_are_updated_on_append(df):
+    values = update_dimension_values(build_dimension_values(df.iloc[:3_000]), df, 3_000)
+    expected = build_dimension_values(df)
+    assert values.keys() == expected.keys()
+    for col in expected:
+        assert values[col]["seen"] == expected[col]["seen"]
+        assert values[col]["folded"] == expected[col]["folded"]
@@ -0,0 +1,57 @@
+# tests/test_anomaly.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import format_social_listening_data
+from functions.anomaly import rolling_zscores
+from functions.tools import TOOL_HANDLERS
+
+
+def _daily_frame(counts):
+    """One brand on one site with counts[i] mentions on day i (from 2024-01-01)."""
+    days = np.repeat(pd.date_range("2024-01-01", periods=len(counts)), counts)
+    raw = pd.DataFrame({
+        "Id": np.arange(len(days)), "PublishedDate": days, "Topic": "Brand A", "Type": "fbUserComment",
+        "Channel": "Social", "SiteName": "site", "Sentiment": "Neutral", "UrlTopic": "https://example.com/p",
+        "Title": "Post", "Content": "ok",
+    })
+    df, _, _ = format_social_listening_data(raw)
+    return df
+
+
+@pytest.mark.parametrize("level", [0, 20])
+def test_constant_series_has_no_anomalies(level):
+    z, mean = rolling_zscores(np.full((1, 60), level))
+    assert np.isfinite(z).all() and (z == 0).all()
+    assert (mean[0, 14:] == level).all()
+
+    result = TOOL_HANDLERS["detect_spikes"](_daily_frame([20] * 60), {"direction": "both"})
+    assert result["TotalAnomalies"] == 0
+
+
+def test_spike_is_found():
+    counts = [20] * 60
+    counts[40] = 100
+    (anomaly,) = TOOL_HANDLERS["detect_spikes"](_daily_frame(counts), {"level": "brand"})["Anomalies"]
+    assert anomaly["Date"] == "2024-02-10"
+    assert anomaly["Mentions"] == 100 and anomaly["Baseline"] == 20
+    assert anomaly["TopSites"] == [{"SiteName": "site", "Mentions": 100}]
+
+
+def test_window_longer_than_the_data():
+    counts = [20] * 30
+    counts[20] = 100
+    z, _ = rolling_zscores(np.array([counts]), window=365)
+    assert np.isfinite(z).all()
+
+    result = TOOL_HANDLERS["detect_spikes"](_daily_frame(counts), {"level": "brand", "window": 365})
+    assert result["WindowDays"] == 365
+    assert [a["Date"] for a in result["Anomalies"]] == ["2024-01-21"]
+
+
+def test_too_short_a_history_is_not_scored():
+    # Fewer days than min_periods before the jump
+    z, _ = rolling_zscores(np.array([[20, 20, 20, 100]]))
+    assert (z == 0).all()
@@ -0,0 +1,71 @@
+# tests/test_backends.py
+#
+# The pandas and DuckDB backends must return the same results on the same
+# formatted frame, rows with missing values included.
+
+import json
+
+import pandas as pd
+import pytest
+
+from functions.backends import DuckDBBackend, PandasBackend
+from functions.tools import TOOL_HANDLERS
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def df(make_frame):
+    df, _, _ = make_frame(rows=20_000, posts=2_000, null_fraction=0.1)
+    return df
+
+
+@pytest.fixture(scope="module")
+def backends(df):
+    return PandasBackend(df), DuckDBBackend(df)
+
+
+def test_synthetic_data_has_nulls(df):
+    for col in ["Id", "ParentId", "Title", "SiteName", "Sentiment", "Reactions"]:
+        assert df[col].isna().any(), col
+
+
+@pytest.mark.parametrize("dropna", [True, False])
+def test_group_aggregate(backends, parity_query, dropna):
+    reference, duckdb = backends
+    _, keys, metrics, filters = parity_query
+    pd.testing.assert_frame_equal(
+        reference.group_aggregate(keys, metrics, filters, dropna=dropna),
+        duckdb.group_aggregate(keys, metrics, filters, dropna=dropna),
+    )
+
+
+@pytest.mark.parametrize("keys", [["Topic"], ["Topic", "FormattedDate", "SiteName"], ["Topic", "FormattedDate", "ParentId"]])
+def test_sentiment_breakdown(backends, df, keys):
+    reference, duckdb = backends
+    expected = reference.sentiment_breakdown(keys)
+    pd.testing.assert_frame_equal(expected, duckdb.sentiment_breakdown(keys))
+    # Rows without a sentiment are mentions, in no sentiment
+    rows = df.dropna(subset=keys)
+    assert expected["mention_count"].sum() == len(rows)
+    assert expected[["Positive", "Neutral", "Negative"]].to_numpy().sum() == rows["Sentiment"].notna().sum()
+
+
+def test_handler_output(backends, df, parity_handler):
+    reference, duckdb = backends
+    tool, params = parity_handler
+    before = df.copy()
+    expected = json.dumps(TOOL_HANDLERS[tool](df, params, backend=reference), default=str)
+    assert json.dumps(TOOL_HANDLERS[tool](df, params, backend=duckdb), default=str) == expected
+    # The handlers only read the shared frame
+    pd.testing.assert_frame_equal(df, before)
+
+
+def test_daily_mentions_include_rows_without_sentiment(backends, df):
+    reference, duckdb = backends
+    mentions = [
+        sum(item["Mention"] for item in TOOL_HANDLERS["get_daily_detail"](df, {}, backend=backend)["daily"])
+        for backend in backends
+    ]
+    keyed = df.dropna(subset=["Topic", "FormattedDate"])
+    assert mentions == [keyed["Id"].notna().sum()] * 2
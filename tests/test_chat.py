@@ -0,0 +1,166 @@
+# tests/test_chat.py
+#
+# The chat loop against the offline FakeModel.
+
+import threading
+import time
+
+import pytest
+
+from functions.budget import TurnBudget
+from functions.callpolicy import CallPolicy, ModelCallTimeout
+from functions.chat import run_chat_turn
+from functions.limiter import ConcurrencyLimiter
+
+from .fakemodel import FakeModel
+
+pytest.importorskip("vertexai")
+
+TOOL_CALLS = [("brand_health_overview", {})] * 6
+
+
+def _handler():
+    return {"brand_health_overview": lambda params: {"ok": True}}
+
+
+def _turn(model, session, **kwargs):
+    kwargs.setdefault("limiter", ConcurrencyLimiter(2))
+    kwargs.setdefault("policy", CallPolicy(timeout=5, retries=0))
+    return run_chat_turn(model, session, "How are the brands doing?", _handler(), **kwargs)
+
+
+def _ends_on_text(history):
+    last = history[-1]
+    return last["role"] == "model" and last["content"].candidates[0].content.parts[0].function_call is None
+
+
+def test_answer_past_the_budget_comes_from_the_model_without_tools():
+    model = FakeModel(latency=0, tool_calls=TOOL_CALLS)
+    answer_model = FakeModel(latency=0, tool_calls=TOOL_CALLS, tool_calling=False)
+    session = model.start_chat()
+    budget = TurnBudget(max_tool_calls=3)
+    text = _turn(model, session, budget=budget, answer_model=answer_model)
+
+    assert text.startswith("Offline answer")
+    assert budget.refused_calls == 2
+    # prompt + 5 answered calls + the answer
+    assert len(session.history) == 2 * 6
+    assert _ends_on_text(session.history)
+
+
+def test_turn_stopping_on_a_call_is_left_out_of_the_history():
+    model = FakeModel(latency=0, tool_calls=TOOL_CALLS)
+    session = model.start_chat()
+    _turn(model, session)
+    before = list(session.history)
+
+    text = _turn(model, session, budget=TurnBudget(max_tool_calls=3))
+    assert "narrower question" in text
+    assert session.history == before
+    assert _ends_on_text(session.history)
+
+
+def test_unknown_function_is_left_out_of_the_history():
+    model = FakeModel(latency=0, tool_calls=[("no_such_tool", {})])
+    session = model.start_chat()
+    unknown = []
+    _turn(model, session, on_unknown_function=unknown.append)
+    assert unknown == ["no_such_tool"]
+    assert session.history == []
+
+
+class ProbeModel(FakeModel):
+    """A FakeModel recording how many requests run at once; `latencies` overrides the first ones."""
+
+    def __init__(self, latencies=(), **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = list(latencies)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._probe_lock = threading.Lock()
+
+    def generate(self, contents):
+        with self._probe_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            latency = self.latencies.pop(0) if self.latencies else None
+        try:
+            if latency is not None:
+                time.sleep(latency)
+            return super().generate(contents)
+        finally:
+            with self._probe_lock:
+                self.in_flight -= 1
+
+
+TWO_CALLS = [("brand_health_overview", {})] * 2
+# prompt, 2 calls and their responses, the answer
+TWO_CALLS_HISTORY = 2 * 3
+
+
+def test_retries_keep_the_history_intact():
+    model = ProbeModel(latency=0.001, failure_rate=0.5, tool_calls=TWO_CALLS, seed=1)
+    session = model.start_chat()
+    policy = CallPolicy(timeout=5, retries=20, backoff=0.001)
+    _turn(model, session, policy=policy)
+
+    assert policy.stats()["retries"] > 0
+    assert len(session.history) == TWO_CALLS_HISTORY
+
+
+def test_timeouts_are_retried_and_abandoned_attempts_keep_their_slot():
+    # The first two requests never answer in time
+    model = ProbeModel(latencies=[0.3, 0.3], latency=0.001, tool_calls=TWO_CALLS)
+    session = model.start_chat()
+    limiter = ConcurrencyLimiter(1)
+    policy = CallPolicy(timeout=0.1, retries=3, backoff=0.001)
+    _turn(model, session, policy=policy, limiter=limiter)
+
+    assert policy.stats()["timeouts"] == 2
+    assert model.max_in_flight == 1
+    assert len(session.history) == TWO_CALLS_HISTORY
+    time.sleep(0.05)
+    assert limiter.stats()["active"] == 0
+
+
+def test_timeout_gives_up_without_touching_the_history():
+    model = ProbeModel(latencies=[0.3] * 2, latency=0.001, tool_calls=TWO_CALLS)
+    session = model.start_chat()
+    policy = CallPolicy(timeout=0.05, retries=1, backoff=0.001)
+    with pytest.raises(ModelCallTimeout):
+        _turn(model, session, policy=policy)
+    assert session.history == []
+
+
+def _primed_hedging_policy():
+    policy = CallPolicy(timeout=5, retries=0, hedge_percentile=50, hedge_min_samples=1)
+    policy.call(lambda: time.sleep(0.01))
+    return policy
+
+
+def test_hedge_wins_and_counts_against_the_limit():
+    # The first request is slow; its duplicate answers first
+    model = ProbeModel(latencies=[1.0], latency=0.001, tool_calls=TWO_CALLS)
+    session = model.start_chat()
+    limiter = ConcurrencyLimiter(2)
+    policy = _primed_hedging_policy()
+    _turn(model, session, policy=policy, limiter=limiter)
+
+    stats = policy.stats()
+    assert stats["hedges"] >= 1 and stats["hedge_wins"] >= 1
+    assert model.max_in_flight == 2
+    # The losing attempt is not in the conversation
+    assert len(session.history) == TWO_CALLS_HISTORY
+
+
+def test_no_hedge_without_a_free_slot():
+    model = ProbeModel(latencies=[0.2], latency=0.001, tool_calls=TWO_CALLS)
+    session = model.start_chat()
+    limiter = ConcurrencyLimiter(1)
+    policy = _primed_hedging_policy()
+    _turn(model, session, policy=policy, limiter=limiter)
+
+    stats = policy.stats()
+    assert stats["hedges"] == 0 and stats["hedges_skipped"] >= 1
+    assert model.max_in_flight == 1
+    assert len(session.history) == TWO_CALLS_HISTORY
@@ -0,0 +1,29 @@
+# tests/test_comparison.py
+
+import pytest
+
+from functions.comparison import build_dataset_summary, compare_datasets_data
+
+
+@pytest.fixture(scope="module")
+def summaries(make_frame):
+    frames = [make_frame(rows=2_000, posts=200, seed=seed)[0] for seed in range(3)]
+    return frames[0], [build_dataset_summary(df) for df in frames]
+
+
+def _compare(summaries, **params):
+    df, (summary, *others) = summaries
+    named = list(zip(["Campaign 2023", "Campaign 2024"], others))
+    return compare_datasets_data(df, params, index=summary, others=named, name="Campaign 2025")
+
+
+def test_dataset_param_selects_by_name(summaries):
+    result = _compare(summaries, dataset="2024")
+    assert [c["ComparedWith"] for c in result["Comparisons"]] == ["Campaign 2024"]
+    assert [c["ComparedWith"] for c in _compare(summaries)["Comparisons"]] == ["Campaign 2023", "Campaign 2024"]
+
+
+def test_unknown_dataset_name_lists_the_loaded_ones(summaries):
+    result = _compare(summaries, dataset="last year")
+    assert "last year" in result["Error"]
+    assert result["Datasets"] == ["Campaign 2023", "Campaign 2024"]
@@ -0,0 +1,56 @@
+# tests/test_counts.py
+
+import math
+
+import pandas as pd
+import pytest
+
+from functions.counts import parse_counts
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12", 12),
+    ("1,234", 1234),
+    ("1.234", 1234),
+    ("1 234", 1234),
+    ("1.234.567", 1234567),
+    ("1,234.5", 1234.5),
+    ("1.234,5", 1234.5),
+    ("1,5", 1.5),
+    ("1,2K", 1200),
+    ("1.2k", 1200),
+    ("1.1K", 1100),
+    ("3,4 N", 3400),
+    ("2M", 2_000_000),
+    ("3 tr", 3_000_000),
+    ("1,5TR", 1_500_000),
+    ("  7  ", 7),
+])
+def test_parses_counts(text, expected):
+    counts, unparsable = parse_counts([text])
+    assert counts.iloc[0] == expected
+    assert unparsable == 0
+
+
+@pytest.mark.parametrize("blank", ["", "  ", "-", "nan", "N/A", None, float("nan")])
+def test_blanks_are_missing_but_not_unparsable(blank):
+    counts, unparsable = parse_counts(["5", blank])
+    assert counts.iloc[0] == 5 and math.isnan(counts.iloc[1])
+    assert unparsable == 0
+
+
+@pytest.mark.parametrize("garbage", ["abc", "12abc", "K", "1,2,", ",5", "1.2X", "--3"])
+def test_garbage_is_counted_as_unparsable(garbage):
+    counts, unparsable = parse_counts(["5", garbage, garbage])
+    assert counts.iloc[0] == 5 and counts.iloc[1:].isna().all()
+    assert unparsable == 2
+
+
+def test_dtypes():
+    assert parse_counts(["1", "2K", 3])[0].dtype == "int64"
+    assert parse_counts(["1", "1,5"])[0].dtype == "float64"
+    assert parse_counts(["1", ""])[0].dtype == "float64"
+    numbers = pd.Series([1, 2, 3])
+    counts, unparsable = parse_counts(numbers)
+    assert counts.equals(numbers) and unparsable == 0
+    assert len(parse_counts([])[0]) == 0
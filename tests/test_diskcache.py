@@ -0,0 +1,40 @@
+# tests/test_diskcache.py
+
+from functions.diskcache import DiskCache, result_key
+
+
+def _key(i):
+    return result_key("test", "tool", {"i": i})
+
+
+def test_writes_are_tracked_without_scanning(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 9)
+    for i in range(50):
+        cache.put(_key(i), list(range(i)))
+    # Overwriting an entry replaces its bytes
+    cache.put(_key(0), "replaced")
+
+    assert cache.stats()["scans"] == 1
+    tracked = cache.size()
+    assert tracked == DiskCache(str(tmp_path)).size()
+
+
+def test_going_over_the_cap_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 9)
+    for i in range(20):
+        cache.put(_key(i), "x" * 1000)
+    cache.max_bytes = cache.size() // 2
+    cache.put(_key(20), "x" * 1000)
+
+    assert cache.stats()["evictions"] > 0
+    assert cache.size() <= cache.max_bytes
+    assert cache.get(_key(20)) == "x" * 1000
+
+
+def test_rescan_sees_files_of_other_processes(tmp_path):
+    cache = DiskCache(str(tmp_path), rescan_seconds=0)
+    other = DiskCache(str(tmp_path))
+    cache.put(_key(0), "mine")
+    other.put(_key(1), "theirs")
+    cache.put(_key(2), "mine again")
+    assert cache.size() == DiskCache(str(tmp_path)).size()
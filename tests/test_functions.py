@@ -0,0 +1,56 @@
+# tests/test_functions.py
+
+import pandas as pd
+import pytest
+
+from functions import format_social_listening_data
+from functions.tools import TOOL_HANDLERS
+
+
+def _frame(rows):
+    raw = pd.DataFrame(rows, columns=["Id", "UrlTopic", "Title", "Reactions", "Comments", "Shares", "Views"])
+    raw = raw.assign(
+        Topic="Brand A", Content="xem video", SiteName="tiktok.com", Type="tiktokComment", Channel="Social",
+        Sentiment="Positive", PublishedDate="2024-01-01",
+    )
+    df, _, _ = format_social_listening_data(raw)
+    return df
+
+
+def test_channel_top_post_is_ranked_without_views():
+    df = _frame([
+        (1, "https://tiktok.com/a", "Viral", 1, 0, 0, 100_000),
+        (2, "https://tiktok.com/b", "Talked about", 50, 30, 20, 10),
+    ])
+    (channel,) = TOOL_HANDLERS["get_channel_detail"](df, {})["Topic"]["Channels"]
+    assert channel["TopPost"]["Title"] == "Talked about"
+    assert channel["TopPost"]["Engagement"] == 100
+
+
+@pytest.fixture(scope="module")
+def long_df(make_frame):
+    # 200 days, 2024-01-01 to 2024-07-18
+    df, _, _ = make_frame(rows=5_000, posts=500, days=200)
+    return df
+
+
+@pytest.mark.parametrize("params, granularity", [
+    ({}, "week"),
+    ({"start_date": "2024-03-01", "end_date": "2024-03-31"}, "day"),
+    # Only the part inside the data counts
+    ({"start_date": "2024-06-01", "end_date": "2025-12-31"}, "day"),
+    ({"start_date": "2024-03-01", "end_date": "2024-03-31", "granularity": "month"}, "month"),
+])
+def test_brand_health_granularity_follows_the_requested_range(long_df, params, granularity):
+    for topic in TOOL_HANDLERS["brand_health_overview"](long_df, params)["Topics"]:
+        assert topic["DateGranularity"] == granularity
+        dates = [item["Date"] for item in topic["MentionsByDate"]]
+        assert topic["DateRange"]["StartDate"] <= dates[0] and dates[-1] <= topic["DateRange"]["EndDate"]
+
+
+def test_brand_health_counts_mentions_without_date():
+    df = _frame([(i, "https://tiktok.com/a", "Post", 1, 1, 1, 1) for i in range(5)])
+    df.loc[[1, 3], "FormattedDate"] = None
+    (topic,) = TOOL_HANDLERS["brand_health_overview"](df, {})["Topics"]
+    assert topic["MentionsWithoutDate"] == 2
+    assert sum(item["Mention"] for item in topic["MentionsByDate"]) == 3
@@ -0,0 +1,39 @@
+# tests/test_neardup.py
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from functions.neardup import build_near_duplicates
+
+TEMPLATES = [
+    "Shop ơi giao hàng chậm quá, 3 ngày rồi chưa nhận được",
+    "Sản phẩm đẹp lắm, chất lượng tốt, sẽ ủng hộ shop tiếp",
+    "Check inbox giúp em với ạ, em hỏi về size áo",
+]
+
+
+def _comments(n, seed=0):
+    rng = np.random.default_rng(seed)
+    contents = [
+        f"{TEMPLATES[i % len(TEMPLATES)]}{rng.choice(['', ' ạ', '!!', ' nha'])}" if i % 3 else f"bình luận số {i} khác hẳn"
+        for i in range(n)
+    ]
+    return pd.DataFrame({"Content": contents})
+
+
+def test_appends_cluster_like_a_full_build():
+    df = _comments(600)
+    full = build_near_duplicates(df)
+
+    appended = build_near_duplicates(df.iloc[:200])
+    before = appended.cluster_of(appended.hashes)
+    # Saved and loaded between appends: the buckets are rebuilt
+    appended = pickle.loads(pickle.dumps(appended)).add(df, 200)
+    appended.add(df, 400)
+
+    hashes = full.hashes
+    assert (appended.cluster_of(hashes) == full.cluster_of(hashes)).all()
+    assert (appended.cluster_ids[:len(before)] == before).all()
+    assert full.describe()["Clusters"] < full.describe()["DistinctComments"]
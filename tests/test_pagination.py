@@ -0,0 +1,68 @@
+# tests/test_pagination.py
+
+from functions.pagination import PAGE_SIZE, ResultCache, fetch_more_data, paginate_handler
+
+
+def _result(n_labels=60):
+    return [
+        {"Topic": "Brand A", "Label": [
+            {"Value": f"label {i}", "Date": [{"DateofMetions": f"2024-01-{d:02d}", "mentions": d} for d in range(1, 29)]}
+            for i in range(n_labels)
+        ]}
+    ]
+
+
+def _handler(cache, result):
+    return paginate_handler({"get_label_details": lambda params: result}, cache)
+
+
+def _cursors(value):
+    """Every Cursor in a rendered value."""
+    if isinstance(value, dict):
+        found = [value["Cursor"]] if "Cursor" in value else []
+        return found + [c for v in value.values() for c in _cursors(v)]
+    if isinstance(value, list):
+        return [c for v in value for c in _cursors(v)]
+    return []
+
+
+def test_small_results_are_returned_as_they_are():
+    cache = ResultCache()
+    result = _result(n_labels=1)[:1]
+    result[0]["Label"][0]["Date"] = result[0]["Label"][0]["Date"][:2]
+    assert _handler(cache, result)["get_label_details"]({}) == result
+
+
+def test_pages_up_to_the_last():
+    cache = ResultCache()
+    handler = _handler(cache, _result())
+    summary = handler["get_label_details"]({})
+    (brand,) = summary["Summary"]
+    # The summary shows the first page followed by a More item
+    items = brand["Label"]
+    cursor = items.pop()["Cursor"]
+    values = [item["Value"] for item in items]
+    offset = PAGE_SIZE
+    while cursor:
+        page = handler["fetch_more"]({"cursor": cursor})
+        assert page["Tool"] == "get_label_details" and page["Total"] == 60 and page["Offset"] == offset
+        items, cursor = page["Items"], None
+        if "More" in items[-1]:
+            cursor = items.pop()["Cursor"]
+        values += [item["Value"] for item in items]
+        offset += PAGE_SIZE
+    # The last page has no More item, and every label was returned once
+    assert values == [f"label {i}" for i in range(60)]
+
+
+def test_invalid_and_expired_cursors():
+    cache = ResultCache(max_results=1)
+    handler = _handler(cache, _result())
+    first = _cursors(handler["get_label_details"]({}))[0]
+    assert "Error" not in handler["fetch_more"]({"cursor": first})
+
+    for bad in (None, "", "garbage", first.split(".")[0] + ".999", first.split(".")[0] + ".x"):
+        assert "Error" in fetch_more_data({"cursor": bad}, cache)
+    # A newer result pushes the first one out of the cache
+    handler["get_label_details"]({})
+    assert "expired" in handler["fetch_more"]({"cursor": first})["Error"]
@@ -0,0 +1,81 @@
+# tests/test_router.py
+#
+# Which questions go to the fast model and which to the deep model.
+
+import pytest
+
+from functions import router
+from functions.router import ChatRouter, classify_question
+
+from .fakemodel import FakeModel
+
+pytest.importorskip("vertexai")
+
+
+@pytest.mark.parametrize("prompt, reason", [
+    ("How many mentions did Brand A get yesterday?", "lookup"),
+    ("Top posts on TikTok", "lookup"),
+    ("Tổng số thảo luận của Brand B là bao nhiêu?", "lookup"),
+    ("Brand A sentiment", "short question"),
+    ("tiktok engagement for brand C", "short question"),
+])
+def test_lookups_go_to_the_fast_model(prompt, reason):
+    decision = classify_question(prompt)
+    assert decision["route"] == "fast" and decision["reason"].startswith(reason)
+
+
+@pytest.mark.parametrize("prompt, reason", [
+    ("Why did Brand A's mentions drop last week?", "asks for analysis"),
+    ("Which brand should we focus on?", "asks for analysis"),
+    ("Phân tích cảm xúc của khách hàng", "asks for analysis"),
+    ("Write a summary of the conversation", "asks for analysis"),
+    ("How many " + "really " * 30 + "mentions", "long question"),
+    ("List the daily mentions per channel with negative comments", "needs 4 tools"),
+    ("Tell me something interesting about the brands in this file please", "no lookup pattern"),
+])
+def test_analysis_goes_to_the_deep_model(prompt, reason):
+    decision = classify_question(prompt)
+    assert decision["route"] == "deep" and decision["reason"].startswith(reason)
+
+
+def test_keywords_match_whole_words_without_diacritics():
+    assert classify_question("Tại sao?")["route"] == "deep"
+    # 'topics' is 'topic' + s; 'totally' does not contain the word 'total'
+    decision = classify_question("topics totally")
+    assert decision["tools"] == ["get_label_details"] and decision["reason"].startswith("short question")
+
+
+def test_only_offered_tools_count():
+    prompt = "Daily mentions per channel with negative comments"
+    assert classify_question(prompt)["route"] == "deep"
+    decision = classify_question(prompt, ["get_daily_detail", "get_channel_detail"])
+    assert decision["tools"] == ["get_channel_detail", "get_daily_detail"] and decision["route"] == "fast"
+
+
+def test_disabled_routing_sends_everything_deep(monkeypatch):
+    monkeypatch.setattr(router, "ROUTING_ENABLED", False)
+    assert classify_question("How many mentions?")["route"] == "deep"
+
+
+def _router():
+    models = {"fast": FakeModel(latency=0), "deep": FakeModel(latency=0)}
+    return ChatRouter(models, log_path=None), models
+
+
+def test_send_uses_the_routed_model():
+    chat, models = _router()
+    chat.send("How many mentions?", {})
+    assert (models["fast"].calls, models["deep"].calls) == (1, 0)
+    chat.send("Why did mentions drop?", {})
+    assert (models["fast"].calls, models["deep"].calls) == (1, 1)
+    # Both models see the whole conversation
+    assert len(chat.history) == 4
+
+
+def test_cached_lookups_are_answered_with_the_result():
+    chat, models = _router()
+    results = []
+    handler = {"brand_health_overview": lambda params: results.append(params) or {"Mentions": 12}}
+    chat.send("Brand A sentiment", handler, is_cached=lambda name: True)
+    assert results == [{}] and models["fast"].calls == 1
+    assert "Result of brand_health_overview" in chat.history[0]["content"]
@@ -0,0 +1,35 @@
+# tests/test_search.py
+
+import pytest
+
+from functions.dataset import Dataset
+from functions.tools import run_tool
+
+
+@pytest.fixture(scope="module")
+def dataset(make_frame):
+    df, interaction_found, labels1_found = make_frame(rows=2_000, posts=200)
+    return Dataset(df, interaction_found, labels1_found, name="test")
+
+
+def _search(dataset, **params):
+    return run_tool(dataset, "search_mentions", {"query": "giao hàng", **params}, use_cache=False)
+
+
+def test_matches_ignore_case_and_diacritics(dataset):
+    result = _search(dataset)
+    assert result["TotalMatches"] == _search(dataset, query="GIAO HANG")["TotalMatches"] > 0
+    assert sum(result["MentionsByTopic"].values()) == result["TotalMatches"]
+    assert all({"giao", "hàng"} <= set(mention["Content"].split()) for mention in result["Mentions"])
+
+
+@pytest.mark.parametrize("limit, returned", [
+    (None, 20), ("", 20), (5, 5), (5.0, 5), ("abc", 20), (-3, 1), (0, 1), (10_000, 100),
+])
+def test_limit_is_parsed_and_clamped(dataset, limit, returned):
+    assert len(_search(dataset, limit=limit)["Mentions"]) == returned
+
+
+def test_mentions_are_most_recent_first(dataset):
+    dates = [mention["Date"] for mention in _search(dataset, limit=50)["Mentions"]]
+    assert dates == sorted(dates, reverse=True)
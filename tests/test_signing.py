@@ -0,0 +1,118 @@
+# tests/test_signing.py
+#
+# Pickles read back from the dataset store and the disk cache are only
+# unpickled when signed with this installation's key.
+
+import os
+import pickle
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from functions import signing
+from functions.dataset import ARROW_INDEXES_KEY, Dataset, load_arrow, save_arrow
+from functions.diskcache import DiskCache
+
+pytest.importorskip("pyarrow")
+
+
+class Payload:
+    """Unpickling it records the call, as a malicious pickle would run code."""
+
+    loaded = []
+
+    def __reduce__(self):
+        return (Payload.loaded.append, ("unpickled",))
+
+
+@pytest.fixture(autouse=True)
+def key(monkeypatch):
+    monkeypatch.setattr(signing, "SIGNING_KEY", "test-key")
+    Payload.loaded.clear()
+
+
+def test_verify_rejects_unsigned_and_tampered_data():
+    data = signing.sign(b"payload")
+    assert signing.verify(data) == b"payload"
+    for bad in (b"payload", data[:-1] + b"!", b""):
+        with pytest.raises(signing.SignatureError):
+            signing.verify(bad)
+
+
+def test_verify_rejects_another_key(monkeypatch):
+    data = signing.sign(b"payload")
+    monkeypatch.setattr(signing, "SIGNING_KEY", "other-key")
+    with pytest.raises(signing.SignatureError):
+        signing.verify(data)
+
+
+def test_processes_starting_together_share_one_key(tmp_path):
+    path = str(tmp_path / "keys" / "signing.key")
+    with ProcessPoolExecutor(4) as pool:
+        keys = set(pool.map(signing._read_or_create_key_file, [path] * 16))
+    with open(path, "rb") as fh:
+        assert keys == {fh.read()}
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_key_file_is_read_once_its_creator_wrote_it(tmp_path):
+    path = tmp_path / "signing.key"
+    path.write_bytes(b"")
+    writer = threading.Timer(0.1, path.write_bytes, (b"abc\n",))
+    writer.start()
+    assert signing._read_or_create_key_file(str(path)) == b"abc"
+    writer.join()
+
+
+def test_empty_key_file_is_an_error(tmp_path):
+    path = tmp_path / "signing.key"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        signing._read_key_file(str(path), wait=0.05)
+
+
+@pytest.fixture
+def dataset(make_frame):
+    df, interaction_found, labels1_found = make_frame(rows=500, posts=50)
+    dataset = Dataset(df, interaction_found, labels1_found, name="test", dataset_id="test")
+    dataset.index("daily_series")
+    return dataset
+
+
+def test_signed_indexes_are_restored(tmp_path, dataset):
+    path = str(tmp_path / "test.arrow")
+    save_arrow(dataset, path)
+    assert "daily_series" not in load_arrow(path).missing_indexes()
+
+
+def test_unsigned_indexes_are_not_unpickled(tmp_path, dataset):
+    import pyarrow as pa
+
+    saved = str(tmp_path / "saved.arrow")
+    save_arrow(dataset, saved)
+    table = pa.ipc.open_file(pa.memory_map(saved, "r")).read_all()
+    # The same file with a plain pickle in place of the signed indexes
+    path = str(tmp_path / "test.arrow")
+    footer = {ARROW_INDEXES_KEY: pickle.dumps((1, {"daily_series": Payload()}))}
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema, metadata=footer) as writer:
+            writer.write_table(table)
+
+    restored = load_arrow(path)
+    assert Payload.loaded == []
+    assert "daily_series" in restored.missing_indexes()
+
+
+def test_unsigned_cache_entries_are_not_unpickled(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("ab" * 32, {"ok": True})
+    assert cache.get("ab" * 32) == {"ok": True}
+
+    path = cache._path("cd" * 32)
+    cache.put("cd" * 32, None)
+    with open(path, "wb") as fh:
+        fh.write(zlib.compress(pickle.dumps(Payload())))
+    assert cache.get("cd" * 32, "missing") == "missing"
+    assert Payload.loaded == []
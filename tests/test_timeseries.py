@@ -0,0 +1,56 @@
+# tests/test_timeseries.py
+
+import pytest
+
+from functions.timeseries import build_daily_series, compare_periods_data
+
+
+@pytest.fixture(scope="module")
+def df(make_frame):
+    # 90 days of data, 2024-01-01 to 2024-03-30
+    df, _, _ = make_frame(rows=5_000, posts=500)
+    return df
+
+
+@pytest.fixture(scope="module")
+def series(df):
+    return build_daily_series(df)
+
+
+def _compare(df, series, **params):
+    return compare_periods_data(df, params, index=series)
+
+
+def _periods(result):
+    return [(period["StartDate"], period["EndDate"]) for period in (result["Period"], result["ComparePeriod"])]
+
+
+def test_default_is_the_last_week_vs_the_week_before(df, series):
+    result = _compare(df, series)
+    assert _periods(result) == [("2024-03-24", "2024-03-30"), ("2024-03-17", "2024-03-23")]
+    assert sum(t["Mentions"]["Current"] for t in result["Topics"]) == int((df["FormattedDate"].astype(str) >= "2024-03-24").sum())
+
+
+def test_reversed_dates_are_swapped(df, series):
+    result = _compare(df, series, start_date="2024-02-07", end_date="2024-02-01",
+                      compare_start_date="2024-01-31", compare_end_date="2024-01-25")
+    assert _periods(result) == [("2024-02-01", "2024-02-07"), ("2024-01-25", "2024-01-31")]
+
+
+def test_periods_are_cut_to_the_data_range(df, series):
+    result = _compare(df, series, start_date="2024-03-25", end_date="2024-06-30",
+                      compare_start_date="2023-12-01", compare_end_date="2024-01-10")
+    assert _periods(result) == [("2024-03-25", "2024-03-30"), ("2024-01-01", "2024-01-10")]
+
+
+@pytest.mark.parametrize("params", [
+    {"start_date": "2027-01-01"},
+    {"start_date": "2023-01-01", "end_date": "2023-01-31"},
+    {"end_date": "2030-12-31"},
+    # The week before the data starts
+    {"start_date": "2024-01-01", "end_date": "2024-01-07"},
+])
+def test_periods_outside_the_data_are_an_error(df, series, params):
+    result = _compare(df, series, **params)
+    assert "outside the data" in result["Error"]
+    assert result["DataRange"] == {"StartDate": "2024-01-01", "EndDate": "2024-03-30"}